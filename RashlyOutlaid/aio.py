@@ -0,0 +1,658 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Text, Union
+
+try:
+    import aiohttp
+except ImportError:  # optional dependency, pip install RashlyOutlaid[aio]
+    aiohttp = None
+
+import RashlyOutlaid.batcher
+import RashlyOutlaid.iputil
+import RashlyOutlaid.libwhois
+import RashlyOutlaid.metrics
+import RashlyOutlaid.ratelimit
+from RashlyOutlaid.api import (
+    API_URL,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MAX_URL_LENGTH,
+    ASNRecord,
+    MalwareRecord,
+    _batches,
+    _endpoint,
+    _fan_out,
+    _index,
+    _ip_keys,
+    _malware_keys,
+    _map_compact_model,
+    _map_lazy_malware_model,
+    _map_malware_model,
+    _map_shadowserver_model,
+    _normalize_hash,
+    _normalize_ip,
+    _unique,
+)
+
+# Number of batches gather_* runs concurrently unless told otherwise
+DEFAULT_CONCURRENCY = 4
+
+# Number of whois sessions AsyncASNWhois runs concurrently unless told
+# otherwise
+DEFAULT_WHOIS_CONCURRENCY = RashlyOutlaid.libwhois.MAX_CONNECTIONS
+
+
+class AsyncClient:
+    """asyncio client for the Shadowserver web api
+
+    The asyncio counterpart of RashlyOutlaid.api.Client. Lookups share a
+    pooled aiohttp session with at most pool_size connections and take their
+    tokens from the same rate limiter as the blocking client, so mixing both
+    keeps the process within the Shadowserver limit. Like the blocking
+    client, duplicate queries are only looked up once, compact=True
+    returns shared CompactASNRecords and lazy_av=True defers creating the
+    AVRecords of malware results.
+
+    Keyword arguments not consumed by the client are passed on to
+    aiohttp.ClientSession.get (proxy, timeout, ...) for every request and can
+    be overridden per call:
+
+    async with aio.AsyncClient(proxy="http://myproxy.example.com:8080") as client:
+        await client.origin(["8.8.8.8"])
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        keep_alive: bool = True,
+        base_url: Text = API_URL,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_url_length: int = DEFAULT_MAX_URL_LENGTH,
+        rate_limiter: Optional[
+            RashlyOutlaid.ratelimit.RateLimiter
+        ] = RashlyOutlaid.ratelimit.default_limiter,
+        compact: bool = False,
+        lazy_av: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> None:
+        if aiohttp is None:
+            raise ImportError(
+                "RashlyOutlaid.aio requires aiohttp: pip install RashlyOutlaid[aio]"
+            )
+
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_url_length = max_url_length
+        self.rate_limiter = rate_limiter
+        self.kwargs_aiohttp = kwargs_aiohttp
+        self._asn_model: Callable[[List[Dict]], List] = (
+            _map_compact_model if compact else _map_shadowserver_model
+        )
+        self._malware_model: Callable[[List[Dict]], List[MalwareRecord]] = (
+            _map_lazy_malware_model if lazy_av else _map_malware_model
+        )
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    async def __aenter__(self) -> "AsyncClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close all pooled connections"""
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        """The pooled session, created on first use inside the running loop"""
+
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size, force_close=not self.keep_alive
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _get(self, url: Text, error: Text, **kwargs_aiohttp: Any) -> Any:
+        """Perform a GET request through the pooled session and decode the json
+        result. Raise QueryError (prefixed with error) on non-200 responses"""
+
+        if self.rate_limiter is not None:
+            delay = self.rate_limiter.reserve()
+            if delay > 0:
+                if RashlyOutlaid.metrics.observers:
+                    RashlyOutlaid.metrics.rate_limit_wait(delay)
+                await asyncio.sleep(delay)
+
+        observed = RashlyOutlaid.metrics.observers
+        started = time.perf_counter() if observed else 0.0
+        async with self.session.get(
+            url, **{**self.kwargs_aiohttp, **kwargs_aiohttp}
+        ) as res:
+            if observed:
+                body = await res.read()
+                RashlyOutlaid.metrics.request(
+                    _endpoint(url),
+                    str(res.status),
+                    time.perf_counter() - started,
+                    len(url),
+                    len(body),
+                )
+            if res.status != 200:
+                msg = f"{error}. Got status='{res.status}' while requesting '{url}'"
+                raise RashlyOutlaid.libwhois.QueryError(msg)
+
+            return await res.json(content_type=None)
+
+    async def _bulk(
+        self,
+        url: Text,
+        queries: List[Text],
+        error: Text,
+        batch_size: Optional[int] = None,
+        concurrency: int = 1,
+        **kwargs_aiohttp: Any,
+    ) -> List[Dict]:
+        """Perform the bulk lookup of queries against url (ending with the
+        name of the query parameter) in batches, running at most concurrency
+        batches at the time, and merge the results in order.
+
+        error is formatted with the queries of a failing batch."""
+
+        if concurrency < 1:
+            raise ValueError(
+                f"concurrency must be a positive integer, got {concurrency}"
+            )
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run(batch: List[Text]) -> List[Dict]:
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.batch(_endpoint(url), len(batch))
+            async with semaphore:
+                return await self._get(
+                    f"{url}{','.join(batch)}", error.format(batch), **kwargs_aiohttp
+                )
+
+        results = await asyncio.gather(
+            *[
+                run(batch)
+                for batch in _batches(
+                    queries,
+                    batch_size or self.batch_size,
+                    self.max_url_length - len(url),
+                )
+            ]
+        )
+        return [elem for result in results for elem in result]
+
+    async def malware(
+        self,
+        hashes: List[Text],
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+        """Lookup the list of hashes using the Shadowserver malware API"""
+
+        return await self.gather_malware(
+            hashes, 1, batch_size, as_dict, **kwargs_aiohttp
+        )
+
+    async def origin(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the list of ip addresses vs the Shadowserver origin web api"""
+
+        return await self.gather_origin(
+            ip_addresses, 1, batch_size, as_dict, **kwargs_aiohttp
+        )
+
+    async def peer(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the list of ip addresses vs the Shadowserver peer web api"""
+
+        return await self.gather_peer(
+            ip_addresses, 1, batch_size, as_dict, **kwargs_aiohttp
+        )
+
+    async def asn(self, asnumber: int, **kwargs_aiohttp: Any) -> List[ASNRecord]:
+        """Lookup the asn via the Shadowserver asn web api"""
+
+        url = f"{self.base_url}/net/asn" f"?query={asnumber}"
+
+        ss_data: List[Dict] = [
+            await self._get(
+                url,
+                f"RashlyOutlaid.aio.asn could not lookup asn {asnumber}",
+                **kwargs_aiohttp,
+            )
+        ]
+        return self._asn_model(ss_data)
+
+    async def prefix(self, asnumber: int, **kwargs_aiohttp: Any) -> List[Text]:
+        """Lookup the announced prefixes of the asn vs the Shadowserver prefix
+        web api"""
+
+        url = f"{self.base_url}/net/asn" f"?prefix={asnumber}"
+
+        ss_data: List[Text] = await self._get(
+            url,
+            f"RashlyOutlaid.aio.prefix could not lookup asn {asnumber}",
+            **kwargs_aiohttp,
+        )
+        return ss_data
+
+    async def gather_malware(
+        self,
+        hashes: List[Text],
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+        """Lookup the hashes in batches, running at most concurrency batches at
+        the time. The results are returned in the order of the input."""
+
+        keys = [_normalize_hash(h) for h in hashes]
+        ss_data = await self._bulk(
+            f"{self.base_url}/malware/info?sample=",
+            _unique(keys),
+            "RashlyOutlaid.aio.malware could not lookup {}",
+            batch_size,
+            concurrency,
+            **kwargs_aiohttp,
+        )
+        found = _index(
+            ss_data, self._malware_model, _malware_keys, _unique(keys)
+        )
+        return _fan_out(hashes, keys, found, as_dict)
+
+    async def gather_origin(
+        self,
+        ip_addresses: List,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the origin of the ip addresses in batches, running at most
+        concurrency batches at the time. The results are returned in the order
+        of the input."""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        ss_data = await self._bulk(
+            f"{self.base_url}/net/asn?origin=",
+            _unique(keys),
+            "RashlyOutlaid.aio.origin could not lookup origin of {}",
+            batch_size,
+            concurrency,
+            **kwargs_aiohttp,
+        )
+        found = _index(ss_data, self._asn_model, _ip_keys, _unique(keys))
+        return _fan_out(ip_addresses, keys, found, as_dict)
+
+    async def gather_peer(
+        self,
+        ip_addresses: List,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_aiohttp: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the peers of the ip addresses in batches, running at most
+        concurrency batches at the time. The results are returned in the order
+        of the input."""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        ss_data = await self._bulk(
+            f"{self.base_url}/net/asn?peer=",
+            _unique(keys),
+            "RashlyOutlaid.aio.peer could not lookup peers of {}",
+            batch_size,
+            concurrency,
+            **kwargs_aiohttp,
+        )
+        found = _index(ss_data, self._asn_model, _ip_keys, _unique(keys))
+        return _fan_out(ip_addresses, keys, found, as_dict)
+
+
+    def origin_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_aiohttp: Any,
+    ) -> RashlyOutlaid.batcher.AsyncBatcher:
+        """An AsyncBatcher combining single ip address origin lookups of many
+        coroutines into bulk requests"""
+
+        return RashlyOutlaid.batcher.AsyncBatcher(
+            lambda keys: self.origin(keys, as_dict=True, **kwargs_aiohttp),
+            window,
+            max_keys,
+            _normalize_ip,
+        )
+
+    def peer_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_aiohttp: Any,
+    ) -> RashlyOutlaid.batcher.AsyncBatcher:
+        """An AsyncBatcher combining single ip address peer lookups of many
+        coroutines into bulk requests"""
+
+        return RashlyOutlaid.batcher.AsyncBatcher(
+            lambda keys: self.peer(keys, as_dict=True, **kwargs_aiohttp),
+            window,
+            max_keys,
+            _normalize_ip,
+        )
+
+    def malware_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_aiohttp: Any,
+    ) -> RashlyOutlaid.batcher.AsyncBatcher:
+        """An AsyncBatcher combining single hash lookups of many coroutines
+        into bulk requests"""
+
+        return RashlyOutlaid.batcher.AsyncBatcher(
+            lambda keys: self.malware(keys, as_dict=True, **kwargs_aiohttp),
+            window,
+            max_keys,
+            _normalize_hash,
+        )
+
+
+class AsyncASNWhois:
+    """asyncio client for the asn.shadowserver.org whois service
+
+    The asyncio counterpart of RashlyOutlaid.libwhois.ASNWhois. A single ip
+    address is looked up with the single query protocol ("origin x"), a list
+    with a bulk "begin origin" ... "end" block. Results are returned as a
+    {query: ASNRecord} dict with the same (libwhois) ASNRecord layout as
+    ASNWhois.result.
+
+    At most concurrency sessions run at the time, each limited to timeout
+    seconds. Does not require aiohttp, so whois and web api lookups can be
+    mixed in one event loop:
+
+    whois = aio.AsyncASNWhois()
+    result = await whois.peer(["212.58.246.94", "94.229.76.35"])
+    """
+
+    def __init__(
+        self,
+        address: Text = "asn.shadowserver.org",
+        port: int = 43,
+        timeout: float = 30,
+        concurrency: int = DEFAULT_WHOIS_CONCURRENCY,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError(
+                f"concurrency must be a positive integer, got {concurrency}"
+            )
+
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.concurrency = concurrency
+        # one per event loop, a semaphore is bound to the loop it is used in
+        self._semaphores: "weakref.WeakKeyDictionary[Any, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def origin(
+        self, query: Union[Text, List[Text]]
+    ) -> Dict[Text, RashlyOutlaid.libwhois.ASNRecord]:
+        """Lookup the origin of an ip address or a list of ip addresses"""
+
+        return await self.query(query, peers=False)
+
+    async def peer(
+        self, query: Union[Text, List[Text]]
+    ) -> Dict[Text, RashlyOutlaid.libwhois.ASNRecord]:
+        """Lookup the origin and peers of an ip address or a list of ip
+        addresses"""
+
+        return await self.query(query, peers=True)
+
+    async def query(
+        self, query: Union[Text, List[Text]], peers: bool = False
+    ) -> Dict[Text, RashlyOutlaid.libwhois.ASNRecord]:
+        """Perform a single (query is a string) or bulk (query is a list)
+        whois session"""
+
+        multiple = isinstance(query, list)
+        queries = query if multiple else [query]
+        if not queries:
+            raise RashlyOutlaid.libwhois.QueryError("Trying to perform empty query")
+        for elem in queries:
+            if not RashlyOutlaid.libwhois.is_ip(elem):
+                raise RashlyOutlaid.libwhois.QueryError(f"Not an IPv4 address {elem}")
+
+        kind = "peer" if peers else "origin"
+        if multiple:
+            lines = [f"begin {kind}", *queries, "end"]
+        else:
+            lines = [f"{kind} {query}"]
+
+        loop = asyncio.get_event_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+
+        observed = RashlyOutlaid.metrics.observers
+        if observed:
+            RashlyOutlaid.metrics.batch(f"whois_{kind}", len(queries))
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(self._session(lines), self.timeout)
+            except asyncio.TimeoutError:
+                if observed:
+                    RashlyOutlaid.metrics.request(
+                        f"whois_{kind}",
+                        "error",
+                        time.perf_counter() - started,
+                        sum(len(line) + 1 for line in lines),
+                        0,
+                    )
+                raise RashlyOutlaid.libwhois.QueryError(
+                    f"RashlyOutlaid.aio.AsyncASNWhois timed out after "
+                    f"{self.timeout}s querying {self.address}:{self.port}"
+                )
+            if observed:
+                RashlyOutlaid.metrics.request(
+                    f"whois_{kind}",
+                    "ok",
+                    time.perf_counter() - started,
+                    sum(len(line) + 1 for line in lines),
+                    sum(len(line.encode("utf-8")) for line in response),
+                )
+
+        base_idx = RashlyOutlaid.libwhois.base_index(multiple, peers)
+        result: Dict[Text, RashlyOutlaid.libwhois.ASNRecord] = {}
+        for line in response:
+            parsed = RashlyOutlaid.libwhois.parse_line(
+                line, base_idx, peers, multiple, query
+            )
+            if parsed is not None:
+                result[parsed[0]] = parsed[1]
+        return result
+
+    async def _session(self, lines: List[Text]) -> List[Text]:
+        """Send lines and read the response until the server closes the
+        connection"""
+
+        reader, writer = await asyncio.open_connection(self.address, self.port)
+        try:
+            writer.write("".join(f"{line}\n" for line in lines).encode("utf-8"))
+            await writer.drain()
+            response = []
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return response
+                response.append(line.decode("utf-8", "ignore"))
+        finally:
+            writer.close()
+
+
+_default_clients: Dict[asyncio.AbstractEventLoop, AsyncClient] = {}
+
+def default_client() -> AsyncClient:
+    """Return the shared client of the running event loop used by the module
+    level lookup coroutines. Close it with aclose() before the loop ends."""
+
+    loop = asyncio.get_event_loop()
+    client = _default_clients.get(loop)
+    if client is None:
+        for stale in [other for other in _default_clients if other.is_closed()]:
+            del _default_clients[stale]
+        client = _default_clients[loop] = AsyncClient()
+    return client
+
+
+async def aclose() -> None:
+    """Close the shared client of the running event loop, if any. The next
+    module level lookup in the loop starts a new one."""
+
+    client = _default_clients.pop(asyncio.get_event_loop(), None)
+    if client is not None:
+        await client.close()
+
+
+async def malware(
+    hashes: List[Text],
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+    """Lookup the list of hashes using the Shadowserver malware API"""
+
+    return await default_client().malware(
+        hashes, batch_size, as_dict, **kwargs_aiohttp
+    )
+
+
+async def origin(
+    ip_addresses: List,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+    """Lookup the list of ip addresses vs the Shadowserver origin web api"""
+
+    return await default_client().origin(
+        ip_addresses, batch_size, as_dict, **kwargs_aiohttp
+    )
+
+
+async def peer(
+    ip_addresses: List,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+    """Lookup the list of ip addresses vs the Shadowserver peer web api"""
+
+    return await default_client().peer(
+        ip_addresses, batch_size, as_dict, **kwargs_aiohttp
+    )
+
+
+async def asn(asnumber: int, **kwargs_aiohttp: Any) -> List[ASNRecord]:
+    """Lookup the asn via the Shadowserver asn web api"""
+
+    return await default_client().asn(asnumber, **kwargs_aiohttp)
+
+
+async def prefix(asnumber: int, **kwargs_aiohttp: Any) -> List[Text]:
+    """Lookup the announced prefixes of the asn via the Shadowserver prefix
+    web api"""
+
+    return await default_client().prefix(asnumber, **kwargs_aiohttp)
+
+
+async def gather_malware(
+    hashes: List[Text],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+    """Lookup the hashes in batches, running at most concurrency batches at
+    the time"""
+
+    return await default_client().gather_malware(
+        hashes, concurrency, batch_size, as_dict, **kwargs_aiohttp
+    )
+
+
+async def gather_origin(
+    ip_addresses: List,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+    """Lookup the origin of the ip addresses in batches, running at most
+    concurrency batches at the time"""
+
+    return await default_client().gather_origin(
+        ip_addresses, concurrency, batch_size, as_dict, **kwargs_aiohttp
+    )
+
+
+async def gather_peer(
+    ip_addresses: List,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_aiohttp: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+    """Lookup the peers of the ip addresses in batches, running at most
+    concurrency batches at the time"""
+
+    return await default_client().gather_peer(
+        ip_addresses, concurrency, batch_size, as_dict, **kwargs_aiohttp
+    )
@@ -19,14 +19,46 @@ furnished to do so, subject to the following conditions:
     DEALINGS IN THE SOFTWARE.
 """
 
+import collections
+import concurrent.futures
 import datetime
-from dataclasses import dataclass
-from typing import Any, Dict, Iterator, List, Optional, Text, Tuple
+import functools
+import itertools
+import logging
+import re
+import sys
+import threading
+import time
+import weakref
+from dataclasses import FrozenInstanceError, dataclass, field
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Sequence,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Text,
+    Tuple,
+    Union,
+)
 
 import requests
+import requests.adapters
 
 import RashlyOutlaid
+import RashlyOutlaid.batcher
+import RashlyOutlaid.cache
+import RashlyOutlaid.columnar
+import RashlyOutlaid.iputil
 import RashlyOutlaid.libwhois
+import RashlyOutlaid.metrics
+import RashlyOutlaid.prefixcache
+import RashlyOutlaid.ratelimit
+import RashlyOutlaid.resilience
+import RashlyOutlaid.singleflight
 
 
 @dataclass
@@ -51,6 +83,121 @@ class ASNRecord:
         yield from self.astuple()
 
 
+class CompactASNRecord:
+    """Compact, immutable ASNRecord for keeping millions of results in memory
+
+    Has the same attributes and the same astuple()/__iter__ behaviour as
+    ASNRecord and compares equal to an ASNRecord with the same fields. The
+    record is slotted, the string fields are interned and the peers are
+    stored as a shared tuple of ints (peers still returns a list of str).
+    Create records with compact_record, which returns one shared object for
+    every identical record (such as all ip addresses within one prefix).
+    """
+
+    __slots__ = ("asn", "prefix", "asname", "cn", "isp", "_peers", "__weakref__")
+
+    asn: str
+    prefix: str
+    asname: str
+    cn: str
+    isp: str
+
+    def __init__(
+        self, asn: str, prefix: str, asname: str, cn: str, isp: str, peers: Tuple
+    ) -> None:
+        object.__setattr__(self, "asn", asn)
+        object.__setattr__(self, "prefix", prefix)
+        object.__setattr__(self, "asname", asname)
+        object.__setattr__(self, "cn", cn)
+        object.__setattr__(self, "isp", isp)
+        object.__setattr__(self, "_peers", peers)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise FrozenInstanceError(f"cannot assign to field '{name}'")
+
+    def __delattr__(self, name: str) -> None:
+        raise FrozenInstanceError(f"cannot delete field '{name}'")
+
+    @property
+    def peers(self) -> List[str]:
+        """the peers as a list of str, like ASNRecord.peers"""
+
+        return [str(peer) for peer in self._peers]
+
+    def astuple(self) -> Tuple:
+        """return the fields as a tuple"""
+
+        return (self.asn, self.prefix, self.asname, self.cn, self.isp, self.peers)
+
+    def __iter__(self) -> Iterator:
+        """iterate over the tuple"""
+
+        yield from self.astuple()
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (ASNRecord, CompactASNRecord)):
+            return self.astuple() == other.astuple()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash((self.asn, self.prefix, self.asname, self.cn, self.isp, self._peers))
+
+    def __repr__(self) -> str:
+        return (
+            f"CompactASNRecord(asn={self.asn!r}, prefix={self.prefix!r}, "
+            f"asname={self.asname!r}, cn={self.cn!r}, isp={self.isp!r}, "
+            f"peers={self.peers!r})"
+        )
+
+    def __reduce__(self) -> Tuple:
+        return (compact_record, self.astuple())
+
+
+# Number of distinct peer tuples shared by compact records before the table
+# is started afresh. Records keep the tuples they already share.
+INTERNED_PEERS_SIZE = 65536
+
+_interned_peers: Dict[Tuple, Tuple] = {}
+_interned_records: "weakref.WeakValueDictionary[Tuple, CompactASNRecord]" = (
+    weakref.WeakValueDictionary()
+)
+
+# Peers stored as ints: ASCII digits without leading zeros, which str(int())
+# gives back unchanged (str.isdigit also accepts characters int() rejects)
+_DIGITS = re.compile("0|[1-9][0-9]*")
+
+
+def _intern_peers(peers: List[str]) -> Tuple:
+    """Shared tuple of the peers, as ints where possible"""
+
+    key = tuple(
+        int(peer) if _DIGITS.fullmatch(peer) else sys.intern(peer) for peer in peers
+    )
+    if len(_interned_peers) >= INTERNED_PEERS_SIZE:
+        _interned_peers.clear()
+    return _interned_peers.setdefault(key, key)
+
+
+def compact_record(
+    asn: str, prefix: str, asname: str, cn: str, isp: str, peers: List[str]
+) -> CompactASNRecord:
+    """Return the shared CompactASNRecord with these fields"""
+
+    key = (
+        sys.intern(asn or ""),
+        sys.intern(prefix or ""),
+        sys.intern(asname or ""),
+        sys.intern(cn or ""),
+        sys.intern(isp or ""),
+        _intern_peers(peers),
+    )
+    record = _interned_records.get(key)
+    if record is None:
+        record = CompactASNRecord(*key)
+        _interned_records[key] = record
+    return record
+
+
 @dataclass
 class AVRecord:
     """Dataclass continating the AVRecord"""
@@ -87,7 +234,7 @@ class MalwareRecord:
     filesize: str
     adobe_malware_classifier: str
     magic: str
-    anti_virus: List[AVRecord]
+    anti_virus: Sequence[AVRecord]
 
     def astuple(self) -> Tuple:
         """return the fields as a tuple"""
@@ -116,74 +263,352 @@ class MalwareRecord:
         yield from self.astuple()
 
 
+class LazyAVList(Sequence):
+    """Read only list of AVRecords that keeps the raw anti_virus entries from
+    shadowserver and only creates the AVRecords (and parses their
+    timestamps) the first time an element is accessed"""
+
+    __slots__ = ("_raw", "_records")
+
+    def __init__(self, raw: List[Dict]) -> None:
+        self._raw: Optional[List[Dict]] = raw
+        self._records: List[AVRecord] = []
+
+    def _materialize(self) -> List[AVRecord]:
+        """the AVRecords, created on first use"""
+
+        # read _raw once, another thread may materialize the list meanwhile
+        raw = self._raw
+        if raw is None:
+            return self._records
+        records = self._records = _map_av_model(raw)
+        self._raw = None
+        return records
+
+    def __getitem__(self, index: Any) -> Any:
+        return self._materialize()[index]
+
+    def __len__(self) -> int:
+        raw = self._raw
+        if raw is not None:
+            return len(raw)
+        return len(self._records)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (list, LazyAVList)):
+            return self._materialize() == list(other)
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self._materialize())
+
+
+@dataclass
+class BatchError:
+    """A batch of a bulk lookup that failed"""
+
+    queries: List[Text]
+    error: Exception
+
+
+@dataclass
+class BulkResult:
+    """Result of a bulk lookup. records holds the results of the successful
+    batches in input order, errors the batches (of normalized queries) that
+    failed and invalid the queries that were not valid ip addresses and
+    never sent"""
+
+    records: List[Union[ASNRecord, MalwareRecord]] = field(default_factory=list)
+    errors: List[BatchError] = field(default_factory=list)
+    invalid: List[Text] = field(default_factory=list)
+
+    @property
+    def failed(self) -> List[Text]:
+        """the queries of all failed batches"""
+
+        return [query for error in self.errors for query in error.queries]
+
+    @property
+    def ok(self) -> bool:
+        """True if all batches succeeded"""
+
+        return not self.errors
+
+
+# Number of distinct timestamps remembered by parse_shadowserver_time. A bulk
+# malware response repeats the same few AV scan times over and over.
+TIME_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=TIME_CACHE_SIZE)
+def _parse_time(time_string: Text) -> datetime.datetime:
+    """Parse the first 19 characters of a shadowserver time, slicing the
+    fields of the fixed 'YYYY-MM-DD HH:MM:SS' layout and only falling back to
+    strptime if the string is laid out differently"""
+
+    if (
+        len(time_string) == 19
+        and time_string[4] == "-"
+        and time_string[7] == "-"
+        and time_string[10] == " "
+        and time_string[13] == ":"
+        and time_string[16] == ":"
+    ):
+        digits = (
+            time_string[0:4]
+            + time_string[5:7]
+            + time_string[8:10]
+            + time_string[11:13]
+            + time_string[14:16]
+            + time_string[17:19]
+        )
+        # int() takes the same (unicode decimal) digits strptime does
+        if digits.isdecimal():
+            return datetime.datetime(
+                int(digits[0:4]),
+                int(digits[4:6]),
+                int(digits[6:8]),
+                int(digits[8:10]),
+                int(digits[10:12]),
+                int(digits[12:14]),
+            )
+
+    return datetime.datetime.strptime(time_string, "%Y-%m-%d %H:%M:%S")
+
+
 def parse_shadowserver_time(time_string: Text) -> Optional[datetime.datetime]:
-    """Parse a date on the format '2018-10-17 20:36:23'"""
+    """Parse a date on the format '2018-10-17 20:36:23'. Raises ValueError
+    if the string is not on this format."""
 
     if not time_string:
         return None
 
-    try:
-        return datetime.datetime.strptime(time_string[:19], "%Y-%m-%d %H:%M:%S")
-    except:
-        print(time_string)
-        raise
+    return _parse_time(time_string[:19])
 
 
-def malware(hashes: List[Text], **kwargs_requests: Any) -> List[MalwareRecord]:
-    """Lookup the list of hashes using the Shadowserver malware API
+logger = logging.getLogger(__name__)
 
-    You can pass arguments to requests suchs as proxies:
+API_URL = "https://api.shadowserver.org"
 
-    api.malware(["4b21f25e02b0d1df86ab745f82e140ab1cc498af"],
-                proxies={'http': 'http://myproxy.example.com:8080',
-                         'https': 'http://myproxy.example.com:8080'
-                        })
+# Bulk lookups (origin, peer, malware) are split into batches of at most
+# DEFAULT_BATCH_SIZE queries and DEFAULT_MAX_URL_LENGTH characters of url
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_URL_LENGTH = 8000
 
-    https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
-    """
+# Number of threads running the batches of bulk_origin, bulk_peer and
+# bulk_malware unless told otherwise
+DEFAULT_WORKERS = 8
 
-    url = f"https://api.shadowserver.org/malware/info" f'?sample={",".join(hashes)}'
 
-    res = requests.get(url, **kwargs_requests)
+# Query parameters of the web api and the endpoints they are reported as to
+# RashlyOutlaid.metrics observers
+_ENDPOINTS = {
+    "origin": "origin",
+    "peer": "peer",
+    "sample": "malware",
+    "query": "asn",
+    "prefix": "prefix",
+}
+
+
+def _endpoint(url: Text) -> Text:
+    """The name of the endpoint requested by url"""
+
+    parameter = url.rpartition("?")[2].partition("=")[0]
+    return _ENDPOINTS.get(parameter, parameter)
+
+
+def _cap_timeout(timeout: Any, remaining: float) -> Any:
+    """Limit a requests timeout (seconds or a (connect, read) tuple) to the
+    remaining seconds of a deadline"""
+
+    if isinstance(timeout, tuple):
+        return tuple(_cap_timeout(t, remaining) for t in timeout)
+    if timeout is None:
+        return remaining
+    return min(timeout, remaining)
+
+
+def _batches(
+    queries: List[Text], batch_size: int, max_length: int
+) -> Iterator[List[Text]]:
+    """Split queries into consecutive batches of at most batch_size elements
+    where the comma separated batch is at most max_length characters long.
+
+    A single query longer than max_length is sent in a batch of its own."""
+
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+
+    batch: List[Text] = []
+    length = 0
+    for query in queries:
+        # +1 for the separating comma
+        query_length = len(query) + (1 if batch else 0)
+        if batch and (len(batch) >= batch_size or length + query_length > max_length):
+            yield batch
+            batch = []
+            length = 0
+            query_length = len(query)
+        batch.append(query)
+        length += query_length
+    if batch:
+        yield batch
 
-    if res.status_code != 200:
-        msg = (
-            f"RashlyOutlaid.api.malware could not lookup {hashes}. "
-            f"Got status='{res.status_code}' while requesting '{url}'"
-        )
-        raise RashlyOutlaid.libwhois.QueryError(msg)
 
-    ss_data: Dict = res.json()
+def _normalize_ip(ip_address: Text) -> Optional[Text]:
+    """Canonical text form of ip_address ('2001:DB8:0::1' -> '2001:db8::1'),
+    None for invalid addresses"""
+
+    return RashlyOutlaid.iputil.normalize(ip_address)
+
+
+def _normalize_hash(sample_hash: Text) -> Text:
+    """Canonical (lower case) form of a md5/sha1/sha256 hash"""
+
+    return sample_hash.strip().lower()
+
+
+def _ip_keys(elem: Dict) -> List[Text]:
+    """The normalized ip address a result from the asn web api answers"""
+
+    key = _normalize_ip(elem.get("ip") or "")
+    return [key] if key else []
+
+
+def _malware_keys(elem: Dict) -> List[Text]:
+    """The normalized hashes a result from the malware web api answers"""
+
     return [
-        MalwareRecord(
-            parse_shadowserver_time(elem.get("timestamp", "")),
-            parse_shadowserver_time(elem.get("first_seen", "")),
-            parse_shadowserver_time(elem.get("last_seen", "")),
-            elem.get("type"),
-            elem.get("sha256"),
-            elem.get("md5"),
-            elem.get("sha1"),
-            elem.get("pehash"),
-            elem.get("tlsh"),
-            elem.get("import_hash"),
-            elem.get("entropic"),
-            elem.get("filesize"),
-            elem.get("adobe_malware_classifier"),
-            elem.get("magic"),
-            [
-                AVRecord(
-                    x.get("md5"),
-                    x.get("vendor"),
-                    x.get("signature"),
-                    parse_shadowserver_time(x.get("timestamp", "")),
-                )
-                for x in elem["anti_virus"]
-            ],
+        _normalize_hash(elem[name])
+        for name in RashlyOutlaid.cache.MALWARE_HASHES
+        if elem.get(name)
+    ]
+
+
+def _chunked(queries: Iterable[Text], size: int) -> Iterator[List[Text]]:
+    """Lazily split an iterable of queries into lists of at most size
+    queries"""
+
+    if size < 1:
+        raise ValueError(f"batch_size must be a positive integer, got {size}")
+
+    iterator = iter(queries)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _unique(keys: List[Optional[Text]]) -> List[Text]:
+    """keys without duplicates and invalid (None) keys, in order of first
+    occurrence"""
+
+    return list(dict.fromkeys(key for key in keys if key is not None))
+
+
+def _index(
+    ss_data: List[Dict],
+    mapper: Callable[[List[Dict]], List],
+    keys_of: Callable[[Dict], List[Text]],
+    queries: List[Text],
+) -> Dict[Text, Any]:
+    """Map the result from shadowserver with mapper and index the records by
+    the (normalized) queries they answer.
+
+    Records that do not name one of the queries (no ip, or an ip that does
+    not normalize back to a query) answer the unanswered queries in order
+    when there are as many of both, like the responses used to be read.
+    Otherwise they are dropped with a warning."""
+
+    wanted = set(queries)
+    found: Dict[Text, Any] = {}
+    unmatched: List[Any] = []
+    for elem, record in zip(ss_data, mapper(ss_data)):
+        keys = keys_of(elem)
+        for key in keys:
+            found[key] = record
+        if not wanted.intersection(keys):
+            unmatched.append(record)
+
+    if unmatched:
+        unanswered = [query for query in queries if query not in found]
+        if len(unanswered) == len(unmatched):
+            found.update(zip(unanswered, unmatched))
+        else:
+            logger.warning(
+                "dropped %d results not matching any of the queries %s",
+                len(unmatched),
+                unanswered,
+            )
+    return found
+
+
+def _fan_out(
+    queries: List[Text],
+    keys: List[Optional[Text]],
+    found: Dict[Text, Any],
+    as_dict: bool,
+) -> Union[List, Dict[Text, Any]]:
+    """Expand the records found for the unique keys back to the queries of
+    the caller, either as a list in input order (including duplicates) or
+    as a {query: record} dict. Queries without a result are left out."""
+
+    if as_dict:
+        return {query: found[key] for query, key in zip(queries, keys) if key in found}
+    return [found[key] for key in keys if key in found]
+
+
+def _map_av_model(anti_virus: List[Dict]) -> List[AVRecord]:
+    """Map the anti_virus entries of a malware sample to AVRecords"""
+
+    return [
+        AVRecord(
+            x.get("md5"),
+            x.get("vendor"),
+            x.get("signature"),
+            parse_shadowserver_time(x.get("timestamp", "")),
         )
-        for elem in ss_data
+        for x in anti_virus
     ]
 
 
+def _malware_record(elem: Dict, anti_virus: Sequence[AVRecord]) -> MalwareRecord:
+    """Map one sample from shadowserver to a MalwareRecord"""
+
+    return MalwareRecord(
+        parse_shadowserver_time(elem.get("timestamp", "")),
+        parse_shadowserver_time(elem.get("first_seen", "")),
+        parse_shadowserver_time(elem.get("last_seen", "")),
+        elem.get("type"),
+        elem.get("sha256"),
+        elem.get("md5"),
+        elem.get("sha1"),
+        elem.get("pehash"),
+        elem.get("tlsh"),
+        elem.get("import_hash"),
+        elem.get("entropic"),
+        elem.get("filesize"),
+        elem.get("adobe_malware_classifier"),
+        elem.get("magic"),
+        anti_virus,
+    )
+
+
+def _map_malware_model(ssdata: List[Dict]) -> List[MalwareRecord]:
+    """Map the result from shadowserver to a list of MalwareRecords"""
+
+    return [_malware_record(elem, _map_av_model(elem["anti_virus"])) for elem in ssdata]
+
+
+def _map_lazy_malware_model(ssdata: List[Dict]) -> List[MalwareRecord]:
+    """Map the result from shadowserver to a list of MalwareRecords where
+    anti_virus is a LazyAVList"""
+
+    return [_malware_record(elem, LazyAVList(elem["anti_virus"])) for elem in ssdata]
+
+
 def _map_shadowserver_model(ssdata: List[Dict]) -> List[ASNRecord]:
     """Map the result from shadowserver to a list of ASNRecords"""
 
@@ -200,38 +625,1031 @@ def _map_shadowserver_model(ssdata: List[Dict]) -> List[ASNRecord]:
     ]
 
 
-def origin(ip_addresses: List, **kwargs_requests: Any) -> List[ASNRecord]:
-    """Lookup the list of ip addresses vs the Shadowserver origin web api
-    https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
+def _map_compact_model(ssdata: List[Dict]) -> List[CompactASNRecord]:
+    """Map the result from shadowserver to a list of shared CompactASNRecords"""
+
+    return [
+        compact_record(
+            x.get("asn", ""),
+            x.get("prefix", ""),
+            x.get("asname_short", ""),
+            x.get("geo", ""),
+            x.get("asname_long", ""),
+            x.get("peer", "").split(),
+        )
+        for x in ssdata
+    ]
+
+
+class Client:
+    """Reusable client for the Shadowserver web api
+
+    The client owns a pooled requests.Session, so consecutive lookups reuse
+    the same keep-alive connections to api.shadowserver.org instead of paying
+    for a new TCP and TLS handshake on every call.
+
+    Bulk lookups (origin, peer, malware) are split into batches of at most
+    batch_size queries and max_url_length characters of url. The batches are
+    performed in order and the results merged, keeping the order of the
+    input. batch_size can also be overridden per call.
+
+    Queries are normalized (canonical IPv4/IPv6 addresses, lower case
+    hashes) and each unique query is only looked up once. Invalid ip
+    addresses are dropped before the request is made. The results are expanded back
+    to the queries of the caller, either as a list in input order (including
+    duplicates) or, with as_dict=True, as a {query: record} dict.
+
+    Every request takes a token from rate_limiter before it is sent. By
+    default all clients share RashlyOutlaid.ratelimit.default_limiter, which
+    keeps the whole process within the Shadowserver limit of 10 queries per
+    second. Pass your own RateLimiter to change this, or None to disable
+    rate limiting.
+
+    With a RashlyOutlaid.prefixcache.PrefixCache as prefix_cache, origin
+    answers ip addresses within already seen prefixes from the cache (longest
+    prefix match) and only asks Shadowserver about the rest.
+
+    With a RashlyOutlaid.cache.TTLCache as asn_cache, the results of asn and
+    prefix are memoized. Pass use_cache=False to bypass the cache and refresh
+    the entry.
+
+    With a RashlyOutlaid.cache.MalwareCache as malware_cache, malware is
+    answered from the (persistent) cache and only unknown or stale hashes are
+    looked up.
+
+    With a RashlyOutlaid.cache.SharedCache as shared_cache, the results of
+    origin, peer, malware, asn and prefix (also the bulk and stream variants)
+    are shared with every process using the same cache file, so a pool of
+    worker processes looks up each query only once between them.
+
+    With compact=True, origin, peer and asn return shared, interned
+    CompactASNRecords instead of ASNRecords, for keeping millions of results
+    in memory.
+
+    Failed requests (429, 5xx, connection errors) are retried with jittered
+    exponential backoff according to retry (a resilience.RetryPolicy, None
+    disables retries), honouring Retry-After. With a resilience.CircuitBreaker
+    as circuit_breaker, calls fail fast with CircuitOpenError while
+    Shadowserver keeps failing. deadline (seconds, also accepted per call)
+    bounds the total time of a call including retries and waits; when it
+    passes, DeadlineExceeded is raised. The *_stream lookups apply it to
+    every batch, as they may run for any length of time.
+
+    Concurrent lookups of the same ip address, hash or asn from several
+    threads are coalesced: while one is in flight the others wait for its
+    result (or error) instead of requesting it again, also per element of
+    bulk lookups. Pass coalesce=False to always send every lookup.
+
+    With lazy_av=True, the anti_virus list of MalwareRecords is a LazyAVList
+    that only creates its AVRecords when first accessed, which saves most of
+    the parsing for callers that do not look at the AV results.
+
+    Keyword arguments not consumed by the client (proxies, timeout, ...) are
+    used as defaults for every request and can be overridden per call:
+
+    client = api.Client(pool_size=20,
+                        timeout=10,
+                        proxies={'http': 'http://myproxy.example.com:8080',
+                                 'https': 'http://myproxy.example.com:8080'
+                                })
+    client.origin(["8.8.8.8"])
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        keep_alive: bool = True,
+        base_url: Text = API_URL,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_url_length: int = DEFAULT_MAX_URL_LENGTH,
+        rate_limiter: Optional[
+            RashlyOutlaid.ratelimit.RateLimiter
+        ] = RashlyOutlaid.ratelimit.default_limiter,
+        prefix_cache: Optional[RashlyOutlaid.prefixcache.PrefixCache] = None,
+        asn_cache: Optional[RashlyOutlaid.cache.TTLCache] = None,
+        malware_cache: Optional[RashlyOutlaid.cache.MalwareCache] = None,
+        compact: bool = False,
+        lazy_av: bool = False,
+        retry: Optional[
+            RashlyOutlaid.resilience.RetryPolicy
+        ] = RashlyOutlaid.resilience.DEFAULT_RETRY,
+        circuit_breaker: Optional[RashlyOutlaid.resilience.CircuitBreaker] = None,
+        deadline: Optional[float] = None,
+        coalesce: bool = True,
+        shared_cache: Optional[RashlyOutlaid.cache.SharedCache] = None,
+        **kwargs_requests: Any,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.max_url_length = max_url_length
+        self.rate_limiter = rate_limiter
+        self.prefix_cache = prefix_cache
+        self.asn_cache = asn_cache
+        self.malware_cache = malware_cache
+        self.shared_cache = shared_cache
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        self.deadline = deadline
+        self._flight: Optional[RashlyOutlaid.singleflight.SingleFlight] = (
+            RashlyOutlaid.singleflight.SingleFlight() if coalesce else None
+        )
+        self._asn_model: Callable[[List[Dict]], List] = (
+            _map_compact_model if compact else _map_shadowserver_model
+        )
+        self._malware_model: Callable[[List[Dict]], List[MalwareRecord]] = (
+            _map_lazy_malware_model if lazy_av else _map_malware_model
+        )
+        self.kwargs_requests = kwargs_requests
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not keep_alive:
+            self.session.headers["Connection"] = "close"
+
+    def __enter__(self) -> "Client":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+
+        self.session.close()
+
+    def _deadline(
+        self, kwargs_requests: Dict[Text, Any]
+    ) -> Optional[RashlyOutlaid.resilience.Deadline]:
+        """Start the deadline of a call, given per call or on the client, and
+        store it in kwargs_requests so all requests of the call share it"""
+
+        deadline = RashlyOutlaid.resilience.Deadline.of(
+            kwargs_requests.get("deadline", self.deadline)
+        )
+        kwargs_requests["deadline"] = deadline
+        return deadline
+
+    def _get(self, url: Text, error: Text, **kwargs_requests: Any) -> Any:
+        """Perform a GET request through the pooled session and decode the json
+        result. Transient failures are retried according to the retry policy.
+        Raise QueryError (prefixed with error) on non-200 responses"""
+
+        deadline = self._deadline(kwargs_requests)
+        del kwargs_requests["deadline"]
+        kwargs_requests = {**self.kwargs_requests, **kwargs_requests}
+        breaker = self.circuit_breaker
+        transient = (
+            RashlyOutlaid.resilience.RETRY_STATUSES
+            if self.retry is None
+            else self.retry.statuses
+        )
+        attempt = 0
+
+        while True:
+            if self.rate_limiter is not None:
+                waited = self.rate_limiter.acquire()
+                if waited and RashlyOutlaid.metrics.observers:
+                    RashlyOutlaid.metrics.rate_limit_wait(waited)
+
+            # after waiting for the rate limiter, which takes from the budget
+            if deadline is not None:
+                deadline.check(url)
+                kwargs_requests["timeout"] = _cap_timeout(
+                    kwargs_requests.get("timeout"), deadline.remaining()
+                )
+
+            if breaker is not None:
+                breaker.allow()
+            try:
+                failure, retry_after, result = self._attempt(
+                    url, error, transient, **kwargs_requests
+                )
+            except RashlyOutlaid.libwhois.QueryError:
+                # the service answered, the request itself is bad
+                if breaker is not None:
+                    breaker.success()
+                raise
+            except Exception:
+                if breaker is not None:
+                    breaker.failure()
+                raise
+
+            if failure is None:
+                if breaker is not None:
+                    breaker.success()
+                return result
+
+            if breaker is not None:
+                breaker.failure()
+            if self.retry is None or attempt >= self.retry.retries:
+                raise failure
+
+            delay = self.retry.delay(attempt, retry_after)
+            if deadline is not None and delay >= deadline.remaining():
+                raise failure
+            attempt += 1
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.retry(_endpoint(url), attempt, delay)
+            time.sleep(delay)
+
+    def _attempt(
+        self, url: Text, error: Text, transient: frozenset, **kwargs_requests: Any
+    ) -> Tuple[Optional[Exception], Optional[float], Any]:
+        """Perform a single GET request. Return (None, None, json) on success
+        and (failure, retry_after, None) on a transient failure (connection
+        errors, timeouts and the transient statuses). Raise QueryError on
+        other non-200 responses"""
+
+        observed = RashlyOutlaid.metrics.observers
+        started = time.perf_counter() if observed else 0.0
+        try:
+            res = self.session.get(url, **kwargs_requests)
+        except (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ) as err:
+            if observed:
+                RashlyOutlaid.metrics.request(
+                    _endpoint(url), "error", time.perf_counter() - started, len(url), 0
+                )
+            return err, None, None
+
+        if observed:
+            RashlyOutlaid.metrics.request(
+                _endpoint(url),
+                str(res.status_code),
+                time.perf_counter() - started,
+                len(url),
+                len(res.content),
+            )
+        if res.status_code == 200:
+            return None, None, res.json()
+
+        failure = RashlyOutlaid.libwhois.QueryError(
+            f"{error}. Got status='{res.status_code}' while requesting '{url}'"
+        )
+        if res.status_code not in transient:
+            raise failure
+        return (
+            failure,
+            RashlyOutlaid.resilience.parse_retry_after(res.headers.get("Retry-After")),
+            None,
+        )
+
+    def _split(
+        self, url: Text, queries: List[Text], batch_size: Optional[int] = None
+    ) -> Iterator[List[Text]]:
+        """Split queries into the batches to request from url (ending with the
+        name of the query parameter)"""
+
+        return _batches(
+            queries, batch_size or self.batch_size, self.max_url_length - len(url)
+        )
+
+    def _bulk(
+        self,
+        url: Text,
+        queries: List[Text],
+        error: Text,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> List[Dict]:
+        """Perform the bulk lookup of queries against url (ending with the
+        name of the query parameter) in batches and merge the results in order.
+
+        error is formatted with the queries of a failing batch."""
+
+        self._deadline(kwargs_requests)
+        ss_data: List[Dict] = []
+        for batch in self._split(url, queries, batch_size):
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.batch(_endpoint(url), len(batch))
+            ss_data.extend(
+                self._get(
+                    f"{url}{','.join(batch)}", error.format(batch), **kwargs_requests
+                )
+            )
+        return ss_data
+
+    def _bulk_parallel(
+        self,
+        url: Text,
+        queries: List[Text],
+        error: Text,
+        fetch: Callable[
+            [List[Text], Callable[[List[Text]], List[Dict]]], Dict[Text, Any]
+        ],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Tuple[Dict[Text, Any], List[BatchError]]:
+        """Perform the bulk lookup of queries against url in batches on a pool
+        of workers threads. Each batch is looked up with fetch(batch, request),
+        where request(misses) requests the misses in a single request. Return
+        the records indexed by query and the batches that failed, instead of
+        raising on the first error."""
+
+        if workers < 1:
+            raise ValueError(f"workers must be a positive integer, got {workers}")
+
+        self._deadline(kwargs_requests)
+        found: Dict[Text, Any] = {}
+        errors: List[BatchError] = []
+        batches = list(self._split(url, queries, batch_size))
+        if RashlyOutlaid.metrics.observers:
+            for batch in batches:
+                RashlyOutlaid.metrics.batch(_endpoint(url), len(batch))
+
+        def request(misses: List[Text]) -> List[Dict]:
+            return self._get(
+                f"{url}{','.join(misses)}", error.format(misses), **kwargs_requests
+            )
+
+        def lookup(batch: List[Text]) -> Dict[Text, Any]:
+            return fetch(batch, request)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._coalesced, url, batch, lookup) for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                try:
+                    found.update(future.result())
+                except (
+                    RashlyOutlaid.libwhois.QueryError,
+                    requests.exceptions.RequestException,
+                ) as err:
+                    errors.append(BatchError(batch, err))
+
+        return found, errors
+
+    def _shared(
+        self,
+        url: Text,
+        queries: List[Text],
+        keys_of: Callable[[Any], List[Text]],
+        fetch: Callable[[List[Text]], List],
+        use_cache: bool = True,
+    ) -> List:
+        """Return the Shadowserver data of queries against url, from
+        shared_cache if possible, fetching the rest with fetch(misses) and
+        storing it in shared_cache under keys_of(elem)"""
+
+        if self.shared_cache is None:
+            return fetch(queries)
+
+        kind = _endpoint(url)
+        cached: Dict[Text, Any] = {}
+        misses = queries
+        if use_cache:
+            cached = self.shared_cache.get_many(kind, queries)
+            misses = [query for query in queries if query not in cached]
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.cache("shared", len(cached), len(misses))
+
+        ss_data: List = []
+        if misses:
+            ss_data = fetch(misses)
+            self.shared_cache.put_many(
+                kind, [(key, elem) for elem in ss_data for key in keys_of(elem)]
+            )
+
+        return list(cached.values()) + ss_data
+
+    def _coalesced(
+        self,
+        url: Text,
+        queries: List[Text],
+        lookup: Callable[[List[Text]], Dict[Text, Any]],
+    ) -> Dict[Text, Any]:
+        """Run lookup(queries), sharing the queries already in flight against
+        url with the lookups of other threads"""
+
+        if self._flight is None:
+            return lookup(queries)
+        return self._flight.do_many(url, queries, lookup)
+
+    def _malware_map(
+        self, hashes: List[Text], batch_size: Optional[int] = None, **kwargs_requests: Any
+    ) -> Dict[Text, MalwareRecord]:
+        """Lookup the unique, normalized hashes and index the records by hash"""
+
+        url = f"{self.base_url}/malware/info?sample="
+
+        def request(misses: List[Text]) -> List[Dict]:
+            return self._bulk(
+                url,
+                misses,
+                "RashlyOutlaid.api.malware could not lookup {}",
+                batch_size,
+                **kwargs_requests,
+            )
+
+        return self._coalesced(
+            url, hashes, lambda misses: self._fetch_malware(misses, request)
+        )
+
+    def _fetch_malware(
+        self, hashes: List[Text], request: Callable[[List[Text]], List[Dict]]
+    ) -> Dict[Text, MalwareRecord]:
+        """Lookup the hashes, from malware_cache if possible, requesting the
+        rest with request(misses), and index the records by hash"""
+
+        cached: Dict[Text, Dict] = {}
+        misses = hashes
+        if self.malware_cache is not None:
+            cached = self.malware_cache.get_many(hashes)
+            misses = [h for h in hashes if h not in cached]
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.cache(
+                    "malware", len(hashes) - len(misses), len(misses)
+                )
+
+        ss_data: List[Dict] = []
+        if misses:
+            # only what came from Shadowserver is fresh, shared cache hits
+            # keep their age
+            fetched: List[Dict] = []
+
+            def fetch(misses: List[Text]) -> List[Dict]:
+                data = request(misses)
+                fetched.extend(data)
+                return data
+
+            ss_data = self._shared(
+                f"{self.base_url}/malware/info?sample=", misses, _malware_keys, fetch
+            )
+            if self.malware_cache is not None:
+                self.malware_cache.put_many(fetched)
+
+        return _index(
+            list(cached.values()) + ss_data,
+            self._malware_model,
+            _malware_keys,
+            hashes,
+        )
+
+    def _origin_map(
+        self,
+        ip_addresses: List[Text],
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Dict[Text, ASNRecord]:
+        """Lookup the origin of the unique, normalized ip addresses and index
+        the records by ip address"""
+
+        url = f"{self.base_url}/net/asn?origin="
+
+        def request(misses: List[Text]) -> List[Dict]:
+            return self._bulk(
+                url,
+                misses,
+                "RashlyOutlaid.api.origin could not lookup origin of {}",
+                batch_size,
+                **kwargs_requests,
+            )
+
+        return self._coalesced(
+            url, ip_addresses, lambda misses: self._fetch_origin(misses, request)
+        )
+
+    def _fetch_origin(
+        self,
+        ip_addresses: List[Text],
+        request: Callable[[List[Text]], List[Dict]],
+    ) -> Dict[Text, ASNRecord]:
+        """Lookup the origin of the ip addresses, from prefix_cache if
+        possible, requesting the rest with request(misses), and index the
+        records by ip address"""
+
+        found: Dict[Text, ASNRecord] = {}
+        misses = ip_addresses
+        if self.prefix_cache is not None:
+            misses = []
+            for ip_address in ip_addresses:
+                record = self.prefix_cache.lookup(ip_address)
+                if record is None:
+                    misses.append(ip_address)
+                else:
+                    found[ip_address] = record
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.cache("prefix", len(found), len(misses))
+
+        if misses:
+            ss_data = self._shared(
+                f"{self.base_url}/net/asn?origin=", misses, _ip_keys, request
+            )
+            fetched = _index(ss_data, self._asn_model, _ip_keys, misses)
+            if self.prefix_cache is not None:
+                for record in fetched.values():
+                    self.prefix_cache.add(record)
+            found.update(fetched)
+
+        return found
+
+    def _peer_map(
+        self,
+        ip_addresses: List[Text],
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Dict[Text, ASNRecord]:
+        """Lookup the peers of the unique, normalized ip addresses and index
+        the records by ip address"""
+
+        url = f"{self.base_url}/net/asn?peer="
+
+        def request(misses: List[Text]) -> List[Dict]:
+            return self._bulk(
+                url,
+                misses,
+                "RashlyOutlaid.api.peer could not lookup peers of {}",
+                batch_size,
+                **kwargs_requests,
+            )
+
+        return self._coalesced(
+            url, ip_addresses, lambda misses: self._fetch_peer(misses, request)
+        )
+
+    def _fetch_peer(
+        self,
+        ip_addresses: List[Text],
+        request: Callable[[List[Text]], List[Dict]],
+    ) -> Dict[Text, ASNRecord]:
+        """Lookup the peers of the ip addresses, requesting them with
+        request(misses), and index the records by ip address"""
+
+        ss_data = self._shared(
+            f"{self.base_url}/net/asn?peer=", ip_addresses, _ip_keys, request
+        )
+        return _index(ss_data, self._asn_model, _ip_keys, ip_addresses)
+
+    def malware(
+        self,
+        hashes: List[Text],
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_requests: Any,
+    ) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+        """Lookup the list of hashes using the Shadowserver malware API"""
+
+        keys = [_normalize_hash(h) for h in hashes]
+        found = self._malware_map(_unique(keys), batch_size, **kwargs_requests)
+        return _fan_out(hashes, keys, found, as_dict)
+
+    def origin(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_requests: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the list of ip addresses vs the Shadowserver origin web api"""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        found = self._origin_map(_unique(keys), batch_size, **kwargs_requests)
+        return _fan_out(ip_addresses, keys, found, as_dict)
+
+    def peer(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        as_dict: bool = False,
+        **kwargs_requests: Any,
+    ) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+        """Lookup the list of ip addresses vs the Shadowserver peer web api"""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        found = self._peer_map(_unique(keys), batch_size, **kwargs_requests)
+        return _fan_out(ip_addresses, keys, found, as_dict)
+
+    def origin_table(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> RashlyOutlaid.columnar.ASNTable:
+        """Lookup the origin of the ip addresses into a columnar ASNTable"""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        ss_data = self._bulk(
+            f"{self.base_url}/net/asn?origin=",
+            _unique(keys),
+            "RashlyOutlaid.api.origin_table could not lookup origin of {}",
+            batch_size,
+            **kwargs_requests,
+        )
+        return RashlyOutlaid.columnar.ASNTable.from_json(ss_data)
+
+    def peer_table(
+        self,
+        ip_addresses: List,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> RashlyOutlaid.columnar.ASNTable:
+        """Lookup the peers of the ip addresses into a columnar ASNTable"""
+
+        keys, _ = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        ss_data = self._bulk(
+            f"{self.base_url}/net/asn?peer=",
+            _unique(keys),
+            "RashlyOutlaid.api.peer_table could not lookup peers of {}",
+            batch_size,
+            **kwargs_requests,
+        )
+        return RashlyOutlaid.columnar.ASNTable.from_json(ss_data)
+
+    def origin_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_requests: Any,
+    ) -> RashlyOutlaid.batcher.Batcher:
+        """A Batcher combining single ip address origin lookups from many
+        threads into bulk requests. load(ip) returns the ASNRecord or None."""
+
+        return RashlyOutlaid.batcher.Batcher(
+            lambda keys: self._origin_map(keys, **kwargs_requests),
+            window,
+            max_keys,
+            _normalize_ip,
+        )
+
+    def peer_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_requests: Any,
+    ) -> RashlyOutlaid.batcher.Batcher:
+        """A Batcher combining single ip address peer lookups from many
+        threads into bulk requests. load(ip) returns the ASNRecord or None."""
+
+        return RashlyOutlaid.batcher.Batcher(
+            lambda keys: self._peer_map(keys, **kwargs_requests),
+            window,
+            max_keys,
+            _normalize_ip,
+        )
+
+    def malware_batcher(
+        self,
+        window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+        max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+        **kwargs_requests: Any,
+    ) -> RashlyOutlaid.batcher.Batcher:
+        """A Batcher combining single hash lookups from many threads into
+        bulk requests. load(hash) returns the MalwareRecord or None."""
+
+        return RashlyOutlaid.batcher.Batcher(
+            lambda keys: self._malware_map(keys, **kwargs_requests),
+            window,
+            max_keys,
+            _normalize_hash,
+        )
+
+    def _memoized(
+        self,
+        key: Tuple[Text, Text],
+        use_cache: bool,
+        lookup: Callable[[], List],
+    ) -> List:
+        """Return the result of lookup, memoized in asn_cache under key.
+        Concurrent lookups of the same key are coalesced."""
+
+        if self._flight is not None:
+            # copy, so the callers sharing a result do not share the list
+            shared = functools.partial(self._flight.do, key, lookup)
+            lookup = lambda: list(shared())
+
+        if self.asn_cache is None:
+            return lookup()
+
+        if use_cache:
+            cached = self.asn_cache.get(key)
+            hit = cached is not RashlyOutlaid.cache.MISSING
+            if RashlyOutlaid.metrics.observers:
+                RashlyOutlaid.metrics.cache("asn", int(hit), int(not hit))
+            if hit:
+                return list(cached)
+
+        result = lookup()
+        self.asn_cache.set(key, list(result))
+        return result
+
+    def asn(
+        self, asnumber: int, use_cache: bool = True, **kwargs_requests: Any
+    ) -> List[ASNRecord]:
+        """Lookup the asn via the Shadowserver asn web api"""
+
+        url = f"{self.base_url}/net/asn" f"?query={asnumber}"
+
+        def lookup() -> List[ASNRecord]:
+            ss_data: List[Dict] = self._shared(
+                url,
+                [str(asnumber)],
+                lambda elem: [str(asnumber)],
+                lambda misses: [
+                    self._get(
+                        url,
+                        f"RashlyOutlaid.api.asn could not lookup asn {asnumber}",
+                        **kwargs_requests,
+                    )
+                ],
+                use_cache,
+            )
+            return self._asn_model(ss_data)
+
+        return self._memoized(("asn", str(asnumber)), use_cache, lookup)
+
+    def prefix(
+        self, asnumber: int, use_cache: bool = True, **kwargs_requests: Any
+    ) -> List[Text]:
+        """Lookup the announced prefixes of the asn vs the Shadowserver prefix
+        web api"""
+
+        url = f"{self.base_url}/net/asn" f"?prefix={asnumber}"
+
+        def lookup() -> List[Text]:
+            ss_data: List[List[Text]] = self._shared(
+                url,
+                [str(asnumber)],
+                lambda elem: [str(asnumber)],
+                lambda misses: [
+                    self._get(
+                        url,
+                        f"RashlyOutlaid.api.prefix could not lookup asn {asnumber}",
+                        **kwargs_requests,
+                    )
+                ],
+                use_cache,
+            )
+            return ss_data[0]
+
+        return self._memoized(("prefix", str(asnumber)), use_cache, lookup)
+
+    def _stream(
+        self,
+        queries: Iterable[Text],
+        normalize: Callable[[Text], Text],
+        lookup: Callable[..., Dict[Text, Any]],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Iterator[Tuple[Text, Any]]:
+        """Consume queries lazily in batches, run at most workers batches at
+        the time with lookup and yield (query, record) in input order as the
+        batches complete. A deadline in seconds (given per call or on the
+        client) bounds each batch; pass a resilience.Deadline to bound the
+        whole stream."""
+
+        if workers < 1:
+            raise ValueError(f"workers must be a positive integer, got {workers}")
+
+        pending: collections.deque = collections.deque()
+
+        def drain() -> Iterator[Tuple[Text, Any]]:
+            batch, keys, future = pending.popleft()
+            found = future.result()
+            for query, key in zip(batch, keys):
+                yield query, found.get(key)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for batch in _chunked(queries, batch_size or self.batch_size):
+                keys = [normalize(query) for query in batch]
+                future = pool.submit(
+                    lookup, _unique(keys), batch_size, **kwargs_requests
+                )
+                pending.append((batch, keys, future))
+                if len(pending) >= workers:
+                    yield from drain()
+            while pending:
+                yield from drain()
+
+    def malware_stream(
+        self,
+        hashes: Iterable[Text],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Iterator[Tuple[Text, Optional[MalwareRecord]]]:
+        """Lookup an iterable of hashes lazily, yielding (hash, MalwareRecord)"""
+
+        return self._stream(
+            hashes,
+            _normalize_hash,
+            self._malware_map,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+
+    def origin_stream(
+        self,
+        ip_addresses: Iterable[Text],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Iterator[Tuple[Text, Optional[ASNRecord]]]:
+        """Lookup the origin of an iterable of ip addresses lazily, yielding
+        (ip_address, ASNRecord)"""
+
+        return self._stream(
+            ip_addresses,
+            _normalize_ip,
+            self._origin_map,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+
+    def peer_stream(
+        self,
+        ip_addresses: Iterable[Text],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> Iterator[Tuple[Text, Optional[ASNRecord]]]:
+        """Lookup the peers of an iterable of ip addresses lazily, yielding
+        (ip_address, ASNRecord)"""
+
+        return self._stream(
+            ip_addresses,
+            _normalize_ip,
+            self._peer_map,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+
+    def bulk_malware(
+        self,
+        hashes: List[Text],
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> BulkResult:
+        """Lookup the hashes in batches on a pool of workers threads"""
+
+        keys = [_normalize_hash(h) for h in hashes]
+        found, errors = self._bulk_parallel(
+            f"{self.base_url}/malware/info?sample=",
+            _unique(keys),
+            "RashlyOutlaid.api.bulk_malware could not lookup {}",
+            self._fetch_malware,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+        return BulkResult(_fan_out(hashes, keys, found, False), errors)
+
+    def bulk_origin(
+        self,
+        ip_addresses: List,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> BulkResult:
+        """Lookup the origin of the ip addresses in batches on a pool of
+        workers threads"""
+
+        keys, invalid = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        found, errors = self._bulk_parallel(
+            f"{self.base_url}/net/asn?origin=",
+            _unique(keys),
+            "RashlyOutlaid.api.bulk_origin could not lookup origin of {}",
+            self._fetch_origin,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+        return BulkResult(
+            _fan_out(ip_addresses, keys, found, False), errors, invalid
+        )
+
+    def bulk_peer(
+        self,
+        ip_addresses: List,
+        workers: int = DEFAULT_WORKERS,
+        batch_size: Optional[int] = None,
+        **kwargs_requests: Any,
+    ) -> BulkResult:
+        """Lookup the peers of the ip addresses in batches on a pool of
+        workers threads"""
+
+        keys, invalid = RashlyOutlaid.iputil.normalize_many(ip_addresses)
+        found, errors = self._bulk_parallel(
+            f"{self.base_url}/net/asn?peer=",
+            _unique(keys),
+            "RashlyOutlaid.api.bulk_peer could not lookup peers of {}",
+            self._fetch_peer,
+            workers,
+            batch_size,
+            **kwargs_requests,
+        )
+        return BulkResult(
+            _fan_out(ip_addresses, keys, found, False), errors, invalid
+        )
+
+
+_default_client: Optional[Client] = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> Client:
+    """Return the shared client used by the module level lookup functions"""
+
+    global _default_client
+
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = Client(
+                    circuit_breaker=RashlyOutlaid.resilience.CircuitBreaker()
+                )
+    return _default_client
+
+
+def set_default_client(client: Optional[Client]) -> None:
+    """Replace the shared client used by the module level lookup functions.
+    Passing None makes the next lookup create a fresh default client."""
+
+    global _default_client
+
+    with _default_client_lock:
+        _default_client = client
+
+
+def malware(
+    hashes: List[Text],
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_requests: Any,
+) -> Union[List[MalwareRecord], Dict[Text, MalwareRecord]]:
+    """Lookup the list of hashes using the Shadowserver malware API
+
+    Large lists are split into batches of batch_size hashes (default
+    DEFAULT_BATCH_SIZE), the results are returned in the order of the input.
+    Duplicate hashes (ignoring case) are only looked up once. With
+    as_dict=True the result is a {hash: MalwareRecord} dict.
 
     You can pass arguments to requests suchs as proxies:
 
-    api.origin(["8.8.8.8"],
+    api.malware(["4b21f25e02b0d1df86ab745f82e140ab1cc498af"],
                 proxies={'http': 'http://myproxy.example.com:8080',
                          'https': 'http://myproxy.example.com:8080'
                         })
 
+    https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
     """
 
-    url = f"https://api.shadowserver.org/net/asn" f"?origin={','.join(ip_addresses)}"
+    return default_client().malware(hashes, batch_size, as_dict, **kwargs_requests)
 
-    res = requests.get(url, **kwargs_requests)
 
-    if res.status_code != 200:
-        msg = (
-            f"RashlyOutlaid.api.origin could not lookup origin. "
-            f"Got status='{res.status_code}' while requesting '{url}'"
-        )
-        raise RashlyOutlaid.libwhois.QueryError(msg)
+def origin(
+    ip_addresses: List,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_requests: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
+    """Lookup the list of ip addresses vs the Shadowserver origin web api
+    https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
+
+    Large lists are split into batches of batch_size addresses (default
+    DEFAULT_BATCH_SIZE), the results are returned in the order of the input.
+    Duplicate addresses are only looked up once. With as_dict=True the result
+    is a {ip_address: ASNRecord} dict.
+
+    You can pass arguments to requests suchs as proxies:
+
+    api.origin(["8.8.8.8"],
+                proxies={'http': 'http://myproxy.example.com:8080',
+                         'https': 'http://myproxy.example.com:8080'
+                        })
+
+    """
 
-    ss_data: List[Dict] = res.json()
-    return _map_shadowserver_model(ss_data)
+    return default_client().origin(
+        ip_addresses, batch_size, as_dict, **kwargs_requests
+    )
 
 
-def peer(ip_addresses: List, **kwargs_requests: Any) -> List[ASNRecord]:
+def peer(
+    ip_addresses: List,
+    batch_size: Optional[int] = None,
+    as_dict: bool = False,
+    **kwargs_requests: Any,
+) -> Union[List[ASNRecord], Dict[Text, ASNRecord]]:
     """Lookup the list of ip addresses vs the Shadowserver peer web api
     https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
 
+    Large lists are split into batches of batch_size addresses (default
+    DEFAULT_BATCH_SIZE), the results are returned in the order of the input.
+    Duplicate addresses are only looked up once. With as_dict=True the result
+    is a {ip_address: ASNRecord} dict.
+
     You can pass arguments to requests suchs as proxies:
 
     api.peer(["8.8.8.8"],
@@ -241,23 +1659,12 @@ def peer(ip_addresses: List, **kwargs_requests: Any) -> List[ASNRecord]:
 
     """
 
-    url = f"https://api.shadowserver.org/net/asn" f"?peer={','.join(ip_addresses)}"
-
-    res = requests.get(url, **kwargs_requests)
-
-    if res.status_code != 200:
-        msg = (
-            f"RashlyOutlaid.api.peer could not lookup peers "
-            f"of {ip_addresses}. "
-            f"Got status='{res.status_code}' while requesting '{url}'"
-        )
-        raise RashlyOutlaid.libwhois.QueryError(msg)
-
-    ss_data: List[Dict] = res.json()
-    return _map_shadowserver_model(ss_data)
+    return default_client().peer(
+        ip_addresses, batch_size, as_dict, **kwargs_requests
+    )
 
 
-def asn(asnumber: int, **kwargs_requests) -> List[ASNRecord]:
+def asn(asnumber: int, use_cache: bool = True, **kwargs_requests) -> List[ASNRecord]:
     """Lookup the asn via the Shadowserver asn web api
     https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
 
@@ -269,22 +1676,12 @@ def asn(asnumber: int, **kwargs_requests) -> List[ASNRecord]:
                     })
     """
 
-    url = f"https://api.shadowserver.org/net/asn" f"?query={asnumber}"
-
-    res = requests.get(url, **kwargs_requests)
-
-    if res.status_code != 200:
-        msg = (
-            f"RashlyOutlaid.api.asn could not lookup asn {asnumber}. "
-            f"Got status='{res.status_code}' while requesting '{url}'"
-        )
-        raise RashlyOutlaid.libwhois.QueryError(msg)
-
-    ss_data: List[Dict] = [res.json()]
-    return _map_shadowserver_model(ss_data)
+    return default_client().asn(asnumber, use_cache, **kwargs_requests)
 
 
-def prefix(asnumber: int, **kwargs_requests: Any) -> List[Text]:
+def prefix(
+    asnumber: int, use_cache: bool = True, **kwargs_requests: Any
+) -> List[Text]:
     """Lookup the list of ip addresses vs the Shadowserver prefix web api
     https://www.shadowserver.org/what-we-do/network-reporting/api-asn-and-network-queries/
 
@@ -296,16 +1693,173 @@ def prefix(asnumber: int, **kwargs_requests: Any) -> List[Text]:
                        })
     """
 
-    url = f"https://api.shadowserver.org/net/asn" f"?prefix={asnumber}"
+    return default_client().prefix(asnumber, use_cache, **kwargs_requests)
 
-    res = requests.get(url, **kwargs_requests)
 
-    if res.status_code != 200:
-        msg = (
-            f"RashlyOutlaid.api.prefix could not lookup asn {asnumber}. "
-            f"Got status='{res.status_code}' while requesting '{url}'"
-        )
-        raise RashlyOutlaid.libwhois.QueryError(msg)
+def bulk_malware(
+    hashes: List[Text],
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> BulkResult:
+    """Lookup the hashes in batches on a pool of workers threads.
+
+    The records of all successful batches are returned in input order in
+    BulkResult.records. A failing batch does not abort the lookup, it is
+    reported in BulkResult.errors together with its queries.
+    """
+
+    return default_client().bulk_malware(hashes, workers, batch_size, **kwargs_requests)
+
+
+def bulk_origin(
+    ip_addresses: List,
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> BulkResult:
+    """Lookup the origin of the ip addresses in batches on a pool of workers
+    threads.
+
+    The records of all successful batches are returned in input order in
+    BulkResult.records. A failing batch does not abort the lookup, it is
+    reported in BulkResult.errors together with its queries.
+
+    result = api.bulk_origin(ips, workers=8)
+    if not result.ok:
+        retry_later(result.failed)
+    """
+
+    return default_client().bulk_origin(
+        ip_addresses, workers, batch_size, **kwargs_requests
+    )
+
+
+def bulk_peer(
+    ip_addresses: List,
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> BulkResult:
+    """Lookup the peers of the ip addresses in batches on a pool of workers
+    threads.
+
+    The records of all successful batches are returned in input order in
+    BulkResult.records. A failing batch does not abort the lookup, it is
+    reported in BulkResult.errors together with its queries.
+    """
+
+    return default_client().bulk_peer(
+        ip_addresses, workers, batch_size, **kwargs_requests
+    )
+
+
+def malware_stream(
+    hashes: Iterable[Text],
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> Iterator[Tuple[Text, Optional[MalwareRecord]]]:
+    """Lookup an iterable of hashes lazily, yielding (hash, MalwareRecord)
+    pairs in input order. See origin_stream."""
+
+    return default_client().malware_stream(
+        hashes, workers, batch_size, **kwargs_requests
+    )
+
+
+def origin_stream(
+    ip_addresses: Iterable[Text],
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> Iterator[Tuple[Text, Optional[ASNRecord]]]:
+    """Lookup the origin of an iterable of ip addresses lazily, yielding
+    (ip_address, ASNRecord) pairs in input order.
+
+    The input is consumed in batches of batch_size addresses as the result
+    is iterated, with at most workers batches in flight, so memory use stays
+    constant however long the input is. Addresses without a result are
+    yielded with None as record.
+
+    with open("ips.txt") as f:
+        for ip_address, record in api.origin_stream(line.strip() for line in f):
+            ...
+    """
+
+    return default_client().origin_stream(
+        ip_addresses, workers, batch_size, **kwargs_requests
+    )
+
+
+def peer_stream(
+    ip_addresses: Iterable[Text],
+    workers: int = DEFAULT_WORKERS,
+    batch_size: Optional[int] = None,
+    **kwargs_requests: Any,
+) -> Iterator[Tuple[Text, Optional[ASNRecord]]]:
+    """Lookup the peers of an iterable of ip addresses lazily, yielding
+    (ip_address, ASNRecord) pairs in input order. See origin_stream."""
+
+    return default_client().peer_stream(
+        ip_addresses, workers, batch_size, **kwargs_requests
+    )
+
+
+def origin_table(
+    ip_addresses: List, batch_size: Optional[int] = None, **kwargs_requests: Any
+) -> RashlyOutlaid.columnar.ASNTable:
+    """Lookup the origin of the ip addresses into a columnar ASNTable, one
+    row per unique address answered. The table is built directly from the
+    json response, without creating an ASNRecord per address.
+
+    table = api.origin_table(ips)
+    df = table.to_arrow().to_pandas()
+    """
+
+    return default_client().origin_table(ip_addresses, batch_size, **kwargs_requests)
+
+
+def peer_table(
+    ip_addresses: List, batch_size: Optional[int] = None, **kwargs_requests: Any
+) -> RashlyOutlaid.columnar.ASNTable:
+    """Lookup the peers of the ip addresses into a columnar ASNTable. See
+    origin_table."""
+
+    return default_client().peer_table(ip_addresses, batch_size, **kwargs_requests)
+
+
+def origin_batcher(
+    window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+    max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+    **kwargs_requests: Any,
+) -> RashlyOutlaid.batcher.Batcher:
+    """Return a Batcher that combines the single ip address lookups of many
+    threads, made within window seconds, into bulk origin requests of at most
+    max_keys addresses. Close the batcher when done.
+
+    batcher = api.origin_batcher(window=0.005, max_keys=200)
+    record = batcher.load("8.8.8.8")
+    """
+
+    return default_client().origin_batcher(window, max_keys, **kwargs_requests)
+
+
+def peer_batcher(
+    window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+    max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+    **kwargs_requests: Any,
+) -> RashlyOutlaid.batcher.Batcher:
+    """Return a Batcher for peer lookups. See origin_batcher."""
+
+    return default_client().peer_batcher(window, max_keys, **kwargs_requests)
+
+
+def malware_batcher(
+    window: float = RashlyOutlaid.batcher.DEFAULT_WINDOW,
+    max_keys: int = RashlyOutlaid.batcher.DEFAULT_MAX_KEYS,
+    **kwargs_requests: Any,
+) -> RashlyOutlaid.batcher.Batcher:
+    """Return a Batcher for malware lookups. See origin_batcher."""
 
-    ss_data: List[Text] = res.json()
-    return ss_data
+    return default_client().malware_batcher(window, max_keys, **kwargs_requests)
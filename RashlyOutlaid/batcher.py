@@ -0,0 +1,271 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+# Keys are collected for at most DEFAULT_WINDOW seconds after the first one
+# arrives, or until DEFAULT_MAX_KEYS distinct keys are waiting, before they
+# are looked up together
+DEFAULT_WINDOW = 0.005
+DEFAULT_MAX_KEYS = 200
+
+# Bulk lookups a Batcher runs at the time
+DEFAULT_WORKERS = 4
+
+
+class Batcher:
+    """Collect single key lookups from many threads into bulk lookups
+
+    load(key) (or submit(key) for a future) buffers the key. When window
+    seconds have passed since the first buffered key, or max_keys distinct
+    keys are buffered, the keys are looked up with one lookup(keys) ->
+    {key: value} call on a pool of workers threads, and every caller gets the
+    value of its own key (None if not found) or the exception of the lookup.
+
+    normalize maps the query of the caller to the key to look up, queries
+    normalized to None are answered with None without being looked up.
+
+    with api.Client().origin_batcher() as batcher:
+        record = batcher.load("8.8.8.8")
+    """
+
+    def __init__(
+        self,
+        lookup: Callable[[List[Hashable]], Dict[Hashable, Any]],
+        window: float = DEFAULT_WINDOW,
+        max_keys: int = DEFAULT_MAX_KEYS,
+        normalize: Optional[Callable[[Any], Optional[Hashable]]] = None,
+        workers: int = DEFAULT_WORKERS,
+    ) -> None:
+        if max_keys < 1:
+            raise ValueError(f"max_keys must be a positive integer, got {max_keys}")
+
+        self.lookup = lookup
+        self.window = window
+        self.max_keys = max_keys
+        self.normalize = normalize
+        self._cond = threading.Condition()
+        self._pending: Dict[Hashable, List[concurrent.futures.Future]] = {}
+        self._first = 0.0
+        self._closed = False
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, query: Any) -> concurrent.futures.Future:
+        """Buffer query and return a future of its value"""
+
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        key = self.normalize(query) if self.normalize is not None else query
+        if key is None:
+            future.set_result(None)
+            return future
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batcher is closed")
+            if not self._pending:
+                self._first = time.monotonic()
+                self._cond.notify()
+            self._pending.setdefault(key, []).append(future)
+            if len(self._pending) == self.max_keys:
+                self._cond.notify()
+        return future
+
+    def load(self, query: Any, timeout: Optional[float] = None) -> Any:
+        """The value of query, looked up together with other pending queries"""
+
+        return self.submit(query).result(timeout)
+
+    def load_many(self, queries: List[Any], timeout: Optional[float] = None) -> List:
+        """The values of queries, in order"""
+
+        futures = [self.submit(query) for query in queries]
+        return [future.result(timeout) for future in futures]
+
+    def flush(self) -> None:
+        """Look up the buffered keys now, without waiting for the window"""
+
+        with self._cond:
+            self._first = 0.0
+            self._cond.notify()
+
+    def close(self) -> None:
+        """Look up the buffered keys, wait for all lookups and stop"""
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._pool.shutdown(wait=True)
+
+    def __enter__(self) -> "Batcher":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        """Wait for full batches or expired windows and dispatch them"""
+
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                while len(self._pending) < self.max_keys and not self._closed:
+                    remaining = self._first + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = _take(self._pending, self.max_keys)
+            self._pool.submit(_resolve, self.lookup, batch)
+
+
+def _take(pending: Dict[Hashable, List], max_keys: int) -> Dict[Hashable, List]:
+    """Remove and return (at most) the max_keys oldest keys of pending"""
+
+    if len(pending) <= max_keys:
+        batch = dict(pending)
+        pending.clear()
+        return batch
+    keys = list(pending)[:max_keys]
+    return {key: pending.pop(key) for key in keys}
+
+
+def _resolve(
+    lookup: Callable[[List[Hashable]], Dict[Hashable, Any]],
+    batch: Dict[Hashable, List[concurrent.futures.Future]],
+) -> None:
+    """Look up the keys of batch and resolve the futures waiting for them"""
+
+    try:
+        found = lookup(list(batch))
+    except BaseException as error:
+        for futures in batch.values():
+            for future in futures:
+                future.set_exception(error)
+        return
+
+    for key, futures in batch.items():
+        value = found.get(key)
+        for future in futures:
+            future.set_result(value)
+
+
+class AsyncBatcher:
+    """The asyncio counterpart of Batcher, for coroutines of one event loop
+
+    lookup is a coroutine function taking a list of keys and returning
+    {key: value}.
+
+    batcher = aio.AsyncClient().origin_batcher()
+    records = await asyncio.gather(*[batcher.load(ip) for ip in ips])
+    """
+
+    def __init__(
+        self,
+        lookup: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        window: float = DEFAULT_WINDOW,
+        max_keys: int = DEFAULT_MAX_KEYS,
+        normalize: Optional[Callable[[Any], Optional[Hashable]]] = None,
+    ) -> None:
+        if max_keys < 1:
+            raise ValueError(f"max_keys must be a positive integer, got {max_keys}")
+
+        self.lookup = lookup
+        self.window = window
+        self.max_keys = max_keys
+        self.normalize = normalize
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, query: Any) -> Any:
+        """The value of query, looked up together with other pending queries"""
+
+        key = self.normalize(query) if self.normalize is not None else query
+        if key is None:
+            return None
+
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        if len(self._pending) >= self.max_keys:
+            self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self.flush)
+        return await future
+
+    async def load_many(self, queries: List[Any]) -> List:
+        """The values of queries, in order"""
+
+        return list(await asyncio.gather(*[self.load(query) for query in queries]))
+
+    def flush(self) -> None:
+        """Start the lookup of the buffered keys now"""
+
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch = _take(self._pending, self.max_keys)
+        task = asyncio.ensure_future(self._resolve(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        if self._pending:
+            self._timer = asyncio.get_event_loop().call_later(self.window, self.flush)
+
+    async def close(self) -> None:
+        """Look up the buffered keys and wait for all lookups"""
+
+        while self._pending:
+            self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _resolve(self, batch: Dict[Hashable, List[asyncio.Future]]) -> None:
+        found: Optional[Dict[Hashable, Any]] = None
+        error: Optional[Exception] = None
+        try:
+            found = await self.lookup(list(batch))
+        except Exception as err:
+            error = err
+        finally:
+            # also when the lookup is cancelled, nobody would wake the waiters
+            for key, futures in batch.items():
+                for future in futures:
+                    if future.done():
+                        continue
+                    if found is not None:
+                        future.set_result(found.get(key))
+                    elif error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.cancel()
+
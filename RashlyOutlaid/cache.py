@@ -0,0 +1,361 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, List, Text, Tuple
+
+# Default bounds of a TTLCache
+DEFAULT_MAXSIZE = 10000
+DEFAULT_TTL = 60 * 60
+
+# Default freshness of a MalwareCache entry
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+# The hashes a malware sample can be looked up by
+MALWARE_HASHES = ("md5", "sha1", "sha256")
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread safe memoization cache with per entry time to live and least
+    recently used eviction
+
+    get returns MISSING for keys not cached (or expired), so None can be
+    cached like any other value. hits, misses and evictions count the
+    outcome of get and the entries dropped to keep within maxsize.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL) -> None:
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be a positive integer, got {maxsize}")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value of key or MISSING"""
+
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            if entry[0] <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Cache value for key, evicting the least recently used entries if
+        the cache is full"""
+
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        """Remove key from the cache"""
+
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+
+        with self._lock:
+            self._data.clear()
+
+    @property
+    def hit_ratio(self) -> float:
+        """hits / (hits + misses), 0.0 before the first lookup"""
+
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class MalwareCache:
+    """Persistent SQLite backed cache of malware lookups
+
+    The malware records are stored as returned by Shadowserver (the json
+    object holding the MalwareRecord and its AVRecords) under each of the
+    md5, sha1 and sha256 of the sample, so a sample is found whichever hash
+    it is queried by. Entries older than max_age seconds are stale and
+    looked up again.
+
+    cache = MalwareCache("~/.cache/rashlyoutlaid-malware.sqlite")
+    client = api.Client(malware_cache=cache)
+    """
+
+    def __init__(self, path: Text = ":memory:", max_age: float = DEFAULT_MAX_AGE) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS malware ("
+                "hash TEXT PRIMARY KEY, data TEXT NOT NULL, fetched REAL NOT NULL)"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        """Close the database"""
+
+        with self._lock:
+            self._db.close()
+
+    def get_many(self, hashes: Iterable[Text]) -> Dict[Text, Dict]:
+        """Return the fresh cached samples of hashes as {hash: data}, keyed by
+        the lower case hash"""
+
+        wanted = list({h.lower() for h in hashes})
+        oldest = time.time() - self.max_age
+        found: Dict[Text, Dict] = {}
+
+        with self._lock:
+            # stay well below SQLITE_MAX_VARIABLE_NUMBER
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start : start + 500]
+                rows = self._db.execute(
+                    "SELECT hash, data FROM malware WHERE fetched > ? AND hash IN "
+                    f"({','.join('?' * len(chunk))})",
+                    [oldest, *chunk],
+                )
+                for sample_hash, data in rows:
+                    found[sample_hash] = json.loads(data)
+
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+
+        return found
+
+    def put_many(self, samples: Iterable[Dict]) -> None:
+        """Store the samples as returned by Shadowserver"""
+
+        now = time.time()
+        rows: List[Tuple[Text, Text, float]] = []
+        for sample in samples:
+            data = json.dumps(sample)
+            rows.extend(
+                (sample[name].lower(), data, now)
+                for name in MALWARE_HASHES
+                if sample.get(name)
+            )
+
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO malware (hash, data, fetched) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def expire(self) -> int:
+        """Delete the stale entries and return the number of rows removed"""
+
+        with self._lock, self._db:
+            return self._db.execute(
+                "DELETE FROM malware WHERE fetched <= ?", [time.time() - self.max_age]
+            ).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM malware").fetchone()[0]
+
+
+# Default bounds of a SharedCache
+DEFAULT_SHARED_MAXSIZE = 1000000
+DEFAULT_SHARED_TTL = 24 * 60 * 60
+
+
+class SharedCache:
+    """SQLite backed cache shared by all processes on a host
+
+    Holds the records of origin, peer, malware, asn and prefix lookups as
+    returned by Shadowserver (json), keyed by lookup kind and query, so
+    every process opening the same path sees what the others fetched.
+    SQLite's file locking (in WAL mode, so readers do not block the writer)
+    keeps concurrent processes consistent.
+
+    Entries older than ttl seconds are not returned. When more than maxsize
+    entries are stored the oldest fetched are evicted, down to 90% of
+    maxsize. Counting the entries takes a scan of the table, so every
+    process only checks the size after each maxsize / 100 entries it
+    stored; the cache can briefly exceed maxsize by that many entries per
+    process.
+
+    Open the cache in every process (a connection is never used across a
+    fork; pickling reopens the cache by path), for instance in the
+    initializer of a multiprocessing pool:
+
+    def init():
+        api.set_default_client(api.Client(shared_cache=SharedCache("/tmp/ro.sqlite")))
+    """
+
+    def __init__(
+        self,
+        path: Text,
+        maxsize: int = DEFAULT_SHARED_MAXSIZE,
+        ttl: float = DEFAULT_SHARED_TTL,
+        timeout: float = 30.0,
+    ) -> None:
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be a positive integer, got {maxsize}")
+
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = -1
+        self._db: Any = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._check_every = max(1, maxsize // 100)
+        self._unchecked = 0
+        self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        """The connection of the current process, opened on first use"""
+
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(
+                self.path, timeout=self.timeout, check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            with self._db:
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS shared ("
+                    "kind TEXT NOT NULL, key TEXT NOT NULL, data TEXT NOT NULL, "
+                    "fetched REAL NOT NULL, PRIMARY KEY (kind, key)) WITHOUT ROWID"
+                )
+                self._db.execute(
+                    "CREATE INDEX IF NOT EXISTS shared_fetched ON shared (fetched)"
+                )
+            self._pid = os.getpid()
+        return self._db
+
+    def __reduce__(self) -> Tuple:
+        return (SharedCache, (self.path, self.maxsize, self.ttl, self.timeout))
+
+    def close(self) -> None:
+        """Close the connection of this process"""
+
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
+            self._pid = -1
+
+    def get_many(self, kind: Text, keys: Iterable[Text]) -> Dict[Text, Any]:
+        """Return the fresh cached records of kind for keys as {key: data}"""
+
+        wanted = list(dict.fromkeys(keys))
+        oldest = time.time() - self.ttl
+        found: Dict[Text, Any] = {}
+
+        with self._lock:
+            db = self._connect()
+            for start in range(0, len(wanted), 500):
+                chunk = wanted[start : start + 500]
+                rows = db.execute(
+                    "SELECT key, data FROM shared WHERE kind = ? AND fetched > ? "
+                    f"AND key IN ({','.join('?' * len(chunk))})",
+                    [kind, oldest, *chunk],
+                )
+                for key, data in rows:
+                    found[key] = json.loads(data)
+
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+
+        return found
+
+    def put_many(self, kind: Text, items: Iterable[Tuple[Text, Any]]) -> None:
+        """Store (key, data) pairs of kind and evict the oldest entries if
+        the cache grew beyond maxsize"""
+
+        now = time.time()
+        rows = [(kind, key, json.dumps(data), now) for key, data in items]
+        if not rows:
+            return
+
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO shared (kind, key, data, fetched) "
+                    "VALUES (?, ?, ?, ?)",
+                    rows,
+                )
+                self._unchecked += len(rows)
+                if self._unchecked < self._check_every:
+                    return
+                self._unchecked = 0
+                size = db.execute("SELECT COUNT(*) FROM shared").fetchone()[0]
+                if size > self.maxsize:
+                    excess = size - int(self.maxsize * 0.9)
+                    self.evictions += db.execute(
+                        "DELETE FROM shared WHERE (kind, key) IN ("
+                        "SELECT kind, key FROM shared ORDER BY fetched LIMIT ?)",
+                        [excess],
+                    ).rowcount
+
+    def clear(self) -> None:
+        """Remove all entries, for all processes"""
+
+        with self._lock:
+            db = self._connect()
+            with db:
+                db.execute("DELETE FROM shared")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM shared").fetchone()[0]
+
+    @property
+    def hit_ratio(self) -> float:
+        """hits / (hits + misses) of this process, 0.0 before the first lookup"""
+
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
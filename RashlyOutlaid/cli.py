@@ -0,0 +1,329 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+# Only the standard library is imported up front, so that --help and argument
+# errors are instant. RashlyOutlaid.api (and with it requests) is imported
+# when the lookups start.
+
+import argparse
+import collections
+import csv
+import io
+import json
+import os
+import sys
+from typing import IO, Any, Dict, Iterator, List, Optional, Text, Tuple
+
+# Columns appended to every row of the output, per lookup
+FIELDS = {
+    "origin": ["asn", "prefix", "asname", "cn", "isp"],
+    "peer": ["asn", "prefix", "asname", "cn", "isp", "peers"],
+    "malware": [
+        "sha256",
+        "md5",
+        "sha1",
+        "type",
+        "magic",
+        "filesize",
+        "first_seen",
+        "last_seen",
+        "anti_virus",
+    ],
+}
+
+# Default field (jsonl) holding the query, also the name of the query in the
+# output of text input
+QUERY_FIELDS = {"origin": "ip", "peer": "ip", "malware": "hash"}
+
+FORMATS = ("csv", "jsonl", "text")
+
+
+def parse_args(argv: Optional[List[Text]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="rashlyoutlaid",
+        description="Enrich ip addresses or malware hashes with Shadowserver data. "
+        "Input is read as a stream and results are written in input order.",
+    )
+    parser.add_argument("lookup", choices=sorted(FIELDS), help="the lookup to perform")
+    parser.add_argument(
+        "input", nargs="?", default="-", help="csv, jsonl or text file (default stdin)"
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="output file (default stdout)"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=FORMATS,
+        help="input format (default from the file extension, text for stdin)",
+    )
+    parser.add_argument(
+        "-F",
+        "--output-format",
+        choices=FORMATS,
+        help="output format (default csv for text input, else as the input)",
+    )
+    parser.add_argument(
+        "-c",
+        "--column",
+        help="csv column or jsonl field holding the query "
+        "(default the first csv column, 'ip' or 'hash' for jsonl)",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=4, help="concurrent requests (default 4)"
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=500,
+        help="queries per request (default 500)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        help="requests per second (default the Shadowserver limit of 10)",
+    )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        action="store_true",
+        help="continue a partially written output file, skipping the input "
+        "records it already holds",
+    )
+    return parser.parse_args(argv)
+
+
+def _format_of(path: Text, given: Optional[Text]) -> Text:
+    if given:
+        return given
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    return "text"
+
+
+def _read(
+    fh: IO[Text], fmt: Text, column: Optional[Text], lookup: Text
+) -> Tuple[Optional[List[Text]], Iterator[Tuple[Text, Any]]]:
+    """The header (csv) and an iterator of (query, row) of the input"""
+
+    if fmt == "csv":
+        reader = csv.reader(fh)
+        header = next(reader, [])
+        if column and column not in header:
+            raise SystemExit(
+                f"rashlyoutlaid: column '{column}' is not in the csv header {header}"
+            )
+        index = header.index(column) if column else 0
+
+        def rows() -> Iterator[Tuple[Text, Any]]:
+            for row in reader:
+                yield (row[index] if index < len(row) else ""), row
+
+        return header, rows()
+
+    if fmt == "jsonl":
+        field = column or QUERY_FIELDS[lookup]
+
+        def objects() -> Iterator[Tuple[Text, Any]]:
+            for line in fh:
+                if line.strip():
+                    obj = json.loads(line)
+                    yield str(obj.get(field, "")), obj
+
+        return None, objects()
+
+    def lines() -> Iterator[Tuple[Text, Any]]:
+        for line in fh:
+            query = line.strip()
+            if query:
+                yield query, [query]
+
+    return [QUERY_FIELDS[lookup]], lines()
+
+
+def _values(lookup: Text, record: Any) -> Dict[Text, Any]:
+    """The output fields of record (None when not found)"""
+
+    if record is None:
+        return {name: None for name in FIELDS[lookup]}
+
+    values = {name: getattr(record, name) for name in FIELDS[lookup]}
+    if "peers" in values:
+        values["peers"] = list(values["peers"])
+    for name in ("first_seen", "last_seen"):
+        if name in values and values[name] is not None:
+            values[name] = values[name].isoformat(" ")
+    if "anti_virus" in values:
+        values["anti_virus"] = [
+            {"vendor": av.vendor, "signature": av.signature}
+            for av in values["anti_virus"]
+        ]
+    return values
+
+
+def _csv_value(value: Any) -> Text:
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        if value and isinstance(value[0], dict):
+            return ";".join(f"{av['vendor']}:{av['signature']}" for av in value)
+        return " ".join(value)
+    return str(value)
+
+
+class _Writer:
+    """Write rows of the input, extended with the lookup fields"""
+
+    def __init__(
+        self,
+        fh: IO[Text],
+        fmt: Text,
+        lookup: Text,
+        header: Optional[List[Text]],
+        has_header: bool,
+    ) -> None:
+        self.fh = fh
+        self.fmt = fmt
+        self.lookup = lookup
+        self.header = header
+        if fmt == "csv":
+            self.csv = csv.writer(fh)
+            if not has_header:
+                self.csv.writerow(list(header or [QUERY_FIELDS[lookup]]) + FIELDS[lookup])
+
+    def write(self, query: Text, row: Any, record: Any) -> None:
+        values = _values(self.lookup, record)
+        if self.fmt == "csv":
+            base = row if isinstance(row, list) else [query]
+            self.csv.writerow(list(base) + [_csv_value(v) for v in values.values()])
+        elif self.fmt == "jsonl":
+            if isinstance(row, dict):
+                obj = row
+            else:
+                obj = dict(zip(self.header or [QUERY_FIELDS[self.lookup]], row))
+            obj[self.lookup] = None if record is None else values
+            self.fh.write(json.dumps(obj, ensure_ascii=False) + "\n")
+        else:
+            fields = [_csv_value(v) for v in values.values()]
+            self.fh.write("\t".join([query] + fields) + "\n")
+
+
+def _resume(path: Text, fmt: Text) -> Tuple[int, bool]:
+    """Truncate a partially written last line of the output at path and
+    return the number of complete input records it holds and whether it
+    already starts with the csv header"""
+
+    if not os.path.exists(path):
+        return 0, False
+
+    with open(path, "rb+") as fh:
+        data_end = fh.seek(0, os.SEEK_END)
+        position = data_end
+        while position > 0:
+            step = min(65536, position)
+            fh.seek(position - step)
+            chunk = fh.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position != data_end:
+            fh.truncate(position)
+
+    with open(path, newline="", encoding="utf-8") as fh:
+        if fmt == "csv":
+            count = sum(1 for _ in csv.reader(fh))
+            return max(0, count - 1), count > 0
+        return sum(1 for line in fh if line.strip()), False
+
+
+def run(args: argparse.Namespace, stdin: IO[Text], stdout: IO[Text]) -> int:
+    """Perform the enrichment described by args"""
+
+    import itertools
+
+    import RashlyOutlaid.api
+    import RashlyOutlaid.libwhois
+    import RashlyOutlaid.ratelimit
+
+    in_fmt = _format_of(args.input, args.format)
+    out_fmt = args.output_format or ("csv" if in_fmt == "text" else in_fmt)
+    if args.resume and args.output == "-":
+        raise SystemExit("rashlyoutlaid: --resume needs an --output file")
+
+    if args.rate:
+        RashlyOutlaid.ratelimit.default_limiter.configure(
+            args.rate, max(1, int(args.rate))
+        )
+
+    done, has_header = _resume(args.output, out_fmt) if args.resume else (0, False)
+    fin = stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    fout = stdout
+
+    try:
+        header, records = _read(fin, in_fmt, args.column, args.lookup)
+        if args.output != "-":
+            fout = open(
+                args.output, "a" if args.resume else "w", newline="", encoding="utf-8"
+            )
+        records = itertools.islice(records, done, None)
+        writer = _Writer(fout, out_fmt, args.lookup, header, has_header)
+
+        # the rows waiting for their lookup, bounded by the stream window
+        rows: collections.deque = collections.deque()
+
+        def queries() -> Iterator[Text]:
+            for query, row in records:
+                rows.append(row)
+                yield query
+
+        stream = getattr(RashlyOutlaid.api, f"{args.lookup}_stream")
+        for query, record in stream(queries(), args.workers, args.batch_size):
+            writer.write(query, rows.popleft(), record)
+    except (RashlyOutlaid.libwhois.QueryError, OSError) as error:
+        fout.flush()
+        print(f"rashlyoutlaid: {error}", file=sys.stderr)
+        if args.output != "-":
+            print("rashlyoutlaid: run again with --resume to continue", file=sys.stderr)
+        return 1
+    finally:
+        if fin is not stdin:
+            fin.close()
+        if fout is not stdout:
+            fout.close()
+        else:
+            fout.flush()
+    return 0
+
+
+def main(argv: Optional[List[Text]] = None) -> int:
+    args = parse_args(argv)
+    stdin = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    return run(args, stdin, sys.stdout)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import re
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Text
+
+import RashlyOutlaid.iputil
+
+_MASK64 = (1 << 64) - 1
+_MAX_ASN = (1 << 32) - 1
+_DIGITS = re.compile("[0-9]+")
+
+
+def _asn(value: Any) -> int:
+    """The asn as an uint32, from an int or a string of ASCII digits, 0 if
+    it is anything else or out of range"""
+
+    if isinstance(value, str):
+        if not _DIGITS.fullmatch(value):
+            return 0
+        value = int(value)
+    elif not isinstance(value, int) or isinstance(value, bool):
+        return 0
+    return value if 0 <= value <= _MAX_ASN else 0
+
+
+class DictColumn:
+    """Dictionary encoded string column: one uint32 code per row pointing
+    into the list of distinct values"""
+
+    def __init__(self) -> None:
+        self.codes = array("I")
+        self.values: List[Text] = []
+        self._index: Dict[Text, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, row: int) -> Text:
+        return self.values[self.codes[row]]
+
+    def append(self, value: Optional[Text]) -> None:
+        value = value or ""
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.values)
+            self.values.append(value)
+        self.codes.append(code)
+
+    def decode(self) -> List[Text]:
+        """The column as a list of strings"""
+
+        values = self.values
+        return [values[code] for code in self.codes]
+
+
+class ASNTable:
+    """Columnar result of an origin or peer lookup
+
+    Every row is one answered ip address. The columns are typed arrays:
+
+    asn         uint32
+    version     uint8, 4 or 6
+    ip_hi/lo    uint64, the queried address as integer (IPv4 in ip_lo)
+    network_hi/lo, prefixlen
+                uint64, uint8, the announced prefix
+    asname, cn, isp, peers
+                dictionary encoded (DictColumn), peers as the space
+                separated string from Shadowserver
+
+    The table is built straight from the json returned by Shadowserver
+    without creating an ASNRecord per row. to_numpy and to_arrow export the
+    columns without copying them; while such a view is alive the table
+    cannot grow and append/extend raise BufferError. Drop the views (or
+    copy them) before adding rows.
+    """
+
+    NUMERIC = (
+        "asn",
+        "version",
+        "ip_hi",
+        "ip_lo",
+        "network_hi",
+        "network_lo",
+        "prefixlen",
+    )
+    STRINGS = ("asname", "cn", "isp", "peers")
+
+    def __init__(self) -> None:
+        self.asn = array("I")
+        self.version = array("B")
+        self.ip_hi = array("Q")
+        self.ip_lo = array("Q")
+        self.network_hi = array("Q")
+        self.network_lo = array("Q")
+        self.prefixlen = array("B")
+        self.asname = DictColumn()
+        self.cn = DictColumn()
+        self.isp = DictColumn()
+        self.peers = DictColumn()
+
+    @classmethod
+    def from_json(cls, ssdata: List[Dict]) -> "ASNTable":
+        """Build a table from the result of the Shadowserver asn web api"""
+
+        table = cls()
+        table.extend(ssdata)
+        return table
+
+    def extend(self, ssdata: List[Dict]) -> None:
+        """Append the result of the Shadowserver asn web api"""
+
+        for elem in ssdata:
+            self.append(elem)
+
+    def append(self, elem: Dict) -> None:
+        """Append one element of the result of the Shadowserver asn web api"""
+
+        ip = RashlyOutlaid.iputil.pack(elem.get("ip") or "") or (0, 0)
+        network = RashlyOutlaid.iputil.pack_network(elem.get("prefix") or "") or (
+            ip[0],
+            0,
+            0,
+        )
+        self.asn.append(_asn(elem.get("asn")))
+        self.version.append(network[0] or ip[0])
+        self.ip_hi.append(ip[1] >> 64)
+        self.ip_lo.append(ip[1] & _MASK64)
+        self.network_hi.append(network[1] >> 64)
+        self.network_lo.append(network[1] & _MASK64)
+        self.prefixlen.append(network[2])
+        self.asname.append(elem.get("asname_short"))
+        self.cn.append(elem.get("geo"))
+        self.isp.append(elem.get("asname_long"))
+        self.peers.append(elem.get("peer"))
+
+    def __len__(self) -> int:
+        return len(self.asn)
+
+    def ip(self, row: int) -> Text:
+        """The queried address of row in canonical text form"""
+
+        return self._text(row, self.ip_hi, self.ip_lo)
+
+    def prefix(self, row: int) -> Text:
+        """The announced prefix of row in text form, '' if unknown"""
+
+        if not self.version[row] or (
+            not self.prefixlen[row] and not self.network_lo[row]
+        ):
+            return ""
+        network = self._text(row, self.network_hi, self.network_lo)
+        return f"{network}/{self.prefixlen[row]}"
+
+    def _text(self, row: int, hi: array, lo: array) -> Text:
+        version = self.version[row]
+        if not version:
+            return ""
+        return RashlyOutlaid.iputil.unpack((version, hi[row] << 64 | lo[row]))
+
+    def record(self, row: int) -> Any:
+        """Materialize row as an ASNRecord"""
+
+        from RashlyOutlaid.api import ASNRecord
+
+        return ASNRecord(
+            str(self.asn[row]),
+            self.prefix(row),
+            self.asname[row],
+            self.cn[row],
+            self.isp[row],
+            self.peers[row].split(),
+        )
+
+    def __iter__(self) -> Iterator:
+        """iterate over the rows as ASNRecords"""
+
+        for row in range(len(self)):
+            yield self.record(row)
+
+    def to_numpy(self) -> Dict[Text, Any]:
+        """Return the columns as numpy arrays sharing memory with the table.
+        String columns are returned as their uint32 codes ('asname') and the
+        distinct values ('asname_values'), ready for pandas.Categorical
+        .from_codes. Requires numpy."""
+
+        import numpy
+
+        columns: Dict[Text, Any] = {
+            name: numpy.frombuffer(getattr(self, name), dtype=_DTYPES[name])
+            for name in self.NUMERIC
+        }
+        for name in self.STRINGS:
+            column = getattr(self, name)
+            columns[name] = numpy.frombuffer(column.codes, dtype=numpy.uint32)
+            columns[f"{name}_values"] = numpy.array(column.values, dtype=object)
+        return columns
+
+    def to_arrow(self) -> Any:
+        """Return the table as a pyarrow.Table. Numeric columns and the codes
+        of the dictionary columns share memory with the table. Requires
+        pyarrow."""
+
+        import pyarrow
+
+        arrays = []
+        for name in self.NUMERIC:
+            column = getattr(self, name)
+            arrays.append(
+                pyarrow.Array.from_buffers(
+                    getattr(pyarrow, _DTYPES[name])(),
+                    len(column),
+                    [None, pyarrow.py_buffer(column)],
+                )
+            )
+        for name in self.STRINGS:
+            column = getattr(self, name)
+            indices = pyarrow.Array.from_buffers(
+                pyarrow.uint32(), len(column), [None, pyarrow.py_buffer(column.codes)]
+            )
+            arrays.append(
+                pyarrow.DictionaryArray.from_arrays(
+                    indices, pyarrow.array(column.values, pyarrow.string())
+                )
+            )
+        return pyarrow.Table.from_arrays(arrays, names=[*self.NUMERIC, *self.STRINGS])
+
+
+_DTYPES = {
+    "asn": "uint32",
+    "version": "uint8",
+    "ip_hi": "uint64",
+    "ip_lo": "uint64",
+    "network_hi": "uint64",
+    "network_lo": "uint64",
+    "prefixlen": "uint8",
+}
+
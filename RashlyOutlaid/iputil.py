@@ -0,0 +1,115 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import socket
+from typing import Iterable, List, Optional, Text, Tuple, Union
+
+# (version, address as integer)
+Packed = Tuple[int, int]
+
+
+def pack(ip_address: Union[Text, bytes]) -> Optional[Packed]:
+    """Return ip_address (IPv4 or IPv6, text or bytes) as (version, integer),
+    or None if it is not a valid address (or not text at all).
+
+    Uses inet_pton, which is considerably faster than the ipaddress module
+    and rejects ambiguous forms such as leading zeros in IPv4 octets."""
+
+    if isinstance(ip_address, bytes):
+        ip_address = ip_address.decode("ascii", "ignore")
+    elif not isinstance(ip_address, str):
+        return None
+    ip_address = ip_address.strip()
+
+    family = socket.AF_INET6 if ":" in ip_address else socket.AF_INET
+    try:
+        packed = socket.inet_pton(family, ip_address)
+    except (OSError, ValueError):
+        return None
+    return (6 if family == socket.AF_INET6 else 4), int.from_bytes(packed, "big")
+
+
+def unpack(packed: Packed) -> Text:
+    """Return the canonical text form of a packed address"""
+
+    version, value = packed
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, value.to_bytes(4, "big"))
+    return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, "big"))
+
+
+def normalize(ip_address: Union[Text, bytes]) -> Optional[Text]:
+    """Canonical text form of ip_address ('2001:DB8:0::1' -> '2001:db8::1'),
+    or None if it is not a valid address"""
+
+    packed = pack(ip_address)
+    return None if packed is None else unpack(packed)
+
+
+def pack_many(
+    ip_addresses: Iterable[Union[Text, bytes]]
+) -> Tuple[List[Optional[Packed]], List[Text]]:
+    """Pack a whole list of addresses, calling pack for each of them. Return
+    the packed addresses (None for the invalid ones, keeping the positions of
+    the input) and the list of invalid addresses"""
+
+    ip_addresses = list(ip_addresses)
+    packed = [pack(ip_address) for ip_address in ip_addresses]
+    invalid = [
+        ip_address if isinstance(ip_address, str) else repr(ip_address)
+        for ip_address, value in zip(ip_addresses, packed)
+        if value is None
+    ]
+    return packed, invalid
+
+
+def normalize_many(
+    ip_addresses: Iterable[Union[Text, bytes]]
+) -> Tuple[List[Optional[Text]], List[Text]]:
+    """Normalize a whole list of addresses, one at a time. Return the
+    canonical addresses (None for the invalid ones, keeping the positions of
+    the input) and the list of invalid addresses"""
+
+    packed, invalid = pack_many(ip_addresses)
+    return [None if p is None else unpack(p) for p in packed], invalid
+
+
+def pack_network(network: Text) -> Optional[Tuple[int, int, int]]:
+    """Return a prefix such as '8.8.8.0/24' as (version, network address as
+    integer, prefix length), or None if it is not a valid prefix. Host bits
+    are cleared."""
+
+    address, _, length = network.partition("/")
+    packed = pack(address)
+    if packed is None:
+        return None
+
+    version, value = packed
+    bits = 32 if version == 4 else 128
+    try:
+        prefixlen = int(length) if length else bits
+    except ValueError:
+        return None
+    if not 0 <= prefixlen <= bits:
+        return None
+
+    mask = ((1 << prefixlen) - 1) << (bits - prefixlen)
+    return version, value & mask, prefixlen
@@ -22,8 +22,26 @@ furnished to do so, subject to the following conditions:
 
 
 import socket
+import threading
+import time
 from collections import namedtuple
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    from RashlyOutlaid import metrics
+except SyntaxError:
+    # python 2 cannot import the (annotated) metrics module, go without
+    metrics = None
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
 try:
     text_type = unicode
     binary_type = str
@@ -61,67 +79,209 @@ def asbinary(data):
     return data
 
 
+# Number of bytes read from the socket at the time
+DEFAULT_RECV_SIZE = 65536
+
+# Upper bound of concurrent connections of a parallel bulk query, to stay
+# polite to the service
+MAX_CONNECTIONS = 4
+
+# Records buffered between the connections of a parallel bulk query and its
+# consumer
+PARALLEL_QUEUE_SIZE = 1024
+
+
 class Whois(object):
 
-    def __init__(self, address=None, port=43, timeout=30):
+    def __init__(self, address=None, port=43, timeout=30, recv_size=DEFAULT_RECV_SIZE):
         self.address = address
         self.port = port
         self.timeout = timeout
+        self.recv_size = recv_size
         self._connection = None
         self.buffer = ""
+        self.sent = 0
+        self.received = 0
 
     def connect(self):
         self._connection = socket.create_connection((self.address, self.port), self.timeout)
+        self.sent = 0
+        self.received = 0
 
     def send(self, query):
-        self._connection.send(b"".join([query, b"\n"]))
+        data = b"".join([query, b"\n"])
+        self._connection.send(data)
+        self.sent += len(data)
 
     def read(self):
-        self.buffer = ""
+        """Read the whole response into self.buffer"""
+        chunks = []
         while 1:
-            data = self._connection.recv(1024)
+            data = self._connection.recv(self.recv_size)
             if not data:
                 self._connection.close()
-                return
-            self.buffer += astext(data)
+                break
+            self.received += len(data)
+            chunks.append(data)
+        # decode once, so multibyte characters split between reads survive
+        self.buffer = astext(b"".join(chunks))
+
+    def iter_lines(self):
+        """Read the response incrementally, yielding each line as it arrives"""
+        pending = b""
+        try:
+            while 1:
+                data = self._connection.recv(self.recv_size)
+                if not data:
+                    break
+                self.received += len(data)
+                lines = (pending + data).split(b"\n")
+                pending = lines.pop()
+                for line in lines:
+                    yield astext(line)
+            if pending:
+                yield astext(pending)
+        finally:
+            self._connection.close()
 
 
 class ASNWhois(Whois):
 
-    def __init__(self, address="asn.shadowserver.org", port=43, timeout=30):
-        super(ASNWhois, self).__init__(address=address, port=port, timeout=timeout)
+    def __init__(self, address="asn.shadowserver.org", port=43, timeout=30, recv_size=DEFAULT_RECV_SIZE,
+                 connections=1):
+        super(ASNWhois, self).__init__(address=address, port=port, timeout=timeout, recv_size=recv_size)
         self._query = ""
         self._result = {}
         self._peers = False
         self._multiple = False
         self._base_idx = 0
+        self._connections = 1
+        self.connections = connections
 
     def get_result(self):
         if self._result: return self._result
-        self._perform_query()
-        self._base_idx = 0
-        if self._multiple:
-            self._base_idx += 1
-        if self.peers:
-            self._base_idx += 1
-        self._result = {}
-        for line in self.buffer.split('\n'):
-            elements = [element.strip() for element in line.split('|')]
-            if not len(elements) >= 6: continue # empty lines
-            asdata = elements[self._base_idx:]
-            if self.peers:
-                asdata.append(elements[self._base_idx - 1].split())
-            else:
-                asdata.append([])
-            if self._multiple and self._peers:
-                query = elements[self._base_idx - 2]
-            elif self._multiple:
-                query = elements[self._base_idx - 1]
-            else:
-                query = self.query
-            self._result[astext(query)] = ASNRecord(*asdata)
+        result = {}
+        for query, record in self.iter_results():
+            result[query] = record
+        if isinstance(self._query, list) and self._connections > 1 and len(self._query) > 1:
+            # the shards complete in any order, keep the order of the query
+            ordered = {}
+            for query in self._query:
+                query = astext(query)
+                if query in result:
+                    ordered[query] = result.pop(query)
+            ordered.update(result)
+            result = ordered
+        self._result = result
         return self._result
 
+    def iter_results(self):
+        """Perform the query and yield (query, ASNRecord) as the lines of the
+        response arrive. The records are not retained, so iterating a bulk
+        query needs constant memory; use result to collect them."""
+        if self._result:
+            for item in self._result.items():
+                yield item
+            return
+        parallel = isinstance(self._query, list) and self._connections > 1 and len(self._query) > 1
+        if parallel:
+            items = self._iter_parallel()
+        else:
+            items = self._iter_connection()
+        for item in items:
+            yield item
+
+    def _iter_connection(self):
+        if metrics is None or not metrics.observers:
+            for parsed in self._iter_lines_parsed():
+                yield parsed
+            return
+        endpoint = "whois_peer" if self._peers else "whois_origin"
+        metrics.batch(endpoint, len(self._query) if isinstance(self._query, list) else 1)
+        started = _clock()
+        status = "ok"
+        try:
+            for parsed in self._iter_lines_parsed():
+                yield parsed
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            metrics.request(endpoint, status, _clock() - started, self.sent, self.received)
+
+    def _iter_lines_parsed(self):
+        self._perform_query()
+        self._base_idx = base_index(self._multiple, self._peers)
+        for line in self.iter_lines():
+            parsed = self._parse_line(line)
+            if parsed is None: continue
+            yield parsed
+
+    def _iter_parallel(self):
+        """Shard the bulk query over self.connections connections, each
+        running its own begin/end block, and yield the records as they
+        arrive from any of them"""
+        for query in self._query:
+            if not is_ip(query): raise QueryError("Not an IPv4 address " + astext(query))
+        self._multiple = True
+        shards = self._shards()
+        # bounded, so a slow consumer holds back the connections instead of
+        # having the responses pile up
+        items = queue.Queue(PARALLEL_QUEUE_SIZE)
+        done = object()
+        stopped = threading.Event()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def worker(shard):
+            asnwhois = ASNWhois(self.address, self.port, self.timeout, self.recv_size)
+            asnwhois.peers = self._peers
+            asnwhois.query = shard
+            records = asnwhois._iter_connection()
+            try:
+                for item in records:
+                    if not put((item, None)):
+                        return
+            except Exception as error:
+                put((None, error))
+            finally:
+                records.close()
+                put((done, None))
+
+        threads = [threading.Thread(target=worker, args=(shard,)) for shard in shards]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        remaining = len(threads)
+        try:
+            while remaining:
+                item, error = items.get()
+                if error is not None:
+                    raise error
+                if item is done:
+                    remaining -= 1
+                    continue
+                yield item
+        finally:
+            # the consumer stopped (or failed), let the workers close their
+            # connections
+            stopped.set()
+
+    def _shards(self):
+        connections = min(self._connections, len(self._query))
+        size = -(-len(self._query) // connections)
+        return [self._query[start:start + size] for start in range(0, len(self._query), size)]
+
+    def _parse_line(self, line):
+        return parse_line(line, self._base_idx, self._peers, self._multiple, self.query)
+
     def set_result(self, vals):
         raise QueryError("Read only property: Result")
 
@@ -134,6 +294,15 @@ class ASNWhois(Whois):
     def get_peers(self):
         return self._peers
 
+    def set_connections(self, connections):
+        if not isinstance(connections, int) or not 1 <= connections <= MAX_CONNECTIONS:
+            raise QueryError("connections must be an integer from 1 to %d" % MAX_CONNECTIONS)
+        self._result = {}
+        self._connections = connections
+
+    def get_connections(self):
+        return self._connections
+
     def set_query(self, query):
         self._query = query
         self._result = {}
@@ -159,7 +328,6 @@ class ASNWhois(Whois):
             self.send(b" ".join([b"peer", asbinary(self._query)]))
         else:
             self.send(b" ".join([b"origin", asbinary(self._query)]))
-        self.read()
 
     def _query_multiple(self):
         self.connect()
@@ -173,13 +341,36 @@ class ASNWhois(Whois):
                 raise QueryError("Not an IPv4 address " + query)
             self.send(asbinary(query))
         self.send(b"end")
-        self.read()
 
     result = property(get_result, set_result)
     peers = property(get_peers, set_peers)
+    connections = property(get_connections, set_connections)
     query = property(get_query, set_query)
 
 
+def base_index(multiple, peers):
+    """Index of the first ASNRecord field in a response line"""
+    return int(bool(multiple)) + int(bool(peers))
+
+
+def parse_line(line, base_idx, peers, multiple, query):
+    """Parse a line of a whois response into (query, ASNRecord), or None
+    for lines that hold no record. query is the single query of a non bulk
+    request, bulk responses carry the query in the line itself."""
+    elements = [element.strip() for element in line.split('|')]
+    if not len(elements) >= 6: return None # empty lines
+    asdata = elements[base_idx:]
+    if peers:
+        asdata.append(elements[base_idx - 1].split())
+    else:
+        asdata.append([])
+    if multiple and peers:
+        query = elements[base_idx - 2]
+    elif multiple:
+        query = elements[base_idx - 1]
+    return astext(query), ASNRecord(*asdata)
+
+
 def is_ip(data):
     if not isinstance(data, text_type) and not isinstance(data, binary_type): return False
     data = astext(data)
@@ -188,7 +379,7 @@ def is_ip(data):
     for c, t in enumerate(elements):
         try:
             v = int(t)
-            if not ((c > 0 and v >= 0 and v < 256) or (c == 0 and v >= 1 and c < 256)): return False
+            if not ((c > 0 and v >= 0 and v < 256) or (c == 0 and v >= 1 and v < 256)): return False
         except ValueError:
             return False
     return True
@@ -0,0 +1,264 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import bisect
+import collections
+import threading
+from typing import Dict, List, Sequence, Text, Tuple
+
+# Observers notified of every lookup. Replaced (never changed in place) by
+# register and unregister, so the instrumented code can test and iterate it
+# without taking a lock. Empty, the instrumentation costs a single test.
+observers: Tuple["Observer", ...] = ()
+
+_lock = threading.Lock()
+
+# Upper bounds of the buckets of the Collector histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_BUCKETS = (1, 5, 10, 50, 100, 250, 500, 1000)
+
+
+class Observer:
+    """Receives the metrics of RashlyOutlaid lookups
+
+    Every hook does nothing; subclass and override the ones of interest, then
+    register the observer. Hooks are called on the thread (or event loop)
+    performing the lookup and should return quickly.
+
+    endpoint names the lookup: origin, peer, malware, asn and prefix for the
+    web api, whois_origin and whois_peer for the whois service.
+    """
+
+    def request(
+        self, endpoint: Text, status: Text, seconds: float, sent: int, received: int
+    ) -> None:
+        """A http request or whois session completed. status is the http
+        status code, "ok", or "error" when no response was received. sent and
+        received are the bytes of the query (url or whois lines) and of the
+        response body"""
+
+    def batch(self, endpoint: Text, size: int) -> None:
+        """A batch of size queries is about to be sent"""
+
+    def retry(self, endpoint: Text, attempt: int, delay: float) -> None:
+        """A failed request is retried (attempt counts from 1) after delay
+        seconds"""
+
+    def rate_limit_wait(self, seconds: float) -> None:
+        """A request waited seconds for the rate limiter"""
+
+    def cache(self, name: Text, hits: int, misses: int) -> None:
+        """A lookup was answered from cache name (prefix, asn or malware),
+        hits queries found and misses not found"""
+
+
+def register(observer: Observer) -> Observer:
+    """Notify observer of all lookups from now on"""
+
+    global observers
+
+    with _lock:
+        if observer not in observers:
+            observers = observers + (observer,)
+    return observer
+
+
+def unregister(observer: Observer) -> None:
+    """Stop notifying observer"""
+
+    global observers
+
+    with _lock:
+        observers = tuple(o for o in observers if o is not observer)
+
+
+def request(
+    endpoint: Text, status: Text, seconds: float, sent: int, received: int
+) -> None:
+    for observer in observers:
+        observer.request(endpoint, status, seconds, sent, received)
+
+
+def batch(endpoint: Text, size: int) -> None:
+    for observer in observers:
+        observer.batch(endpoint, size)
+
+
+def retry(endpoint: Text, attempt: int, delay: float) -> None:
+    for observer in observers:
+        observer.retry(endpoint, attempt, delay)
+
+
+def rate_limit_wait(seconds: float) -> None:
+    for observer in observers:
+        observer.rate_limit_wait(seconds)
+
+
+def cache(name: Text, hits: int, misses: int) -> None:
+    for observer in observers:
+        observer.cache(name, hits, misses)
+
+
+class Histogram:
+    """Counts of observed values per bucket, with their sum"""
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[Text, int]]:
+        """(le, count of values <= le) for every bucket and +Inf"""
+
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else _number(bound), total))
+        return result
+
+
+class Collector(Observer):
+    """Thread safe, in-process observer keeping counters and histograms of
+    all lookups, rendered in the Prometheus text exposition format:
+
+    collector = metrics.register(metrics.Collector())
+    ...
+    print(collector.render())
+    """
+
+    def __init__(self, prefix: Text = "rashlyoutlaid") -> None:
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.latency: Dict[Text, Histogram] = {}
+        self.batch_size: Dict[Text, Histogram] = {}
+        self.requests: Dict[Tuple[Text, Text], int] = collections.Counter()
+        self.bytes_sent: Dict[Text, int] = collections.Counter()
+        self.bytes_received: Dict[Text, int] = collections.Counter()
+        self.retries: Dict[Text, int] = collections.Counter()
+        self.cache_hits: Dict[Text, int] = collections.Counter()
+        self.cache_misses: Dict[Text, int] = collections.Counter()
+        self.rate_limit_waits = 0
+        self.rate_limit_seconds = 0.0
+
+    def request(
+        self, endpoint: Text, status: Text, seconds: float, sent: int, received: int
+    ) -> None:
+        with self._lock:
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+            self.latency[endpoint].observe(seconds)
+            self.requests[(endpoint, status)] += 1
+            self.bytes_sent[endpoint] += sent
+            self.bytes_received[endpoint] += received
+
+    def batch(self, endpoint: Text, size: int) -> None:
+        with self._lock:
+            if endpoint not in self.batch_size:
+                self.batch_size[endpoint] = Histogram(BATCH_BUCKETS)
+            self.batch_size[endpoint].observe(size)
+
+    def retry(self, endpoint: Text, attempt: int, delay: float) -> None:
+        with self._lock:
+            self.retries[endpoint] += 1
+
+    def rate_limit_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.rate_limit_waits += 1
+            self.rate_limit_seconds += seconds
+
+    def cache(self, name: Text, hits: int, misses: int) -> None:
+        with self._lock:
+            self.cache_hits[name] += hits
+            self.cache_misses[name] += misses
+
+    def hit_ratio(self, name: Text) -> float:
+        """hits / (hits + misses) of cache name, 0.0 before the first lookup"""
+
+        with self._lock:
+            total = self.cache_hits[name] + self.cache_misses[name]
+            return self.cache_hits[name] / total if total else 0.0
+
+    def render(self) -> Text:
+        """The metrics in the Prometheus text exposition format"""
+
+        p = self.prefix
+        lines: List[Text] = []
+
+        def family(name: Text, kind: Text, help: Text) -> None:
+            lines.append(f"# HELP {p}_{name} {help}")
+            lines.append(f"# TYPE {p}_{name} {kind}")
+
+        def histogram(name: Text, label: Text, histograms: Dict[Text, Histogram]) -> None:
+            for value, hist in sorted(histograms.items()):
+                for le, count in hist.cumulative():
+                    lines.append(f'{p}_{name}_bucket{{{label}="{value}",le="{le}"}} {count}')
+                lines.append(f'{p}_{name}_sum{{{label}="{value}"}} {_number(hist.sum)}')
+                lines.append(f'{p}_{name}_count{{{label}="{value}"}} {hist.count}')
+
+        def counter(name: Text, label: Text, values: Dict[Text, int]) -> None:
+            for value, count in sorted(values.items()):
+                lines.append(f'{p}_{name}{{{label}="{value}"}} {_number(count)}')
+
+        with self._lock:
+            family("request_duration_seconds", "histogram", "Latency of requests")
+            histogram("request_duration_seconds", "endpoint", self.latency)
+
+            family("requests_total", "counter", "Requests by endpoint and status")
+            for (endpoint, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'{p}_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+                )
+
+            family("sent_bytes_total", "counter", "Bytes of queries sent")
+            counter("sent_bytes_total", "endpoint", self.bytes_sent)
+            family("received_bytes_total", "counter", "Bytes of responses received")
+            counter("received_bytes_total", "endpoint", self.bytes_received)
+
+            family("batch_size", "histogram", "Queries per request")
+            histogram("batch_size", "endpoint", self.batch_size)
+
+            family("retries_total", "counter", "Retried requests")
+            counter("retries_total", "endpoint", self.retries)
+
+            family("rate_limit_wait_seconds_total", "counter", "Time waited for the rate limiter")
+            lines.append(f"{p}_rate_limit_wait_seconds_total {_number(self.rate_limit_seconds)}")
+            family("rate_limit_waits_total", "counter", "Requests that waited for the rate limiter")
+            lines.append(f"{p}_rate_limit_waits_total {self.rate_limit_waits}")
+
+            family("cache_hits_total", "counter", "Queries answered from a cache")
+            counter("cache_hits_total", "cache", self.cache_hits)
+            family("cache_misses_total", "counter", "Queries not found in a cache")
+            counter("cache_misses_total", "cache", self.cache_misses)
+
+        return "\n".join(lines) + "\n"
+
+
+def _number(value: float) -> Text:
+    """Format a sample value, without a trailing .0 for whole numbers"""
+
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,173 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Text, Tuple
+
+import RashlyOutlaid.iputil
+
+# Default bounds of a PrefixCache
+DEFAULT_MAXSIZE = 100000
+DEFAULT_TTL = 24 * 60 * 60
+
+
+class _Node:
+    """Node in the binary trie. entry is (expires, record) for nodes that
+    hold an announced prefix"""
+
+    __slots__ = ("parent", "children", "entry", "key")
+
+    def __init__(self, parent: Optional["_Node"] = None) -> None:
+        self.parent = parent
+        self.children: list = [None, None]
+        self.entry: Optional[Tuple[float, Any]] = None
+        self.key: Optional[Tuple[int, int, int]] = None
+
+
+class PrefixCache:
+    """Longest prefix match cache of origin lookups
+
+    Records are stored in a binary (radix) trie keyed by their announced
+    prefix, so any ip address within a prefix already seen is answered
+    without asking Shadowserver again. Entries expire after ttl seconds and
+    the least recently used prefixes are evicted when more than maxsize
+    prefixes are cached.
+
+    cache = PrefixCache()
+    cache.add(ASNRecord("3356", "4.0.0.0/9", "LEVEL3", "US", "LEVEL3", []))
+    cache.lookup("4.2.2.4")  # -> the LEVEL3 record
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE, ttl: float = DEFAULT_TTL) -> None:
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be a positive integer, got {maxsize}")
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._roots = {4: _Node(), 6: _Node()}
+        self._lru: "OrderedDict[Tuple[int, int, int], _Node]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def add(self, record: Any) -> bool:
+        """Cache record (anything with a prefix attribute) under its prefix.
+        Return False if the record has no valid prefix."""
+
+        key = RashlyOutlaid.iputil.pack_network(record.prefix or "")
+        if key is None:
+            return False
+
+        version, value, prefixlen = key
+        bits = 32 if version == 4 else 128
+
+        with self._lock:
+            node = self._roots[version]
+            for depth in range(prefixlen):
+                bit = (value >> (bits - 1 - depth)) & 1
+                if node.children[bit] is None:
+                    node.children[bit] = _Node(node)
+                node = node.children[bit]
+
+            node.entry = (time.monotonic() + self.ttl, record)
+            node.key = key
+            self._lru[key] = node
+            self._lru.move_to_end(key)
+
+            while len(self._lru) > self.maxsize:
+                _, evicted = self._lru.popitem(last=False)
+                self._remove(evicted)
+                self.evictions += 1
+
+        return True
+
+    def lookup(self, ip_address: Text) -> Optional[Any]:
+        """Return the record of the longest cached prefix containing
+        ip_address, or None"""
+
+        packed = RashlyOutlaid.iputil.pack(ip_address)
+        if packed is None:
+            return None
+        return self.lookup_packed(packed)
+
+    def lookup_packed(self, packed: RashlyOutlaid.iputil.Packed) -> Optional[Any]:
+        """Return the record of the longest cached prefix containing the
+        packed (version, integer) address, or None"""
+
+        version, value = packed
+        bits = 32 if version == 4 else 128
+        now = time.monotonic()
+        found: Optional[_Node] = None
+        expired = []
+
+        with self._lock:
+            node: Optional[_Node] = self._roots[version]
+            for depth in range(bits + 1):
+                if node is None:
+                    break
+                if node.entry is not None:
+                    if node.entry[0] > now:
+                        found = node
+                    else:
+                        expired.append(node)
+                if depth < bits:
+                    node = node.children[(value >> (bits - 1 - depth)) & 1]
+
+            for node in expired:
+                self._lru.pop(node.key, None)
+                self._remove(node)
+
+            if found is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._lru.move_to_end(found.key)
+            return found.entry[1]
+
+    def clear(self) -> None:
+        """Remove all cached prefixes"""
+
+        with self._lock:
+            self._roots = {4: _Node(), 6: _Node()}
+            self._lru.clear()
+
+    def _remove(self, node: _Node) -> None:
+        """Drop the entry of node and prune the branches left empty"""
+
+        node.entry = None
+        node.key = None
+        while (
+            node.parent is not None
+            and node.entry is None
+            and node.children[0] is None
+            and node.children[1] is None
+        ):
+            parent = node.parent
+            parent.children[parent.children.index(node)] = None
+            node.parent = None
+            node = parent
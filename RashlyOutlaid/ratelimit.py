@@ -0,0 +1,105 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import threading
+import time
+
+# The Shadowserver API is limited to 10 queries per second (January 2021)
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 10
+
+
+class RateLimiter:
+    """Thread safe token bucket rate limiter
+
+    The bucket holds at most burst tokens and is refilled with rate tokens per
+    second. Every request takes one token, waiting for the bucket to refill if
+    it is empty. Waiting callers reserve their token up front, so concurrent
+    threads are served in the order they arrive.
+
+    The time spent waiting is exposed through last_wait (for the calling
+    thread), total_wait and throttled (number of calls that had to wait).
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST) -> None:
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.rate = 0.0
+        self.burst = 0
+        self.configure(rate, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self.calls = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+
+    def configure(self, rate: float, burst: int) -> None:
+        """Change the rate (tokens per second) and burst (bucket size)"""
+
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        if burst < 1:
+            raise ValueError(f"burst must be a positive integer, got {burst}")
+
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = burst
+
+    def reserve(self, tokens: int = 1) -> float:
+        """Take tokens from the bucket without blocking and return the number
+        of seconds the caller must wait before using them"""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                float(self.burst), self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= tokens
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            self.calls += 1
+            if delay > 0:
+                self.throttled += 1
+                self.total_wait += delay
+
+        self._local.last_wait = delay
+        return delay
+
+    def acquire(self, tokens: int = 1) -> float:
+        """Block until tokens are available and return the time waited"""
+
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    @property
+    def last_wait(self) -> float:
+        """Seconds the last call from the current thread waited for a token"""
+
+        return getattr(self._local, "last_wait", 0.0)
+
+
+# Shared by every client (and thereby every module level api function) unless
+# a client is given its own limiter. Change the limits with
+# default_limiter.configure(rate, burst)
+default_limiter = RateLimiter()
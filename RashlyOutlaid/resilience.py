@@ -0,0 +1,208 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Optional, Text, Union
+
+import RashlyOutlaid.libwhois
+
+# Responses worth trying again: rate limited or a (temporary) server error
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class CircuitOpenError(RashlyOutlaid.libwhois.QueryError):
+    """Raised without contacting Shadowserver while the circuit is open"""
+
+
+class DeadlineExceeded(RashlyOutlaid.libwhois.QueryError):
+    """Raised when the deadline of a call has passed"""
+
+
+class RetryPolicy:
+    """When and how long to wait before repeating a failed request
+
+    A request is tried at most retries + 1 times. The n'th retry waits a
+    random time between 0 and min(max_backoff, backoff * 2 ** n) seconds
+    ("full jitter", so that clients failing together do not retry together),
+    unless the server asks for a longer wait with Retry-After.
+    """
+
+    def __init__(
+        self,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        jitter: bool = True,
+        statuses: frozenset = RETRY_STATUSES,
+    ) -> None:
+        if retries < 0:
+            raise ValueError(f"retries must not be negative, got {retries}")
+
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = statuses
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt (starting at 0)"""
+
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_backoff))
+        return delay
+
+
+# Retry policy of clients not given one
+DEFAULT_RETRY = RetryPolicy()
+
+
+def parse_retry_after(value: Optional[Text]) -> Optional[float]:
+    """Parse a Retry-After header (seconds or a http date) into seconds from
+    now. Returns None if the header is missing or not understood."""
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """Thread safe circuit breaker
+
+    After failure_threshold consecutive failures the circuit opens and calls
+    fail fast with CircuitOpenError for reset_timeout seconds. Then a single
+    trial call is let through (half open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        if failure_threshold < 1:
+            raise ValueError(
+                f"failure_threshold must be a positive integer, got {failure_threshold}"
+            )
+
+        self._lock = threading.Lock()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened = 0.0
+        self._state = self.CLOSED
+
+    @property
+    def state(self) -> Text:
+        """closed, open or half_open"""
+
+        with self._lock:
+            if (
+                self._state == self.OPEN
+                and time.monotonic() - self._opened >= self.reset_timeout
+            ):
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may be made now"""
+
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+
+            remaining = self.reset_timeout - (time.monotonic() - self._opened)
+            if self._state == self.OPEN and remaining <= 0:
+                # let this call through as the trial, others keep failing fast
+                self._state = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError(
+                f"Circuit open after {self.failures} failures, "
+                f"retrying in {max(remaining, 0.0):.1f}s"
+            )
+
+    def success(self) -> None:
+        """Record a successful call"""
+
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def failure(self) -> None:
+        """Record a failed call"""
+
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened = time.monotonic()
+
+    def reset(self) -> None:
+        """Close the circuit"""
+
+        self.success()
+
+
+class Deadline:
+    """Absolute point in time a call must be finished by"""
+
+    __slots__ = ("expires",)
+
+    def __init__(self, seconds: float) -> None:
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def of(cls, deadline: Union[None, float, "Deadline"]) -> Optional["Deadline"]:
+        """A Deadline from a budget in seconds, or deadline as is if it
+        already is a Deadline (or None)"""
+
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self) -> float:
+        """Seconds left, 0 when the deadline has passed"""
+
+        return max(0.0, self.expires - time.monotonic())
+
+    def check(self, what: Any) -> None:
+        """Raise DeadlineExceeded if the deadline has passed"""
+
+        if self.remaining() <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded while requesting '{what}'")
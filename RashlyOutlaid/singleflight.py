@@ -0,0 +1,128 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Tuple
+
+# Result of a key the lookup did not find
+MISSING = object()
+
+
+class SingleFlight:
+    """Coalesce concurrent lookups of the same keys
+
+    While a lookup of a key is in flight, other threads asking for the same
+    key wait for its result instead of looking it up again. Keys are only
+    shared while in flight, nothing is cached afterwards. An exception raised
+    by the lookup is raised in every caller waiting for its keys.
+
+    flight = SingleFlight()
+    found = flight.do_many("origin", ips, lambda ips: lookup(ips))
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[Hashable, Hashable], concurrent.futures.Future] = {}
+
+    def do(self, key: Hashable, lookup: Callable[[], Any]) -> Any:
+        """Return lookup(), or the result of the lookup of key already in
+        flight"""
+
+        with self._lock:
+            future = self._calls.get((None, key))
+            owner = future is None
+            if owner:
+                future = self._calls[(None, key)] = concurrent.futures.Future()
+
+        if not owner:
+            return future.result()  # type: ignore
+
+        try:
+            result = lookup()
+        except BaseException as error:
+            self._finish([(None, key)], {}, error)
+            raise
+        self._finish([(None, key)], {(None, key): result}, None)
+        return result
+
+    def do_many(
+        self,
+        namespace: Hashable,
+        keys: Iterable[Hashable],
+        lookup: Callable[[List[Hashable]], Dict[Hashable, Any]],
+    ) -> Dict[Hashable, Any]:
+        """Look up the keys (within namespace) that are not already in flight
+        with lookup(keys) -> {key: value} and wait for the others. Return
+        {key: value} for the keys found, by this or the other lookups."""
+
+        owned: List[Hashable] = []
+        waiting: List[Tuple[Hashable, concurrent.futures.Future]] = []
+        with self._lock:
+            for key in keys:
+                future = self._calls.get((namespace, key))
+                if future is None:
+                    self._calls[(namespace, key)] = concurrent.futures.Future()
+                    owned.append(key)
+                else:
+                    waiting.append((key, future))
+
+        found: Dict[Hashable, Any] = {}
+        if owned:
+            flights = [(namespace, key) for key in owned]
+            try:
+                found = lookup(owned)
+            except BaseException as error:
+                self._finish(flights, {}, error)
+                raise
+            self._finish(
+                flights,
+                {(namespace, key): found.get(key, MISSING) for key in owned},
+                None,
+            )
+
+        result = {key: found[key] for key in owned if key in found}
+        for key, future in waiting:
+            value = future.result()
+            if value is not MISSING:
+                result[key] = value
+        return result
+
+    def _finish(
+        self,
+        flights: List[Tuple[Hashable, Hashable]],
+        results: Dict[Tuple[Hashable, Hashable], Any],
+        error: Any,
+    ) -> None:
+        """Take the flights out of the table and wake their waiters"""
+
+        with self._lock:
+            futures = [self._calls.pop(flight) for flight in flights]
+        for flight, future in zip(flights, futures):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[flight])
+
+    def __len__(self) -> int:
+        """Number of keys in flight"""
+
+        return len(self._calls)
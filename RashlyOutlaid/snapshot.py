@@ -0,0 +1,453 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+import array
+import bisect
+import concurrent.futures
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Text, Tuple, Union
+
+import RashlyOutlaid.iputil
+
+# A snapshot file is a header followed by 8 byte aligned sections of arrays
+# in native byte order:
+#
+#   asn      u32   the asns, sorted
+#   fetched  f64   when each asn was fetched (epoch)
+#   refs     u32   (offset, length) in strings of asname, cn, isp and the
+#                  comma separated prefixes of each asn
+#   v4       u32 start, u32 end, u8 prefixlen, u32 asn index of the disjoint,
+#            sorted IPv4 intervals; nested prefixes are split so every
+#            address maps to its most specific prefix
+#   v6       u64 start hi/lo, u64 end hi/lo, u8 prefixlen, u32 asn index
+#   strings  utf-8
+MAGIC = b"ROSNAP\0\0"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sIIdIIII")
+_REFS = 8
+
+# Lookups a build runs at the time. The client's rate limiter keeps them
+# within the Shadowserver limit.
+DEFAULT_WORKERS = 4
+
+
+class SnapshotError(ValueError):
+    """Raised when a file is not a (complete) snapshot of this version and
+    byte order"""
+
+
+@dataclass
+class BuildReport:
+    """Result of build_snapshot: the asns fetched from Shadowserver, the ones
+    reused from the previous snapshot and the ones that could not be fetched
+    (with their errors)"""
+
+    fetched: List[int] = field(default_factory=list)
+    reused: List[int] = field(default_factory=list)
+    failed: Dict[int, Exception] = field(default_factory=dict)
+
+
+@dataclass
+class _ASN:
+    asn: int
+    fetched: float
+    asname: Text
+    cn: Text
+    isp: Text
+    prefixes: List[Text]
+
+
+def build_snapshot(
+    path: Text,
+    asns: Iterable[int],
+    client: Any = None,
+    max_age: Optional[float] = None,
+    refresh: Iterable[int] = (),
+    workers: int = DEFAULT_WORKERS,
+) -> BuildReport:
+    """Fetch the prefixes (api.prefix) and names (api.asn) of the asns and
+    compile them into a snapshot file at path.
+
+    If path holds a snapshot already, only asns that are new, listed in
+    refresh or fetched more than max_age seconds ago are fetched again; the
+    others are copied from the old snapshot, and asns not in asns dropped.
+    An asn that fails keeps its old entry, if any. The new file replaces the
+    old one atomically, readers of the old one keep their (unlinked) copy.
+    """
+
+    import RashlyOutlaid.api
+
+    if client is None:
+        client = RashlyOutlaid.api.default_client()
+
+    asns = sorted(set(int(asn) for asn in asns))
+    refresh = set(int(asn) for asn in refresh)
+    previous: Dict[int, _ASN] = {}
+    if os.path.exists(path):
+        with Snapshot(path) as old:
+            previous = {entry.asn: entry for entry in old._entries()}
+
+    now = time.time()
+    report = BuildReport()
+    entries: Dict[int, _ASN] = {}
+    wanted = []
+    for asn in asns:
+        old_entry = previous.get(asn)
+        if (
+            old_entry is not None
+            and asn not in refresh
+            and (max_age is None or now - old_entry.fetched < max_age)
+        ):
+            entries[asn] = old_entry
+            report.reused.append(asn)
+        else:
+            wanted.append(asn)
+
+    def fetch(asn: int) -> _ASN:
+        info = client.asn(asn, use_cache=False)
+        prefixes = client.prefix(asn, use_cache=False)
+        first = info[0] if info else None
+        return _ASN(
+            asn,
+            time.time(),
+            first.asname if first else "",
+            first.cn if first else "",
+            first.isp if first else "",
+            list(prefixes),
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for asn, future in [(asn, pool.submit(fetch, asn)) for asn in wanted]:
+            try:
+                entries[asn] = future.result()
+                report.fetched.append(asn)
+            except Exception as error:
+                report.failed[asn] = error
+                if asn in previous:
+                    entries[asn] = previous[asn]
+
+    _write(path, [entries[asn] for asn in sorted(entries)], now)
+    return report
+
+
+def _flatten(intervals: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """Split nested (start, end, prefixlen, asn index) intervals into
+    disjoint, sorted ones where every address keeps its most specific
+    interval"""
+
+    intervals.sort(key=lambda iv: (iv[0], -iv[1]))
+    result: List[Tuple[int, int, int, int]] = []
+    stack: List[Tuple[int, int, int, int]] = []
+    position = 0
+
+    def emit(start: int, end: int, iv: Tuple[int, int, int, int]) -> None:
+        if start <= end:
+            result.append((start, end, iv[2], iv[3]))
+
+    for iv in intervals:
+        while stack and stack[-1][1] < iv[0]:
+            top = stack.pop()
+            emit(position, top[1], top)
+            position = max(position, top[1] + 1)
+        if stack:
+            emit(position, iv[0] - 1, stack[-1])
+        stack.append(iv)
+        position = iv[0]
+    while stack:
+        top = stack.pop()
+        emit(position, top[1], top)
+        position = max(position, top[1] + 1)
+    return result
+
+
+def _write(path: Text, entries: List[_ASN], created: float) -> None:
+    """Compile entries into a snapshot file at path"""
+
+    strings = bytearray()
+    refs = array.array("I")
+    v4: List[Tuple[int, int, int, int]] = []
+    v6: List[Tuple[int, int, int, int]] = []
+
+    for index, entry in enumerate(entries):
+        for text in (entry.asname, entry.cn, entry.isp, ",".join(entry.prefixes)):
+            data = (text or "").encode("utf-8")
+            refs.extend((len(strings), len(data)))
+            strings += data
+        for prefix in entry.prefixes:
+            network = RashlyOutlaid.iputil.pack_network(prefix)
+            if network is None:
+                continue
+            version, start, prefixlen = network
+            bits = 32 if version == 4 else 128
+            end = start | ((1 << (bits - prefixlen)) - 1)
+            (v4 if version == 4 else v6).append((start, end, prefixlen, index))
+
+    v4 = _flatten(v4)
+    v6 = _flatten(v6)
+    mask = (1 << 64) - 1
+    sections = [
+        array.array("I", [entry.asn for entry in entries]),
+        array.array("d", [entry.fetched for entry in entries]),
+        refs,
+        array.array("I", [iv[0] for iv in v4]),
+        array.array("I", [iv[1] for iv in v4]),
+        array.array("B", [iv[2] for iv in v4]),
+        array.array("I", [iv[3] for iv in v4]),
+        array.array("Q", [iv[0] >> 64 for iv in v6]),
+        array.array("Q", [iv[0] & mask for iv in v6]),
+        array.array("Q", [iv[1] >> 64 for iv in v6]),
+        array.array("Q", [iv[1] & mask for iv in v6]),
+        array.array("B", [iv[2] for iv in v6]),
+        array.array("I", [iv[3] for iv in v6]),
+    ]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(
+                _HEADER.pack(
+                    MAGIC,
+                    FORMAT_VERSION,
+                    sys.byteorder == "little",
+                    created,
+                    len(entries),
+                    len(v4),
+                    len(v6),
+                    len(strings),
+                )
+            )
+            for section in sections:
+                fh.write(b"\0" * (-fh.tell() % 8))
+                fh.write(section.tobytes())
+            fh.write(bytes(strings))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Snapshot:
+    """Read only, memory mapped IP to ASN snapshot written by build_snapshot
+
+    The file is mapped, not read, so processes opening the same snapshot
+    share its pages. origin and lookup answer like api.origin, from the
+    most specific prefix containing the address, with peers left empty:
+
+    with snapshot.Snapshot("asn.snapshot") as snap:
+        snap.origin(["8.8.8.8"])
+    """
+
+    def __init__(self, path: Text) -> None:
+        self.path = path
+        with open(path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._map()
+        except BaseException:
+            self._mmap.close()
+            raise
+        self._records: Dict[int, Tuple[Text, Text, Text, Text]] = {}
+
+    def _map(self) -> None:
+        """Cast the sections of the mapped file to memoryviews"""
+
+        if len(self._mmap) < _HEADER.size:
+            raise SnapshotError(f"{self.path} is not a snapshot")
+        magic, version, little, created, nasn, n4, n6, nstrings = _HEADER.unpack_from(
+            self._mmap
+        )
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise SnapshotError(
+                f"{self.path} is not a version {FORMAT_VERSION} snapshot"
+            )
+        if bool(little) != (sys.byteorder == "little"):
+            raise SnapshotError(
+                f"{self.path} was written on a machine of other byte order"
+            )
+
+        offset = _HEADER.size
+        sections = []
+        for fmt, count in (
+            ("I", nasn),
+            ("d", nasn),
+            ("I", nasn * _REFS),
+            ("I", n4),
+            ("I", n4),
+            ("B", n4),
+            ("I", n4),
+            ("Q", n6),
+            ("Q", n6),
+            ("Q", n6),
+            ("Q", n6),
+            ("B", n6),
+            ("I", n6),
+        ):
+            offset += -offset % 8
+            size = count * struct.calcsize(fmt)
+            sections.append((fmt, offset, size))
+            offset += size
+        if offset + nstrings > len(self._mmap):
+            raise SnapshotError(
+                f"{self.path} is truncated, expected {offset + nstrings} bytes "
+                f"but found {len(self._mmap)}"
+            )
+
+        self.created = created
+        self._view = memoryview(self._mmap)
+        views = [
+            self._view[start : start + size].cast(fmt) for fmt, start, size in sections
+        ]
+        (
+            self._asn,
+            self._fetched,
+            self._refs,
+            self._v4_start,
+            self._v4_end,
+            self._v4_prefixlen,
+            self._v4_index,
+            self._v6_start_hi,
+            self._v6_start_lo,
+            self._v6_end_hi,
+            self._v6_end_lo,
+            self._v6_prefixlen,
+            self._v6_index,
+        ) = views
+        self._strings = self._view[offset : offset + nstrings]
+
+    def close(self) -> None:
+        """Release the mapping"""
+
+        for value in list(vars(self).values()):
+            if isinstance(value, memoryview):
+                value.release()
+        self._mmap.close()
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """Number of asns in the snapshot"""
+
+        return len(self._asn)
+
+    @property
+    def asns(self) -> List[int]:
+        return self._asn.tolist()
+
+    def _string(self, index: int, column: int) -> Text:
+        offset = self._refs[index * _REFS + column * 2]
+        length = self._refs[index * _REFS + column * 2 + 1]
+        return bytes(self._strings[offset : offset + length]).decode("utf-8")
+
+    def _record(self, index: int) -> Tuple[Text, Text, Text, Text]:
+        """(asn, asname, cn, isp) of the asn at index, decoded once"""
+
+        record = self._records.get(index)
+        if record is None:
+            record = self._records[index] = (
+                str(self._asn[index]),
+                self._string(index, 0),
+                self._string(index, 1),
+                self._string(index, 2),
+            )
+        return record
+
+    def _entries(self) -> Iterable[_ASN]:
+        for index in range(len(self._asn)):
+            prefixes = self._string(index, 3)
+            yield _ASN(
+                self._asn[index],
+                self._fetched[index],
+                self._string(index, 0),
+                self._string(index, 1),
+                self._string(index, 2),
+                prefixes.split(",") if prefixes else [],
+            )
+
+    def prefixes(self, asn: int) -> List[Text]:
+        """The prefixes of asn as fetched, empty if asn is not in the
+        snapshot"""
+
+        index = bisect.bisect_left(self._asn, asn)
+        if index == len(self._asn) or self._asn[index] != asn:
+            return []
+        prefixes = self._string(index, 3)
+        return prefixes.split(",") if prefixes else []
+
+    def lookup_packed(self, packed: RashlyOutlaid.iputil.Packed) -> Optional[Any]:
+        """The ASNRecord of the most specific prefix containing the packed
+        address, or None"""
+
+        import RashlyOutlaid.api
+
+        version, value = packed
+        if version == 4:
+            at = bisect.bisect_right(self._v4_start, value) - 1
+            if at < 0 or self._v4_end[at] < value:
+                return None
+            prefixlen = self._v4_prefixlen[at]
+            index = self._v4_index[at]
+            bits = 32
+        else:
+            hi, lo = value >> 64, value & ((1 << 64) - 1)
+            first = bisect.bisect_left(self._v6_start_hi, hi)
+            last = bisect.bisect_right(self._v6_start_hi, hi, first)
+            at = first + bisect.bisect_right(self._v6_start_lo[first:last], lo) - 1
+            if at < 0 or (self._v6_end_hi[at] << 64 | self._v6_end_lo[at]) < value:
+                return None
+            prefixlen = self._v6_prefixlen[at]
+            index = self._v6_index[at]
+            bits = 128
+
+        network = value & (((1 << prefixlen) - 1) << (bits - prefixlen))
+        prefix = f"{RashlyOutlaid.iputil.unpack((version, network))}/{prefixlen}"
+        asn, asname, cn, isp = self._record(index)
+        return RashlyOutlaid.api.ASNRecord(asn, prefix, asname, cn, isp, [])
+
+    def lookup(self, ip_address: Union[Text, bytes]) -> Optional[Any]:
+        """The ASNRecord of ip_address, or None if it is invalid or not
+        covered by the snapshot"""
+
+        packed = RashlyOutlaid.iputil.pack(ip_address)
+        if packed is None:
+            return None
+        return self.lookup_packed(packed)
+
+    def origin(
+        self, ip_addresses: Sequence[Text], as_dict: bool = False
+    ) -> Union[List, Dict[Text, Any]]:
+        """Lookup the ip addresses like api.origin: the records found in
+        input order, or a {ip_address: record} dict with as_dict=True"""
+
+        found = [(ip, self.lookup(ip)) for ip in ip_addresses]
+        if as_dict:
+            return {ip: record for ip, record in found if record is not None}
+        return [record for _, record in found if record is not None]
@@ -0,0 +1,170 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+# Benchmark of mapping a large malware/info response to MalwareRecords.
+#
+# Compares the strptime based timestamp parsing of earlier versions with the
+# fixed format parser and with lazy AV records (Client(lazy_av=True)).
+#
+#     python bench/malware_parse.py
+#     python bench/malware_parse.py --response recorded.json
+#
+# Without --response, a response of --samples samples with --av anti virus
+# entries each is generated.
+
+import argparse
+import copy
+import datetime
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Text
+
+try:
+    import RashlyOutlaid.api as api
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    import RashlyOutlaid.api as api
+
+
+def _strptime(time_string: Text) -> Optional[datetime.datetime]:
+    """parse_shadowserver_time as of version 0.20"""
+
+    if not time_string:
+        return None
+    return datetime.datetime.strptime(time_string[:19], "%Y-%m-%d %H:%M:%S")
+
+
+def _map_strptime(ssdata: List[Dict]) -> List[api.MalwareRecord]:
+    """_map_malware_model with the strptime based parser"""
+
+    return [
+        api.MalwareRecord(
+            _strptime(elem.get("timestamp", "")),
+            _strptime(elem.get("first_seen", "")),
+            _strptime(elem.get("last_seen", "")),
+            elem.get("type"),
+            elem.get("sha256"),
+            elem.get("md5"),
+            elem.get("sha1"),
+            elem.get("pehash"),
+            elem.get("tlsh"),
+            elem.get("import_hash"),
+            elem.get("entropic"),
+            elem.get("filesize"),
+            elem.get("adobe_malware_classifier"),
+            elem.get("magic"),
+            [
+                api.AVRecord(
+                    x.get("md5"),
+                    x.get("vendor"),
+                    x.get("signature"),
+                    _strptime(x.get("timestamp", "")),
+                )
+                for x in elem["anti_virus"]
+            ],
+        )
+        for elem in ssdata
+    ]
+
+
+def generate(samples: int, av: int, seed: int = 0) -> List[Dict]:
+    """A malware/info response of samples samples with av AV entries each.
+    AV scans are spread over a few thousand distinct timestamps, like in a
+    real response where many samples are scanned in the same runs."""
+
+    rng = random.Random(seed)
+    start = datetime.datetime(2016, 1, 1)
+    times = [
+        (start + datetime.timedelta(seconds=rng.randrange(10**8))).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+        for _ in range(5000)
+    ]
+    vendors = ["Sophos", "Fortinet", "Clam", "AVG", "BitDefender", "Avast", "Eset"]
+
+    response = []
+    for n in range(samples):
+        seen = rng.choice(times)
+        response.append(
+            {
+                "md5": f"{n:032x}",
+                "sha1": f"{n:040x}",
+                "sha256": f"{n:064x}",
+                "type": "exe",
+                "timestamp": seen,
+                "first_seen": seen,
+                "last_seen": rng.choice(times),
+                "anti_virus": [
+                    {
+                        "vendor": rng.choice(vendors),
+                        "signature": f"Win32.Generic.{rng.randrange(1000)}",
+                        "timestamp": rng.choice(times),
+                    }
+                    for _ in range(av)
+                ],
+            }
+        )
+    return response
+
+
+def measure(name: str, mapper: Callable, response: List[Dict], repeat: int) -> float:
+    """best time of repeat runs of mapper over the response"""
+
+    best = float("inf")
+    for _ in range(repeat):
+        api._parse_time.cache_clear()
+        data = copy.copy(response)
+        began = time.perf_counter()
+        mapper(data)
+        best = min(best, time.perf_counter() - began)
+    print(f"{name:<28} {best * 1000:10.1f} ms")
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="malware/info parse benchmark")
+    parser.add_argument("--response", help="recorded malware/info json response")
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--av", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.response:
+        with open(args.response) as fh:
+            response = json.load(fh)
+    else:
+        response = generate(args.samples, args.av)
+
+    entries = sum(len(elem["anti_virus"]) for elem in response)
+    print(f"{len(response)} samples, {entries} anti virus entries")
+
+    baseline = measure("strptime", _map_strptime, response, args.repeat)
+    fast = measure("fixed format + memo", api._map_malware_model, response, args.repeat)
+    lazy = measure("lazy anti_virus", api._map_lazy_malware_model, response, args.repeat)
+
+    print(f"speedup fixed format: {baseline / fast:.1f}x, lazy: {baseline / lazy:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
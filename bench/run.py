@@ -0,0 +1,298 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+# Benchmark suite for the lookup paths of RashlyOutlaid, run offline against
+# the local stand-ins in bench/standins.py.
+#
+#     python bench/run.py
+#     python bench/run.py --sizes 10 1000 10000 --latency 0.02 --json now.json
+#     python bench/run.py --compare now.json --tolerance 0.2
+#
+# For every lookup path and input size the suite reports queries/s, requests
+# (http requests or whois connections) per second, p50/p99 latency of a call,
+# the time spent mapping responses to records and the peak memory allocated
+# during a call. --compare reports cases more than --tolerance slower (p50)
+# or larger (memory) than a previous --json run and exits with status 1.
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Text
+
+try:
+    import RashlyOutlaid.api as api
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+    import RashlyOutlaid.api as api
+
+import RashlyOutlaid.libwhois as libwhois
+from standins import HTTPStandIn, WhoisStandIn
+
+try:
+    import RashlyOutlaid.aio as aio
+except ImportError:
+    aio = None  # type: ignore
+
+
+class Timer:
+    """Wrap a function, adding up the time spent in it"""
+
+    def __init__(self, func: Callable) -> None:
+        self.func = func
+        self.elapsed = 0.0
+
+    def __call__(self, *args: Any) -> Any:
+        began = time.perf_counter()
+        try:
+            return self.func(*args)
+        finally:
+            self.elapsed += time.perf_counter() - began
+
+
+class Case:
+    """A lookup path: run(queries) performs one call, counter returns the
+    number of requests the stand-in has seen, parse the Timer wrapping the
+    response mapping (if it can be measured) and close releases the client"""
+
+    def __init__(
+        self,
+        name: Text,
+        run: Callable[[List[Text]], Any],
+        counter: Callable[[], int],
+        parse: Optional[Timer] = None,
+        close: Optional[Callable[[], Any]] = None,
+    ) -> None:
+        self.name = name
+        self.run = run
+        self.counter = counter
+        self.parse = parse
+        self.close = close
+
+
+def ips(size: int) -> List[Text]:
+    """size distinct ip addresses spread over many prefixes"""
+
+    return [f"{10 + n % 200}.{n // 200 % 256}.{n // 51200 % 256}.{n % 250 + 1}" for n in range(size)]
+
+
+def hashes(size: int) -> List[Text]:
+    return [f"{n:032x}" for n in range(size)]
+
+
+def cases(
+    http: HTTPStandIn, whois: WhoisStandIn, loop: asyncio.AbstractEventLoop
+) -> List[Case]:
+    """The lookup paths to benchmark"""
+
+    client = api.Client(base_url=http.url, rate_limiter=None, pool_size=16)
+    asn_model = client._asn_model = Timer(client._asn_model)  # type: ignore
+    malware_model = client._malware_model = Timer(client._malware_model)  # type: ignore
+    lazy = api.Client(base_url=http.url, rate_limiter=None, lazy_av=True)
+    lazy_model = lazy._malware_model = Timer(lazy._malware_model)  # type: ignore
+    requests = lambda: http.requests
+    connections = lambda: whois.requests
+
+    def whois_run(peers: bool, connections: int) -> Callable[[List[Text]], Any]:
+        parse = Timer(libwhois.parse_line)
+
+        def run(queries: List[Text]) -> Any:
+            asnwhois = libwhois.ASNWhois("127.0.0.1", whois.port, connections=connections)
+            asnwhois.peers = peers
+            asnwhois.query = queries
+            asnwhois._parse_line = lambda line: parse(  # type: ignore
+                line, asnwhois._base_idx, peers, asnwhois._multiple, asnwhois.query
+            )
+            return asnwhois.result
+
+        # the parallel connections parse on ASNWhois objects of their own
+        run.parse = parse if connections == 1 else None  # type: ignore
+        return run
+
+    result = [
+        Case("api.origin", client.origin, requests, asn_model),
+        Case("api.peer", client.peer, requests, asn_model),
+        Case("api.malware", client.malware, requests, malware_model),
+        Case("api.malware lazy_av", lazy.malware, requests, lazy_model),
+        Case("api.bulk_origin", lambda q: client.bulk_origin(q, workers=8), requests, asn_model),
+        Case("api.origin_stream", lambda q: list(client.origin_stream(q)), requests, asn_model),
+        Case("api.origin_table", client.origin_table, requests),
+    ]
+    for name, peers, conns in (
+        ("whois origin", False, 1),
+        ("whois origin x4", False, 4),
+        ("whois peer", True, 1),
+    ):
+        run = whois_run(peers, conns)
+        result.append(Case(name, run, connections, run.parse))  # type: ignore
+
+    async_whois = aio.AsyncASNWhois("127.0.0.1", whois.port) if aio else None
+    if async_whois is not None:
+        result.append(
+            Case(
+                "aio whois origin",
+                lambda q: loop.run_until_complete(async_whois.origin(q)),  # type: ignore
+                connections,
+            )
+        )
+    if aio is not None and aio.aiohttp is not None:
+        aclient = aio.AsyncClient(base_url=http.url, rate_limiter=None, pool_size=16)
+        amodel = aclient._asn_model = Timer(aclient._asn_model)  # type: ignore
+        result.append(
+            Case(
+                "aio.origin",
+                lambda q: loop.run_until_complete(aclient.origin(q)),
+                requests,
+                amodel,
+                lambda: loop.run_until_complete(aclient.close()),
+            )
+        )
+    return result
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def measure(case: Case, queries: List[Text], repeat: int) -> Dict[Text, Any]:
+    """Run case repeat times on queries and measure it"""
+
+    case.run(queries)  # warm up connections and caches
+
+    if case.parse is not None:
+        case.parse.elapsed = 0.0
+    requests = case.counter()
+    latencies = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        case.run(queries)
+        latencies.append(time.perf_counter() - began)
+    total = sum(latencies)
+    requests = case.counter() - requests
+
+    tracemalloc.start()
+    case.run(queries)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "case": case.name,
+        "size": len(queries),
+        "queries_per_s": len(queries) * repeat / total,
+        "requests_per_s": requests / total,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "parse_ms": (
+            case.parse.elapsed / repeat * 1000 if case.parse is not None else None
+        ),
+        "peak_kb": peak / 1024,
+    }
+
+
+def report(results: List[Dict[Text, Any]]) -> None:
+    print(
+        f"{'case':<22} {'size':>7} {'queries/s':>11} {'req/s':>8} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'parse ms':>9} {'peak KiB':>10}"
+    )
+    for r in results:
+        parse = f"{r['parse_ms']:9.2f}" if r["parse_ms"] is not None else f"{'-':>9}"
+        print(
+            f"{r['case']:<22} {r['size']:>7} {r['queries_per_s']:>11.0f} "
+            f"{r['requests_per_s']:>8.1f} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+            f"{parse} {r['peak_kb']:>10.0f}"
+        )
+
+
+def compare(
+    results: List[Dict[Text, Any]], baseline: List[Dict[Text, Any]], tolerance: float
+) -> List[Text]:
+    """The regressions of results against baseline"""
+
+    previous = {(r["case"], r["size"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        before = previous.get((r["case"], r["size"]))
+        if before is None:
+            continue
+        for key in ("p50_ms", "peak_kb"):
+            if r[key] > before[key] * (1 + tolerance):
+                regressions.append(
+                    f"{r['case']} size {r['size']}: {key} "
+                    f"{before[key]:.2f} -> {r[key]:.2f}"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="RashlyOutlaid benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added by the stand-ins to every request")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="requests per second the stand-ins accept")
+    parser.add_argument("--peers", type=int, default=3, help="peers per record")
+    parser.add_argument("--anti-virus", type=int, default=20,
+                        help="anti virus entries per malware sample")
+    parser.add_argument("--cases", nargs="*", help="only run cases starting with these names")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results of a previous --json run")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    results = []
+    with HTTPStandIn(args.latency, args.rate, args.peers, args.anti_virus) as http, \
+            WhoisStandIn(args.latency, args.rate, args.peers) as whois:
+        for case in cases(http, whois, loop):
+            if args.cases and not any(case.name.startswith(c) for c in args.cases):
+                continue
+            for size in args.sizes:
+                queries = hashes(size) if "malware" in case.name else ips(size)
+                try:
+                    results.append(measure(case, queries, args.repeat))
+                except Exception as err:
+                    print(f"{case.name} size {size} failed: {err!r}", file=sys.stderr)
+            if case.close is not None:
+                case.close()
+    loop.close()
+
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=2)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
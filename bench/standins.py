@@ -0,0 +1,303 @@
+""" Copyright (c) 2014-2021 Geir Skjotskift
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in
+    all copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+    FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+    DEALINGS IN THE SOFTWARE.
+"""
+
+# Local stand-ins for the Shadowserver services, for benchmarks and offline
+# experiments:
+#
+#   HTTPStandIn   /net/asn (origin, peer, query, prefix) and /malware/info
+#   WhoisStandIn  the asn.shadowserver.org port 43 protocol, single queries
+#                 ("origin x", "peer x") and begin/end bulk blocks
+#
+# Both answer every query with a deterministic, generated record and take
+# latency (seconds added to every request or connection), rate (requests or
+# connections per second before answering 429 / closing the connection,
+# None for no limit) and response size settings (peers per record, anti
+# virus entries per sample).
+#
+#     with HTTPStandIn(latency=0.02, rate=10) as http:
+#         client = api.Client(base_url=http.url)
+
+import hashlib
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, List, Optional, Text
+
+
+class _Limiter:
+    """Fixed window counter of requests per second"""
+
+    def __init__(self, rate: Optional[float]) -> None:
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._window = 0
+        self._count = 0
+
+    def allow(self) -> bool:
+        if self.rate is None:
+            return True
+        with self._lock:
+            window = int(time.monotonic())
+            if window != self._window:
+                self._window = window
+                self._count = 0
+            self._count += 1
+            return self._count <= self.rate
+
+
+def _octets(ip: Text) -> List[int]:
+    try:
+        octets = [int(o) for o in ip.split(".")]
+    except ValueError:
+        octets = []
+    return (octets + [0, 0, 0, 0])[:4] if len(octets) == 4 else [10, 0, 0, 0]
+
+
+def origin_record(ip: Text, peers: int = 0) -> Dict[Text, Text]:
+    """The /net/asn record of ip, the asn derived from its first two octets"""
+
+    octets = _octets(ip)
+    asn = 64512 + octets[0] * 4 + octets[1] % 4
+    record = {
+        "ip": ip,
+        "asn": str(asn),
+        "prefix": f"{octets[0]}.{octets[1]}.{octets[2]}.0/24",
+        "asname_short": f"AS{asn}",
+        "asname_long": f"Stand-in network {asn}",
+        "geo": "NO",
+    }
+    if peers:
+        record["peer"] = " ".join(str(asn + n + 1) for n in range(peers))
+    return record
+
+
+def malware_record(sample: Text, anti_virus: int = 10) -> Dict[Text, Any]:
+    """The /malware/info record of the hash sample"""
+
+    sample = sample.lower()
+    seed = sum(sample.encode())
+    seen = f"2020-{seed % 12 + 1:02d}-{seed % 28 + 1:02d} 12:{seed % 60:02d}:00"
+    hashes = {
+        "md5": hashlib.md5(sample.encode()).hexdigest(),
+        "sha1": hashlib.sha1(sample.encode()).hexdigest(),
+        "sha256": hashlib.sha256(sample.encode()).hexdigest(),
+    }
+    # answer to the hash that was asked for
+    hashes[{32: "md5", 40: "sha1"}.get(len(sample), "sha256")] = sample
+    return {
+        **hashes,
+        "type": "exe",
+        "timestamp": seen,
+        "first_seen": seen,
+        "last_seen": seen,
+        "filesize": str(seed * 1000),
+        "magic": "PE32 executable (GUI) Intel 80386, for MS Windows",
+        "anti_virus": [
+            {
+                "vendor": f"Vendor{n}",
+                "signature": f"Win32.Generic.{seed + n}",
+                "timestamp": f"2020-06-{n % 28 + 1:02d} 00:00:00",
+            }
+            for n in range(anti_virus)
+        ],
+    }
+
+
+def whois_line(ip: Text, peers: bool, bulk: bool, npeers: int = 3) -> Text:
+    """A response line of the whois protocol"""
+
+    record = origin_record(ip, npeers)
+    fields = [
+        record["asn"],
+        record["prefix"],
+        record["asname_short"],
+        record["geo"],
+        record["asname_long"],
+    ]
+    if peers:
+        fields.insert(0, record.get("peer", ""))
+    if bulk:
+        fields.insert(0, ip)
+    return " | ".join(fields)
+
+
+class _StandIn:
+    """Run a socketserver on a thread, as a context manager"""
+
+    server: socketserver.BaseServer
+
+    def start(self) -> "_StandIn":
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]  # type: ignore
+
+    def __enter__(self) -> Any:
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _HTTPHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server: Any
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        standin: HTTPStandIn = self.server.standin
+        standin.requests += 1
+        if standin.latency:
+            time.sleep(standin.latency)
+        if not standin.limiter.allow():
+            standin.throttled += 1
+            self._send(429, b"[]", {"Retry-After": "1"})
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        body: Any = None
+        if url.path == "/net/asn" and "origin" in params:
+            body = [origin_record(ip) for ip in params["origin"][0].split(",")]
+        elif url.path == "/net/asn" and "peer" in params:
+            body = [
+                origin_record(ip, standin.peers) for ip in params["peer"][0].split(",")
+            ]
+        elif url.path == "/net/asn" and "query" in params:
+            asn = params["query"][0]
+            body = {"asn": asn, "asname_short": f"AS{asn}", "geo": "NO"}
+        elif url.path == "/net/asn" and "prefix" in params:
+            body = [f"10.{n}.0.0/16" for n in range(standin.prefixes)]
+        elif url.path == "/malware/info" and "sample" in params:
+            body = [
+                malware_record(sample, standin.anti_virus)
+                for sample in params["sample"][0].split(",")
+            ]
+
+        if body is None:
+            self._send(404, b"{}")
+        else:
+            self._send(200, json.dumps(body).encode())
+
+    def _send(self, status: int, body: bytes, headers: Dict[Text, Text] = {}) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class HTTPStandIn(_StandIn):
+    """Stand-in for the Shadowserver web api on 127.0.0.1"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate: Optional[float] = None,
+        peers: int = 3,
+        anti_virus: int = 10,
+        prefixes: int = 50,
+    ) -> None:
+        self.latency = latency
+        self.limiter = _Limiter(rate)
+        self.peers = peers
+        self.anti_virus = anti_virus
+        self.prefixes = prefixes
+        self.requests = 0
+        self.throttled = 0
+        self.server = _HTTPServer(("127.0.0.1", 0), _HTTPHandler)
+        self.server.standin = self  # type: ignore
+
+    @property
+    def url(self) -> Text:
+        return f"http://127.0.0.1:{self.port}"
+
+
+class _WhoisServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+class _WhoisHandler(socketserver.StreamRequestHandler):
+    server: Any
+    disable_nagle_algorithm = True
+
+    def handle(self) -> None:
+        standin: WhoisStandIn = self.server.standin
+        standin.requests += 1
+        if standin.latency:
+            time.sleep(standin.latency)
+        if not standin.limiter.allow():
+            standin.throttled += 1
+            return
+
+        first = self.rfile.readline().decode().strip()
+        command, _, query = first.partition(" ")
+        lines = []
+        if command == "begin":
+            peers = query == "peer"
+            for line in self.rfile:
+                ip = line.decode().strip()
+                if ip == "end":
+                    break
+                lines.append(whois_line(ip, peers, True, standin.peers))
+        else:
+            lines.append(whois_line(query, command == "peer", False, standin.peers))
+
+        self.wfile.write(("\n".join(lines) + "\n").encode())
+
+
+class WhoisStandIn(_StandIn):
+    """Stand-in for the asn.shadowserver.org whois service on 127.0.0.1"""
+
+    def __init__(
+        self, latency: float = 0.0, rate: Optional[float] = None, peers: int = 3
+    ) -> None:
+        self.latency = latency
+        self.limiter = _Limiter(rate)
+        self.peers = peers
+        self.requests = 0
+        self.throttled = 0
+        self.server = _WhoisServer(("127.0.0.1", 0), _WhoisHandler)
+        self.server.standin = self  # type: ignore
@@ -13,7 +13,7 @@ def read(fname):
 
 setup(
     name="RashlyOutlaid",
-    version="0.20.0",
+    version="0.21.0",
     author="Geir Skjotskift",
     author_email="geir@underworld.no",
     description="Perform ASN Whois against shadowserver.org",
@@ -26,6 +26,8 @@ setup(
         "RashlyOutlaid",
     ],
     install_requires=["requests", "responses", "pytest", "dataclasses"],
+    entry_points={"console_scripts": ["rashlyoutlaid=RashlyOutlaid.cli:main"]},
+    extras_require={"aio": ["aiohttp"], "numpy": ["numpy"], "arrow": ["pyarrow"]},
     classifiers=[
         "Development Status :: 4 - Beta",
         "Topic :: Utilities",
@@ -0,0 +1,43 @@
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+
+def _origin_response(
+    ip: str, asn: Optional[str] = None, prefix: Optional[str] = None, **fields: str
+) -> Dict:
+    asn = ip.split(".")[-1] if asn is None else asn
+    response = {
+        "geo": "US",
+        "ip": ip,
+        "prefix": f"{ip}/32" if prefix is None else prefix,
+        "asn": asn,
+        "asname_short": f"AS{asn}",
+        "asname_long": f"AS{asn}",
+    }
+    response.update(fields)
+    return response
+
+
+@pytest.fixture
+def origin_response() -> Callable[..., Dict]:
+    """Builds a Shadowserver origin/peer entry for an ip. asn defaults to the
+    last octet of the ip, prefix to the ip itself and any other field can be
+    overridden by keyword"""
+
+    return _origin_response
+
+
+@pytest.fixture
+def google_origin() -> List[Dict]:
+    """The origin response for 8.8.8.8"""
+
+    return [
+        _origin_response(
+            "8.8.8.8",
+            "15169",
+            "8.8.8.0/24",
+            asname_short="GOOGLE",
+            asname_long="GOOGLE",
+        )
+    ]
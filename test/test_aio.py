@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Callable, List
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+import RashlyOutlaid.libwhois
+from RashlyOutlaid import aio
+
+
+async def _handler(
+    request: web.Request, queries: List, origin_response: Callable
+) -> web.Response:
+    queries.append(dict(request.query))
+    if "origin" in request.query:
+        return web.json_response(
+            [
+                origin_response(ip, prefix="212.58.224.0/19")
+                for ip in request.query["origin"].split(",")
+            ]
+        )
+    if "query" in request.query:
+        if request.query["query"] == "0":
+            return web.Response(status=500)
+        return web.json_response(
+            {"asn": "2818", "asname_short": "AS2818", "asname_long": "BBC", "geo": "GB"}
+        )
+    if "prefix" in request.query:
+        return web.json_response(["212.58.224.0/19"])
+    return web.Response(status=404)
+
+
+@pytest.fixture
+def run(origin_response: Callable) -> Callable:
+    return lambda test: _run(test, origin_response)
+
+
+def _run(test: Callable, origin_response: Callable) -> Any:
+    async def main() -> Any:
+        queries: List = []
+        app = web.Application()
+
+        async def handler(request: web.Request) -> web.Response:
+            return await _handler(request, queries, origin_response)
+
+        app.router.add_get("/net/asn", handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            async with aio.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}", rate_limiter=None
+            ) as client:
+                return await test(client, queries)
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_lookups(run: Callable) -> None:
+    async def test(client: aio.AsyncClient, queries: List) -> None:
+        origin = await client.origin(["212.58.245.94"])
+        assert origin[0].asn == "94"
+        assert origin[0].prefix == "212.58.224.0/19"
+
+        asn = await client.asn(2818)
+        assert asn[0].isp == "BBC"
+
+        assert await client.prefix(2818) == ["212.58.224.0/19"]
+
+        with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+            await client.asn(0)
+
+    run(test)
+
+
+def test_gather_origin_keeps_order(run: Callable) -> None:
+    ips = [f"10.0.0.{i}" for i in range(10)]
+
+    async def test(client: aio.AsyncClient, queries: List) -> None:
+        result = await client.gather_origin(ips, concurrency=3, batch_size=3)
+
+        assert len(queries) == 4
+        assert len(result) == 10
+        assert [r.asn for r in result] == [str(i) for i in range(10)]
+
+    run(test)
+
+
+def test_gather_concurrency(run: Callable) -> None:
+    async def test(client: aio.AsyncClient, queries: List) -> None:
+        with pytest.raises(ValueError):
+            await client.gather_origin(["10.0.0.1"], concurrency=0)
+
+    run(test)
+
+
+def test_origin_batcher(run: Callable) -> None:
+    ips = [f"10.0.0.{i}" for i in range(10)]
+
+    async def test(client: aio.AsyncClient, queries: List) -> None:
+        batcher = client.origin_batcher(window=0.01)
+        records = await asyncio.gather(*[batcher.load(ip) for ip in ips])
+        await batcher.close()
+
+        assert [r.asn for r in records] == [str(i) for i in range(10)]
+        assert len(queries) == 1
+
+    run(test)
+
+
+def test_default_client_aclose() -> None:
+    async def main() -> aio.AsyncClient:
+        client = aio.default_client()
+        assert aio.default_client() is client
+        assert not client.session.closed
+        await aio.aclose()
+        assert client._session is None
+        assert aio.default_client() is not client
+        await aio.aclose()
+        return client
+
+    first = asyncio.run(main())
+    second = asyncio.run(main())
+
+    assert first is not second
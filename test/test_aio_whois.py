@@ -0,0 +1,106 @@
+import asyncio
+from typing import Any, Callable, List
+
+import pytest
+
+import RashlyOutlaid.libwhois
+from RashlyOutlaid.aio import AsyncASNWhois
+
+RESPONSES = {
+    "origin": {
+        "212.58.245.94": "212.58.245.94 | 2818 | 212.58.224.0/19 | BBC | GB | BBC Internet Services, UK, GB",
+        "8.8.8.8": "8.8.8.8 | 15169 | 8.8.8.0/24 | GOOGLE | US | Google LLC",
+    },
+    "peer": {
+        "212.58.245.94": "212.58.245.94 | 286 1299 3356 | 2818 | 212.58.224.0/19 | BBC | GB | BBC Internet Services, UK, GB",
+    },
+}
+SINGLE_PEER = "286 1299 3356 | 2818 | 212.58.224.0/19 | BBC | GB | BBC Internet Services, UK, GB"
+
+
+async def _handle(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter, sessions: List
+) -> None:
+    first = (await reader.readline()).decode().strip()
+    sessions.append(first)
+    if first.startswith("begin"):
+        kind = first.split()[1]
+        lines = []
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if line == "end":
+                break
+            lines.append(RESPONSES[kind][line])
+    elif first == "peer 10.0.0.1":
+        await asyncio.sleep(1)
+        lines = []
+    else:
+        lines = [SINGLE_PEER]
+    writer.write(("\n".join(lines) + "\n").encode())
+    await writer.drain()
+    writer.close()
+
+
+def _run(test: Callable, **kwargs: Any) -> List:
+    sessions: List = []
+
+    async def main() -> None:
+        server = await asyncio.start_server(
+            lambda r, w: _handle(r, w, sessions), "127.0.0.1", 0
+        )
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await test(AsyncASNWhois("127.0.0.1", port, **kwargs))
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    asyncio.run(main())
+    return sessions
+
+
+def test_bulk_and_single() -> None:
+    async def test(whois: AsyncASNWhois) -> None:
+        origin = await whois.origin(["212.58.245.94", "8.8.8.8"])
+        assert origin["8.8.8.8"] == RashlyOutlaid.libwhois.ASNRecord(
+            "15169", "8.8.8.0/24", "GOOGLE", "US", "Google LLC", []
+        )
+
+        peer = await whois.peer(["212.58.245.94"])
+        assert peer["212.58.245.94"].peers == ["286", "1299", "3356"]
+
+        single = await whois.peer("212.58.245.94")
+        assert single == peer
+
+    sessions = _run(test)
+    assert sessions == ["begin origin", "begin peer", "peer 212.58.245.94"]
+
+
+def test_concurrent_sessions_and_timeout() -> None:
+    async def test(whois: AsyncASNWhois) -> None:
+        results = await asyncio.gather(
+            *[whois.origin(["8.8.8.8"]) for _ in range(5)]
+        )
+        assert all(r["8.8.8.8"].asn == "15169" for r in results)
+
+        with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+            await whois.peer("10.0.0.1")
+
+        with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+            await whois.origin(["not an ip"])
+
+    _run(test, timeout=0.2, concurrency=2)
+
+
+def test_reused_across_event_loops() -> None:
+    whois = AsyncASNWhois("127.0.0.1", 0, concurrency=1)
+
+    async def test(server: AsyncASNWhois) -> None:
+        whois.port = server.port
+        results = await asyncio.gather(
+            *[whois.origin(["8.8.8.8"]) for _ in range(3)]
+        )
+        assert all(r["8.8.8.8"].asn == "15169" for r in results)
+
+    assert _run(test) == ["begin origin"] * 3
+    assert _run(test) == ["begin origin"] * 3
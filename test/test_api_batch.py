@@ -0,0 +1,66 @@
+from typing import Callable
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+
+
+def test_batches() -> None:
+
+    queries = [f"10.0.0.{i}" for i in range(10)]
+
+    assert list(shadowserver._batches(queries, 4, 1000)) == [
+        queries[0:4],
+        queries[4:8],
+        queries[8:10],
+    ]
+    # "10.0.0.0,10.0.0.1" is 17 characters
+    assert list(shadowserver._batches(queries[:3], 10, 17)) == [
+        queries[0:2],
+        queries[2:3],
+    ]
+    assert list(shadowserver._batches([], 4, 1000)) == []
+
+    with pytest.raises(ValueError):
+        list(shadowserver._batches(queries, 0, 1000))
+
+
+@responses.activate
+def test_origin_batch_size(origin_response: Callable) -> None:
+
+    ips = ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=10.0.0.1,10.0.0.2",
+        json=[origin_response(ips[0], "1"), origin_response(ips[1], "2")],
+    )
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=10.0.0.3",
+        json=[origin_response(ips[2], "3")],
+    )
+
+    result = shadowserver.Client().origin(ips, batch_size=2)
+
+    assert [r.asn for r in result] == ["1", "2", "3"]
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_max_url_length(origin_response: Callable) -> None:
+
+    base = "https://api.shadowserver.org/net/asn?peer="
+    ips = ["10.0.0.1", "10.0.0.2"]
+
+    for i, ip in enumerate(ips):
+        responses.add(
+            responses.GET, f"{base}{ip}", json=[origin_response(ip, str(i))]
+        )
+
+    client = shadowserver.Client(max_url_length=len(base) + len(ips[0]))
+    result = client.peer(ips)
+
+    assert [r.asn for r in result] == ["0", "1"]
+    assert len(responses.calls) == 2
@@ -0,0 +1,61 @@
+from typing import Callable
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+
+BASE_URL = "https://api.shadowserver.org/net/asn"
+
+
+@pytest.fixture
+def add(origin_response: Callable) -> Callable:
+    def add(kind: str, ips: list, status: int = 200) -> None:
+        responses.add(
+            responses.GET,
+            f"{BASE_URL}?{kind}={','.join(ips)}",
+            json=[origin_response(ip) for ip in ips],
+            status=status,
+        )
+
+    return add
+
+
+@responses.activate
+def test_bulk_origin_in_order(add: Callable) -> None:
+
+    ips = [f"10.0.0.{i}" for i in range(7)]
+    for start in range(0, 7, 2):
+        add("origin", ips[start : start + 2])
+
+    client = shadowserver.Client(rate_limiter=None)
+    result = client.bulk_origin(ips, workers=4, batch_size=2)
+
+    assert result.ok
+    assert result.failed == []
+    assert [r.asn for r in result.records] == [str(i) for i in range(7)]
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_bulk_peer_partial_failure(add: Callable) -> None:
+
+    ips = [f"10.0.0.{i}" for i in range(6)]
+    add("peer", ips[0:2])
+    add("peer", ips[2:4], status=503)
+    add("peer", ips[4:6])
+
+    client = shadowserver.Client(rate_limiter=None, retry=None)
+    result = client.bulk_peer(ips, workers=2, batch_size=2)
+
+    assert not result.ok
+    assert [r.asn for r in result.records] == ["0", "1", "4", "5"]
+    assert result.failed == ips[2:4]
+    assert isinstance(result.errors[0].error, RashlyOutlaid.libwhois.QueryError)
+
+
+def test_bulk_workers() -> None:
+
+    with pytest.raises(ValueError):
+        shadowserver.Client().bulk_origin(["10.0.0.1"], workers=0)
@@ -0,0 +1,77 @@
+from typing import Callable, Dict, List
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+
+ORIGIN_URL = "https://api.shadowserver.org/net/asn?origin=212.58.245.94"
+
+
+@pytest.fixture
+def bbc_origin(origin_response: Callable) -> List[Dict]:
+    return [
+        origin_response(
+            "212.58.245.94", "2818", "212.58.224.0/19", geo="GB", asname_long="BBC"
+        )
+    ]
+
+
+@responses.activate
+def test_client_reuses_session(bbc_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, json=bbc_origin, status=200)
+
+    with shadowserver.Client(pool_size=4, timeout=5) as client:
+        adapter = client.session.get_adapter("https://api.shadowserver.org")
+        assert adapter._pool_maxsize == 4
+
+        first = client.origin(["212.58.245.94"])[0]
+        second = client.origin(["212.58.245.94"])[0]
+
+    assert first == second
+    assert first.asn == "2818"
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_client_base_url_and_keep_alive(bbc_origin: List[Dict]) -> None:
+
+    responses.add(
+        responses.GET,
+        "http://localhost:8080/net/asn?origin=212.58.245.94",
+        json=bbc_origin,
+        status=200,
+    )
+
+    client = shadowserver.Client(base_url="http://localhost:8080/", keep_alive=False)
+    result = client.origin(["212.58.245.94"])[0]
+
+    assert result.prefix == "212.58.224.0/19"
+    assert responses.calls[0].request.headers["Connection"] == "close"
+
+
+@responses.activate
+def test_client_error() -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=500)
+
+    with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+        shadowserver.Client(retry=None).origin(["212.58.245.94"])
+
+
+@responses.activate
+def test_module_functions_use_default_client(bbc_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, json=bbc_origin, status=200)
+
+    client = shadowserver.Client()
+    shadowserver.set_default_client(client)
+    try:
+        assert shadowserver.default_client() is client
+        assert shadowserver.origin(["212.58.245.94"])[0].asn == "2818"
+    finally:
+        shadowserver.set_default_client(None)
+
+    assert shadowserver.default_client() is not client
@@ -0,0 +1,74 @@
+import dataclasses
+import pickle
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+
+
+def test_compact_record() -> None:
+
+    record = shadowserver.compact_record(
+        "2818", "212.58.224.0/19", "AS2818", "GB", "BBC", ["1103", "1299"]
+    )
+    plain = shadowserver.ASNRecord(
+        "2818", "212.58.224.0/19", "AS2818", "GB", "BBC", ["1103", "1299"]
+    )
+
+    assert record == plain
+    assert plain == record
+    assert list(record) == list(plain)
+    assert record.astuple() == plain.astuple()
+    assert record.peers == ["1103", "1299"]
+    assert shadowserver.ASNRecord(*list(record)) == record
+    assert pickle.loads(pickle.dumps(record)) is record
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        record.asn = "1"
+    with pytest.raises(AttributeError):
+        record.extra = 1
+
+
+@responses.activate
+def test_compact_records_are_shared() -> None:
+
+    def response(ip: str) -> dict:
+        return {
+            "ip": ip,
+            "asn": "15169",
+            "prefix": "8.8.8.0/24",
+            "asname_short": "GOOGLE",
+            "asname_long": "GOOGLE",
+            "geo": "US",
+            "peer": "1101 6696",
+        }
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?peer=8.8.8.8,8.8.8.9",
+        json=[response("8.8.8.8"), response("8.8.8.9")],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, compact=True)
+    first, second = client.peer(["8.8.8.8", "8.8.8.9"])
+
+    assert isinstance(first, shadowserver.CompactASNRecord)
+    assert first is second
+    assert first._peers == (1101, 6696)
+    assert first.peers == ["1101", "6696"]
+
+
+def test_interned_peers_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+
+    monkeypatch.setattr(shadowserver, "INTERNED_PEERS_SIZE", 10)
+    records = [
+        shadowserver.compact_record("1", "", "", "", "", [str(n)]) for n in range(25)
+    ]
+
+    assert len(shadowserver._interned_peers) <= 10
+    assert [r.peers for r in records] == [[str(n)] for n in range(25)]
+
+    odd = shadowserver.compact_record("1", "", "", "", "", ["²", "0012", "7"])
+    assert odd._peers == ("²", "0012", 7)
+    assert odd.peers == ["²", "0012", "7"]
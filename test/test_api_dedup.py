@@ -0,0 +1,101 @@
+from typing import Callable
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+
+
+def test_normalize() -> None:
+
+    assert shadowserver._normalize_ip(" 8.8.8.8\n") == "8.8.8.8"
+    assert shadowserver._normalize_ip("2001:DB8:0:0::1") == "2001:db8::1"
+    assert shadowserver._normalize_ip("not an ip ") is None
+    assert shadowserver._normalize_hash(" D41D8CD98F00B204E9800998ECF8427E") == (
+        "d41d8cd98f00b204e9800998ecf8427e"
+    )
+
+
+@responses.activate
+def test_origin_deduplicated(origin_response: Callable) -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=8.8.8.8,2001:db8::1",
+        json=[origin_response("8.8.8.8", "15169"), origin_response("2001:db8::1", "1")],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    ips = ["8.8.8.8", "2001:DB8::1", " 8.8.8.8", "8.8.8.8", "2001:db8:0::1"]
+    result = client.origin(ips)
+
+    assert [r.asn for r in result] == ["15169", "1", "15169", "15169", "1"]
+    assert result[0] is result[2]
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_as_dict(origin_response: Callable) -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?peer=8.8.8.8,10.0.0.1",
+        json=[origin_response("8.8.8.8", "15169")],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    result = client.peer(["8.8.8.8", "10.0.0.1", "8.8.8.8 "], as_dict=True)
+
+    assert list(result) == ["8.8.8.8", "8.8.8.8 "]
+    assert result["8.8.8.8"].asn == "15169"
+
+
+@responses.activate
+def test_malware_case_folded() -> None:
+
+    md5 = "d41d8cd98f00b204e9800998ecf8427e"
+    responses.add(
+        responses.GET,
+        f"https://api.shadowserver.org/malware/info?sample={md5}",
+        json=[{"md5": md5, "anti_virus": []}],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    result = client.malware([md5.upper(), md5], as_dict=True)
+
+    assert result[md5.upper()] is result[md5]
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_results_without_ip(origin_response: Callable) -> None:
+
+    base = "https://api.shadowserver.org/net/asn?origin="
+    responses.add(
+        responses.GET,
+        f"{base}8.8.8.8",
+        json=[{"asn": "15169", "prefix": "8.8.8.0/24"}],
+    )
+    responses.add(
+        responses.GET,
+        f"{base}8.8.4.4,1.1.1.1",
+        json=[origin_response("1.1.1.1", "13335"), {"asn": "15169"}],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    assert [r.asn for r in client.origin(["8.8.8.8"])] == ["15169"]
+    assert [r.asn for r in client.origin(["8.8.4.4", "1.1.1.1"])] == ["15169", "13335"]
+
+
+@responses.activate
+def test_unmatched_results_logged(caplog: pytest.LogCaptureFixture) -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?peer=8.8.8.8",
+        json=[{"asn": "1"}, {"asn": "2"}],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    assert client.peer(["8.8.8.8"]) == []
+    assert "dropped 2 results" in caplog.text
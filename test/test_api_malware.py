@@ -1,3 +1,4 @@
+import concurrent.futures
 import datetime
 
 import pytest
@@ -145,3 +146,65 @@ def test_iterator() -> None:
     result2 = shadowserver.MalwareRecord(*list(result))
 
     assert result == result2
+
+
+def test_parse_shadowserver_time() -> None:
+
+    parse = shadowserver.parse_shadowserver_time
+
+    assert parse("") is None
+    assert parse("2018-10-17 20:36:23") == datetime.datetime(2018, 10, 17, 20, 36, 23)
+    assert parse("2018-10-17 20:36:23.123+00") == datetime.datetime(
+        2018, 10, 17, 20, 36, 23
+    )
+    assert parse("2018-10-17 20:36:23") is parse("2018-10-17 20:36:23")
+
+    with pytest.raises(ValueError):
+        parse("2018-10-17T20:36:23")
+    with pytest.raises(ValueError):
+        parse("2018-13-17 20:36:23")
+    with pytest.raises(ValueError):
+        parse("2018-+1-17 20:36:23")
+    with pytest.raises(ValueError):
+        parse("2018-1\u00b2-17 20:36:23")
+
+
+@responses.activate
+def test_lazy_av() -> None:
+
+    responses.add(
+        responses.GET,
+        query_responses["dfe1832e02888422f48d6896dc8e8f73"]["url"],
+        json=query_responses["dfe1832e02888422f48d6896dc8e8f73"]["response"],
+        status=query_responses["dfe1832e02888422f48d6896dc8e8f73"]["status"],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, lazy_av=True)
+    result = client.malware(["dfe1832e02888422f48d6896dc8e8f73"])[0]
+
+    assert isinstance(result.anti_virus, shadowserver.LazyAVList)
+    assert len(result.anti_virus) == 26
+    assert result.anti_virus._raw is not None
+
+    assert result.anti_virus[0] == shadowserver.AVRecord(
+        None, "Sophos", "Troj/Agent-APCU", None
+    )
+    assert result.anti_virus._raw is None
+
+    eager = shadowserver._map_malware_model(
+        query_responses["dfe1832e02888422f48d6896dc8e8f73"]["response"]
+    )[0]
+    assert result == eager
+
+
+def test_lazy_av_threads() -> None:
+
+    raw = query_responses["dfe1832e02888422f48d6896dc8e8f73"]["response"][0][
+        "anti_virus"
+    ]
+    for _ in range(20):
+        lazy = shadowserver.LazyAVList(raw)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            lengths = list(pool.map(lambda _: (len(lazy), lazy[-1]), range(32)))
+        assert {length for length, _ in lengths} == {26}
+        assert lazy._raw is None
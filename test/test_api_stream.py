@@ -0,0 +1,56 @@
+import itertools
+import json
+import re
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+
+
+def _callback(request):
+    ips = re.search(r"origin=([^&]*)", request.url).group(1).split(",")
+    body = [
+        {"ip": ip, "asn": ip.split(".")[-1], "prefix": f"{ip}/32"}
+        for ip in ips
+        if ip != "10.0.0.3"
+    ]
+    return 200, {}, json.dumps(body)
+
+
+@responses.activate
+def test_origin_stream_in_order() -> None:
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r"https://api\.shadowserver\.org/net/asn\?origin=.*"),
+        callback=_callback,
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    ips = [f"10.0.0.{i}" for i in range(10)]
+    result = list(client.origin_stream(iter(ips), workers=2, batch_size=3))
+
+    assert [q for q, _ in result] == ips
+    assert [r.asn if r else None for _, r in result] == [
+        "0", "1", "2", None, "4", "5", "6", "7", "8", "9"
+    ]
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_origin_stream_is_lazy() -> None:
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r"https://api\.shadowserver\.org/net/asn\?origin=.*"),
+        callback=_callback,
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    ips = (f"10.0.{i // 256}.{i % 256}" for i in itertools.count())
+    stream = client.origin_stream(ips, workers=2, batch_size=5)
+
+    assert [q for q, _ in itertools.islice(stream, 7)][-1] == "10.0.0.6"
+    stream.close()
+    assert len(responses.calls) <= 3
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import json
+import re
+import threading
+from typing import Dict, List
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+from RashlyOutlaid.batcher import AsyncBatcher, Batcher
+
+
+def test_batcher_combines_threads() -> None:
+
+    lookups: List[List[str]] = []
+    lock = threading.Lock()
+
+    def lookup(keys: List[str]) -> Dict[str, str]:
+        with lock:
+            lookups.append(sorted(keys))
+        return {key: key.upper() for key in keys if key != "missing"}
+
+    with Batcher(lookup, window=0.2, max_keys=100, normalize=str.lower) as batcher:
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            queries = ["a", "b", "A", "missing", "c", "b"]
+            results = list(pool.map(batcher.load, queries))
+
+    assert results == ["A", "B", "A", None, "C", "B"]
+    assert lookups == [["a", "b", "c", "missing"]]
+
+
+def test_batcher_max_keys() -> None:
+
+    lookups: List[List[int]] = []
+
+    def lookup(keys: List[int]) -> Dict[int, int]:
+        lookups.append(keys)
+        return {key: key for key in keys}
+
+    with Batcher(lookup, window=10, max_keys=3, workers=1) as batcher:
+        futures = [batcher.submit(n) for n in range(7)]
+        assert [future.result(5) for future in futures[:6]] == list(range(6))
+    assert futures[6].result() == 6
+
+    assert lookups == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_batcher_errors() -> None:
+
+    def lookup(keys: List[str]) -> Dict[str, str]:
+        raise RashlyOutlaid.libwhois.QueryError("down")
+
+    with Batcher(lookup, window=0.01) as batcher:
+        futures = [batcher.submit(key) for key in "abc"]
+        for future in futures:
+            with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+                future.result(5)
+
+    with pytest.raises(RuntimeError):
+        batcher.submit("d")
+
+
+def test_async_batcher() -> None:
+
+    lookups: List[List[str]] = []
+
+    async def lookup(keys: List[str]) -> Dict[str, str]:
+        lookups.append(keys)
+        await asyncio.sleep(0)
+        return {key: key.upper() for key in keys}
+
+    async def main() -> List:
+        batcher = AsyncBatcher(lookup, window=0.01, max_keys=2)
+        results = await batcher.load_many(["a", "b", "c", "a"])
+        await batcher.close()
+        return results
+
+    assert asyncio.run(main()) == ["A", "B", "C", "A"]
+    assert lookups == [["a", "b"], ["c", "a"]]
+
+
+def test_async_batcher_cancelled_lookup() -> None:
+
+    async def lookup(keys: List[str]) -> Dict[str, str]:
+        await asyncio.sleep(10)
+        return {}
+
+    async def main() -> None:
+        batcher = AsyncBatcher(lookup, window=0, max_keys=1)
+        waiter = asyncio.ensure_future(batcher.load("a"))
+        await asyncio.sleep(0.01)
+        for task in batcher._tasks:
+            task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(main())
+
+
+ORIGIN_URL = re.compile(r"https://api\.shadowserver\.org/net/asn\?origin=.*")
+
+
+@responses.activate
+def test_origin_batcher() -> None:
+
+    def callback(request: object) -> tuple:
+        ips = request.url.split("origin=")[1].split(",")  # type: ignore
+        body = [
+            {"ip": ip, "asn": ip.split(".")[-1], "prefix": f"{ip}/32"} for ip in ips
+        ]
+        return 200, {}, json.dumps(body)
+
+    responses.add_callback(responses.GET, ORIGIN_URL, callback)
+
+    client = shadowserver.Client(rate_limiter=None)
+    ips = [f"10.0.0.{n}" for n in range(20)] + ["not an ip"]
+    with client.origin_batcher(window=0.2) as batcher:
+        with concurrent.futures.ThreadPoolExecutor(len(ips)) as pool:
+            records = list(pool.map(batcher.load, ips))
+
+    assert [r.asn for r in records[:-1]] == [str(n) for n in range(20)]
+    assert records[-1] is None
+    assert len(responses.calls) == 1
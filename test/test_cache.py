@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.cache import MISSING, TTLCache
+
+
+def test_lru_eviction() -> None:
+
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", None)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses, cache.evictions) == (3, 1, 1)
+    assert cache.hit_ratio == 0.75
+
+
+def test_ttl() -> None:
+
+    cache = TTLCache(ttl=0.05)
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_threads() -> None:
+
+    cache = TTLCache(maxsize=50)
+
+    def worker(n: int) -> None:
+        for i in range(1000):
+            cache.set((n, i), i)
+            cache.get((n, i - 1))
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cache) == 50
+    assert cache.hits + cache.misses == 4000
+
+
+@responses.activate
+def test_asn_and_prefix_memoized() -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?query=2818",
+        json={"asn": "2818", "asname_short": "AS2818", "asname_long": "BBC", "geo": "GB"},
+    )
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?prefix=2818",
+        json=["212.58.224.0/19"],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, asn_cache=TTLCache())
+
+    assert client.asn(2818) == client.asn(2818)
+    assert client.prefix(2818) == client.prefix("2818") == ["212.58.224.0/19"]
+    assert len(responses.calls) == 2
+
+    client.prefix(2818).append("mutated")
+    assert client.prefix(2818) == ["212.58.224.0/19"]
+
+    client.asn(2818, use_cache=False)
+    assert len(responses.calls) == 3
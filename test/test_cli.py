@@ -0,0 +1,194 @@
+import io
+import json
+import os
+import re
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid import cli
+
+ORIGIN_URL = re.compile(r"https://api\.shadowserver\.org/net/asn\?origin=.*")
+
+
+FAILING = {"10.0.0.13"}
+
+
+def _callback(request: object) -> tuple:
+    ips = request.url.split("origin=")[1].split(",")  # type: ignore
+    if FAILING.intersection(ips):
+        return 404, {}, "{}"
+    body = [
+        {
+            "ip": ip,
+            "asn": ip.split(".")[-1],
+            "prefix": f"{ip}/32",
+            "asname_short": "TEST",
+            "geo": "NO",
+        }
+        for ip in ips
+    ]
+    return 200, {}, json.dumps(body)
+
+
+def _run(argv: list, stdin: str = "") -> tuple:
+    args = cli.parse_args(argv)
+    stdout = io.StringIO()
+    status = cli.run(args, io.StringIO(stdin), stdout)
+    return status, stdout.getvalue()
+
+
+def setup_function() -> None:
+    shadowserver.set_default_client(shadowserver.Client(rate_limiter=None, retry=None))
+
+
+def teardown_function() -> None:
+    shadowserver.set_default_client(None)
+
+
+@responses.activate
+def test_text_stdin_to_csv() -> None:
+
+    responses.add_callback(responses.GET, ORIGIN_URL, _callback)
+
+    status, out = _run(
+        ["origin", "-b", "2"], "10.0.0.1\n10.0.0.2\nnot an ip\n\n10.0.0.3\n"
+    )
+
+    assert status == 0
+    assert out.splitlines() == [
+        "ip,asn,prefix,asname,cn,isp",
+        "10.0.0.1,1,10.0.0.1/32,TEST,NO,",
+        "10.0.0.2,2,10.0.0.2/32,TEST,NO,",
+        "not an ip,,,,,",
+        "10.0.0.3,3,10.0.0.3/32,TEST,NO,",
+    ]
+
+
+@responses.activate
+def test_text_stdin_to_jsonl() -> None:
+
+    responses.add_callback(responses.GET, ORIGIN_URL, _callback)
+
+    status, out = _run(["origin", "-F", "jsonl"], "10.0.0.1\n")
+
+    assert status == 0
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert rows[0]["ip"] == "10.0.0.1"
+    assert "query" not in rows[0]
+
+    # the output is valid jsonl input for the same lookup
+    status, out = _run(["origin", "-f", "jsonl"], out)
+    assert [json.loads(line)["ip"] for line in out.splitlines()] == ["10.0.0.1"]
+
+
+@responses.activate
+def test_csv_and_jsonl_files(tmp_path: str) -> None:
+
+    responses.add_callback(responses.GET, ORIGIN_URL, _callback)
+
+    source = os.path.join(tmp_path, "in.csv")
+    with open(source, "w") as fh:
+        fh.write("name,address\na,10.0.0.5\nb,10.0.0.6\n")
+    status, out = _run(["origin", source, "-c", "address", "-F", "jsonl"])
+
+    assert status == 0
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert rows[0]["name"] == "a"
+    assert rows[0]["origin"]["asn"] == "5"
+    assert rows[1]["origin"]["prefix"] == "10.0.0.6/32"
+
+    source = os.path.join(tmp_path, "in.jsonl")
+    with open(source, "w") as fh:
+        fh.write('{"ip": "10.0.0.7", "seen": 3}\n{"ip": "bad"}\n')
+    status, out = _run(["origin", source])
+
+    rows = [json.loads(line) for line in out.splitlines()]
+    assert rows == [
+        {
+            "ip": "10.0.0.7",
+            "seen": 3,
+            "origin": {
+                "asn": "7",
+                "prefix": "10.0.0.7/32",
+                "asname": "TEST",
+                "cn": "NO",
+                "isp": "",
+            },
+        },
+        {"ip": "bad", "origin": None},
+    ]
+
+
+@responses.activate
+def test_resume(tmp_path: str) -> None:
+
+    responses.add_callback(responses.GET, ORIGIN_URL, _callback)
+
+    source = os.path.join(tmp_path, "ips.txt")
+    output = os.path.join(tmp_path, "out.csv")
+    with open(source, "w") as fh:
+        fh.write("".join(f"10.0.0.{n}\n" for n in range(10, 20)))
+
+    # 10.0.0.13 fails, the batch before it is written
+    status, _ = _run(["origin", source, "-o", output, "-b", "2", "-w", "1"])
+    assert status == 1
+    with open(output) as fh:
+        assert len(fh.read().splitlines()) == 3
+
+    # a crash left half a line behind
+    with open(output, "a") as fh:
+        fh.write("10.0.0.12,12,10.0")
+
+    responses.calls.reset()
+    FAILING.clear()
+    try:
+        status, _ = _run(
+            ["origin", source, "-o", output, "-b", "2", "-w", "1", "--resume"]
+        )
+    finally:
+        FAILING.add("10.0.0.13")
+    assert status == 0
+
+    with open(output) as fh:
+        lines = fh.read().splitlines()
+    assert len(lines) == 11
+    assert [line.split(",")[1] for line in lines[1:]] == [
+        str(n) for n in range(10, 20)
+    ]
+    assert len(responses.calls) == 4
+    assert responses.calls[0].request.url.endswith("origin=10.0.0.12,10.0.0.13")
+
+
+@responses.activate
+def test_resume_after_header(tmp_path: str) -> None:
+
+    responses.add_callback(responses.GET, ORIGIN_URL, _callback)
+
+    source = os.path.join(tmp_path, "ips.csv")
+    output = os.path.join(tmp_path, "out.csv")
+    with open(source, "w") as fh:
+        fh.write("ip,x\n10.0.0.1,a\n")
+    with open(output, "w") as fh:
+        fh.write("ip,x,asn,prefix,asname,cn,isp\n")
+
+    status, _ = _run(["origin", source, "-o", output, "--resume"])
+
+    assert status == 0
+    with open(output) as fh:
+        lines = fh.read().splitlines()
+    assert lines[0] == "ip,x,asn,prefix,asname,cn,isp"
+    assert [line.split(",")[:3] for line in lines[1:]] == [["10.0.0.1", "a", "1"]]
+
+
+def test_unknown_column(tmp_path: str) -> None:
+
+    source = os.path.join(tmp_path, "ips.csv")
+    output = os.path.join(tmp_path, "out.csv")
+    with open(source, "w") as fh:
+        fh.write("ip,x\n10.0.0.1,a\n")
+
+    with pytest.raises(SystemExit, match="column 'src' is not in the csv header"):
+        _run(["origin", source, "-c", "src", "-o", output])
+    assert not os.path.exists(output)
@@ -0,0 +1,98 @@
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.columnar import ASNTable
+
+SS_DATA = [
+    {
+        "ip": "8.8.8.8",
+        "asn": "15169",
+        "prefix": "8.8.8.0/24",
+        "asname_short": "GOOGLE",
+        "asname_long": "GOOGLE",
+        "geo": "US",
+        "peer": "1101 6696",
+    },
+    {
+        "ip": "2001:4860:4860::8888",
+        "asn": "15169",
+        "prefix": "2001:4860::/32",
+        "asname_short": "GOOGLE",
+        "asname_long": "GOOGLE",
+        "geo": "US",
+    },
+    {"ip": "4.2.2.4", "asn": "3356", "prefix": "4.0.0.0/9", "asname_short": "LEVEL3", "geo": "US"},
+]
+
+
+def test_from_json() -> None:
+
+    table = ASNTable.from_json(SS_DATA)
+
+    assert len(table) == 3
+    assert list(table.asn) == [15169, 15169, 3356]
+    assert list(table.version) == [4, 6, 4]
+    assert list(table.prefixlen) == [24, 32, 9]
+    assert table.network_lo[0] == 0x08080800
+    assert table.network_hi[1] == 0x20014860 << 32
+    assert table.asname.values == ["GOOGLE", "LEVEL3"]
+    assert list(table.asname.codes) == [0, 0, 1]
+    assert table.ip(1) == "2001:4860:4860::8888"
+    assert table.prefix(2) == "4.0.0.0/9"
+    assert list(table) == shadowserver._map_shadowserver_model(SS_DATA)
+
+
+def test_asn_values() -> None:
+
+    asns = [15169, "15169", "²", 2**32, -1, "AS1", None, True, 2**32 - 1]
+    table = ASNTable.from_json([{"ip": "8.8.8.8", "asn": asn} for asn in asns])
+
+    assert list(table.asn) == [15169, 15169, 0, 0, 0, 0, 0, 0, 2**32 - 1]
+
+
+def test_to_numpy() -> None:
+
+    numpy = pytest.importorskip("numpy")
+    table = ASNTable.from_json(SS_DATA)
+    columns = table.to_numpy()
+
+    assert columns["asn"].dtype == numpy.uint32
+    assert columns["asn"].tolist() == [15169, 15169, 3356]
+    assert columns["cn_values"][columns["cn"]].tolist() == ["US", "US", "US"]
+
+    # zero copy: the array shares memory with the table
+    columns["asn"][0] = 1
+    assert table.asn[0] == 1
+
+    # the table cannot grow while a view is alive
+    with pytest.raises(BufferError):
+        table.extend(SS_DATA)
+    del columns
+    table.extend(SS_DATA)
+    assert len(table) == 6
+
+
+def test_to_arrow() -> None:
+
+    pytest.importorskip("pyarrow")
+    arrow = ASNTable.from_json(SS_DATA).to_arrow()
+
+    assert arrow.num_rows == 3
+    assert arrow.column("prefixlen").to_pylist() == [24, 32, 9]
+    assert arrow.column("asname").to_pylist() == ["GOOGLE", "GOOGLE", "LEVEL3"]
+
+
+@responses.activate
+def test_origin_table() -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=8.8.8.8,4.2.2.4",
+        json=[SS_DATA[0], SS_DATA[2]],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    table = client.origin_table(["8.8.8.8", "4.2.2.4", "8.8.8.8"])
+
+    assert list(table.asn) == [15169, 3356]
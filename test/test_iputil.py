@@ -0,0 +1,67 @@
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid import iputil
+from RashlyOutlaid.libwhois import is_ip
+
+
+def test_pack() -> None:
+
+    assert iputil.pack("8.8.8.8") == (4, 0x08080808)
+    assert iputil.pack(b" 8.8.4.4\n") == (4, 0x08080404)
+    assert iputil.pack("2001:db8::1") == (6, 0x20010DB8 << 96 | 1)
+    assert iputil.pack("256.1.1.1") is None
+    assert iputil.pack("1.2.3") is None
+    assert iputil.pack("2001:db8::g") is None
+    assert iputil.pack(134744072) is None  # type: ignore
+    assert iputil.pack(None) is None  # type: ignore
+    assert iputil.unpack((4, 0x08080808)) == "8.8.8.8"
+    assert iputil.normalize("2001:DB8:0:0::1") == "2001:db8::1"
+
+
+def test_many() -> None:
+
+    packed, invalid = iputil.pack_many(["1.2.3.4", "x", "::1", "999.1.1.1"])
+    assert packed == [(4, 0x01020304), None, (6, 1), None]
+    assert invalid == ["x", "999.1.1.1"]
+
+    normalized, invalid = iputil.normalize_many(iter(["::0:1", "x"]))
+    assert normalized == ["::1", None]
+    assert invalid == ["x"]
+
+
+def test_pack_network() -> None:
+
+    assert iputil.pack_network("4.0.0.0/9") == (4, 0x04000000, 9)
+    assert iputil.pack_network("8.8.8.8/24") == (4, 0x08080800, 24)
+    assert iputil.pack_network("2001:4860::/32") == (6, 0x20014860 << 96, 32)
+    assert iputil.pack_network("8.8.8.8") == (4, 0x08080808, 32)
+    assert iputil.pack_network("8.8.8.0/33") is None
+    assert iputil.pack_network("") is None
+
+
+def test_is_ip_first_octet() -> None:
+
+    assert is_ip("255.1.1.1")
+    assert not is_ip("256.1.1.1")
+    assert not is_ip("0.1.1.1")
+
+
+@responses.activate
+def test_invalid_addresses_not_sent() -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=8.8.8.8",
+        json=[{"ip": "8.8.8.8", "asn": "15169", "prefix": "8.8.8.0/24"}],
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    assert [r.asn for r in client.origin(["8.8.8.8", "8.8.8.256"])] == ["15169"]
+
+    assert [r.asn for r in client.origin([134744072, "8.8.8.8"])] == ["15169"]
+
+    result = client.bulk_origin(["not an ip", "8.8.8.8", 134744072])
+    assert result.invalid == ["not an ip", "134744072"]
+    assert [r.asn for r in result.records] == ["15169"]
@@ -0,0 +1,110 @@
+import socketserver
+import threading
+import time
+from typing import Iterator, List
+
+import pytest
+
+from RashlyOutlaid import libwhois
+from RashlyOutlaid.libwhois import MAX_CONNECTIONS, ASNWhois, QueryError
+
+RESPONSES = {
+    "212.58.245.94": "212.58.245.94 | 2818 | 212.58.224.0/19 | BBC | GB | BBC Internet Services, UK, GB",
+    "83.58.1.1": "83.58.1.1 | 3352 | 83.58.0.0/15 | TELEFONICA | ES | Telefónica de España",
+}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        queries: List[str] = []
+        for line in self.rfile:
+            line = line.decode().strip()
+            if line == "end":
+                break
+            if not line.startswith("begin"):
+                queries.append(line)
+        body = "\n".join(RESPONSES[query] for query in queries) + "\n"
+        # dribble the response out in tiny writes
+        data = body.encode("utf-8")
+        for start in range(0, len(data), 5):
+            self.wfile.write(data[start : start + 5])
+            self.wfile.flush()
+
+
+@pytest.fixture
+def server() -> Iterator[socketserver.TCPServer]:
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+    server.daemon_threads = True
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_bulk_origin_small_reads(server: socketserver.TCPServer) -> None:
+
+    asnwhois = ASNWhois("127.0.0.1", server.server_address[1], recv_size=7)
+    asnwhois.query = list(RESPONSES)
+    result = asnwhois.result
+
+    assert result["212.58.245.94"].asn == "2818"
+    assert result["212.58.245.94"].isp == "BBC Internet Services, UK, GB"
+    assert result["83.58.1.1"].isp == "Telefónica de España"
+    assert result["83.58.1.1"].peers == []
+
+
+def test_iter_results(server: socketserver.TCPServer) -> None:
+
+    asnwhois = ASNWhois("127.0.0.1", server.server_address[1])
+    asnwhois.query = list(RESPONSES)
+    streamed = list(asnwhois.iter_results())
+
+    assert asnwhois._result == {}
+    assert [query for query, _ in streamed] == list(RESPONSES)
+    assert dict(streamed) == asnwhois.result
+    assert sorted(asnwhois.iter_results()) == sorted(streamed)
+
+
+def test_parallel_connections(server: socketserver.TCPServer) -> None:
+
+    queries = list(RESPONSES) * 3
+
+    single = ASNWhois("127.0.0.1", server.server_address[1])
+    single.query = queries
+
+    parallel = ASNWhois("127.0.0.1", server.server_address[1], connections=3)
+    parallel.query = queries
+
+    assert parallel._shards() == [queries[0:2], queries[2:4], queries[4:6]]
+    assert list(parallel.result.items()) == list(single.result.items())
+
+
+def test_parallel_consumer_stops(
+    server: socketserver.TCPServer, monkeypatch: pytest.MonkeyPatch
+) -> None:
+
+    monkeypatch.setattr(libwhois, "PARALLEL_QUEUE_SIZE", 1)
+    before = threading.active_count()
+
+    asnwhois = ASNWhois("127.0.0.1", server.server_address[1], connections=2)
+    asnwhois.query = list(RESPONSES) * 50
+    results = asnwhois.iter_results()
+    assert next(results)[0] in RESPONSES
+    results.close()
+
+    deadline = time.monotonic() + 2
+    while threading.active_count() > before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() <= before
+
+
+def test_connections_capped() -> None:
+
+    asnwhois = ASNWhois()
+    with pytest.raises(QueryError):
+        asnwhois.connections = MAX_CONNECTIONS + 1
+    with pytest.raises(QueryError):
+        asnwhois.connections = 0
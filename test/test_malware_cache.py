@@ -0,0 +1,88 @@
+import datetime
+import time
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.cache import MalwareCache
+
+MD5 = "dfe1832e02888422f48d6896dc8e8f73"
+SHA1 = "c56ba498d41caa7be3c1eb5588cec27c413eb208"
+SAMPLE = {
+    "md5": MD5,
+    "sha1": SHA1,
+    "sha256": "d8d395f8744335fba53b0a4308e7b380a0aca86bfc8939ded9f4c8c5cb1e838a",
+    "first_seen": "2016-08-25 02:44:39",
+    "anti_virus": [
+        {"signature": "Troj/Agent-APCU", "vendor": "Sophos"},
+        {"vendor": "Clam", "signature": "PUA.Win.Packer.Purebasic-2"},
+    ],
+}
+
+
+@responses.activate
+def test_malware_cache_persists(tmp_path) -> None:
+
+    responses.add(
+        responses.GET,
+        f"https://api.shadowserver.org/malware/info?sample={MD5}",
+        json=[SAMPLE],
+    )
+    path = str(tmp_path / "malware.sqlite")
+
+    client = shadowserver.Client(rate_limiter=None, malware_cache=MalwareCache(path))
+    first = client.malware([MD5])
+    client.malware_cache.close()
+
+    client = shadowserver.Client(rate_limiter=None, malware_cache=MalwareCache(path))
+    second = client.malware([MD5.upper(), SHA1])
+
+    assert len(responses.calls) == 1
+    assert first[0] == second[0] == second[1]
+    assert second[0].first_seen == datetime.datetime(2016, 8, 25, 2, 44, 39)
+    assert [av.vendor for av in second[0].anti_virus] == ["Sophos", "Clam"]
+    assert client.malware_cache.hits == 2
+
+
+@responses.activate
+def test_malware_cache_stale() -> None:
+
+    responses.add(
+        responses.GET,
+        f"https://api.shadowserver.org/malware/info?sample={MD5}",
+        json=[SAMPLE],
+    )
+
+    cache = MalwareCache(max_age=0.05)
+    client = shadowserver.Client(rate_limiter=None, malware_cache=cache)
+    client.malware([MD5])
+    client.malware([MD5])
+    assert len(responses.calls) == 1
+
+    time.sleep(0.06)
+    assert client.malware([MD5])[0].md5 == MD5
+    assert len(responses.calls) == 2
+
+    time.sleep(0.06)
+    assert cache.expire() == 3
+    assert len(cache) == 0
+
+
+@responses.activate
+def test_bulk_malware_uses_cache() -> None:
+
+    responses.add(
+        responses.GET,
+        f"https://api.shadowserver.org/malware/info?sample={MD5}",
+        json=[SAMPLE],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, malware_cache=MalwareCache())
+    first = client.bulk_malware([MD5])
+    second = client.bulk_malware([SHA1, MD5])
+    third = client.malware([SAMPLE["sha256"]])
+
+    assert len(responses.calls) == 1
+    assert first.records[0] == second.records[0] == second.records[1] == third[0]
+    assert client.malware_cache.hits == 3
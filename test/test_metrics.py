@@ -0,0 +1,97 @@
+import socketserver
+import threading
+from typing import Dict, Iterator, List
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid import metrics
+from RashlyOutlaid.libwhois import ASNWhois
+from RashlyOutlaid.prefixcache import PrefixCache
+from RashlyOutlaid.resilience import RetryPolicy
+
+ORIGIN_URL = "https://api.shadowserver.org/net/asn?origin=8.8.8.8"
+
+
+@pytest.fixture
+def collector() -> Iterator[metrics.Collector]:
+    collector = metrics.register(metrics.Collector())
+    yield collector
+    metrics.unregister(collector)
+
+
+def test_register() -> None:
+
+    observer = metrics.Observer()
+    metrics.register(observer)
+    metrics.register(observer)
+    assert metrics.observers.count(observer) == 1
+
+    metrics.unregister(observer)
+    assert observer not in metrics.observers
+
+
+@responses.activate
+def test_api_metrics(collector: metrics.Collector, google_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=503)
+    responses.add(responses.GET, ORIGIN_URL, json=google_origin)
+
+    client = shadowserver.Client(
+        rate_limiter=None,
+        prefix_cache=PrefixCache(),
+        retry=RetryPolicy(backoff=0.001, jitter=False),
+    )
+    client.origin(["8.8.8.8"])
+    client.origin(["8.8.8.8", "8.8.8.9"])
+
+    assert collector.requests[("origin", "503")] == 1
+    assert collector.requests[("origin", "200")] == 1
+    assert collector.retries["origin"] == 1
+    assert collector.batch_size["origin"].count == 1
+    assert collector.bytes_sent["origin"] == 2 * len(ORIGIN_URL)
+    assert collector.bytes_received["origin"] > 0
+    assert collector.hit_ratio("prefix") == 2 / 3
+
+    text = collector.render()
+    assert 'rashlyoutlaid_requests_total{endpoint="origin",status="503"} 1' in text
+    assert 'rashlyoutlaid_request_duration_seconds_count{endpoint="origin"} 2' in text
+    assert (
+        'rashlyoutlaid_request_duration_seconds_bucket{endpoint="origin",le="+Inf"} 2'
+        in text
+    )
+    assert 'rashlyoutlaid_batch_size_bucket{endpoint="origin",le="1"} 1' in text
+    assert 'rashlyoutlaid_cache_hits_total{cache="prefix"} 2' in text
+    assert "# TYPE rashlyoutlaid_retries_total counter" in text
+
+
+WHOIS_LINE = b"8.8.8.8 | 15169 | 8.8.8.0/24 | GOOGLE | US | GOOGLE\n"
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        for line in self.rfile:
+            if line.strip() == b"end":
+                break
+        self.wfile.write(WHOIS_LINE)
+
+
+def test_whois_metrics(collector: metrics.Collector) -> None:
+
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        asnwhois = ASNWhois("127.0.0.1", server.server_address[1])
+        asnwhois.query = ["8.8.8.8"]
+        assert asnwhois.result["8.8.8.8"].asn == "15169"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert collector.requests[("whois_origin", "ok")] == 1
+    assert collector.bytes_sent["whois_origin"] == len(b"begin origin\n8.8.8.8\nend\n")
+    assert collector.bytes_received["whois_origin"] == len(WHOIS_LINE)
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.prefixcache import PrefixCache
+
+
+def _record(asn: str, prefix: str) -> shadowserver.ASNRecord:
+    return shadowserver.ASNRecord(asn, prefix, f"AS{asn}", "US", f"AS{asn}", [])
+
+
+def test_longest_prefix_match() -> None:
+
+    cache = PrefixCache()
+    level3 = _record("3356", "4.0.0.0/9")
+    google = _record("15169", "4.2.2.0/24")
+    v6 = _record("15169", "2001:4860::/32")
+
+    assert cache.add(level3)
+    assert cache.add(google)
+    assert cache.add(v6)
+    assert not cache.add(_record("1", ""))
+
+    assert cache.lookup("4.2.2.4") is google
+    assert cache.lookup("4.100.0.1") is level3
+    assert cache.lookup("2001:4860:4860::8888") is v6
+    assert cache.lookup("8.8.8.8") is None
+    assert cache.lookup("not an ip") is None
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_ttl_and_eviction() -> None:
+
+    cache = PrefixCache(maxsize=2, ttl=0.05)
+    cache.add(_record("1", "10.0.0.0/8"))
+    cache.add(_record("2", "11.0.0.0/8"))
+    assert cache.lookup("10.1.1.1").asn == "1"
+
+    cache.add(_record("3", "12.0.0.0/8"))
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert cache.lookup("11.1.1.1") is None
+    assert cache.lookup("10.1.1.1").asn == "1"
+
+    time.sleep(0.06)
+    assert cache.lookup("12.1.1.1") is None
+    assert len(cache) == 1
+
+
+@responses.activate
+def test_origin_uses_prefix_cache() -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=4.2.2.4,8.8.8.8",
+        json=[
+            {"ip": "4.2.2.4", "asn": "3356", "prefix": "4.0.0.0/9"},
+            {"ip": "8.8.8.8", "asn": "15169", "prefix": "8.8.8.0/24"},
+        ],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, prefix_cache=PrefixCache())
+
+    assert [r.asn for r in client.origin(["4.2.2.4", "8.8.8.8"])] == ["3356", "15169"]
+    assert [r.asn for r in client.origin(["8.8.8.9", "4.4.4.4"])] == ["15169", "3356"]
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_bulk_origin_uses_prefix_cache() -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=10.0.0.1",
+        json=[{"ip": "10.0.0.1", "asn": "64512", "prefix": "10.0.0.0/24"}],
+    )
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=10.0.1.1",
+        json=[{"ip": "10.0.1.1", "asn": "64513", "prefix": "10.0.1.0/24"}],
+    )
+
+    client = shadowserver.Client(rate_limiter=None, prefix_cache=PrefixCache())
+    client.origin(["10.0.0.1"])
+    result = client.bulk_origin(["10.0.0.2", "10.0.1.1", "10.0.0.3"])
+
+    assert [r.asn for r in result.records] == ["64512", "64513", "64512"]
+    assert [call.request.url for call in responses.calls] == [
+        "https://api.shadowserver.org/net/asn?origin=10.0.0.1",
+        "https://api.shadowserver.org/net/asn?origin=10.0.1.1",
+    ]
+    assert client.origin(["10.0.1.2"])[0].asn == "64513"
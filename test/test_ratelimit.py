@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.ratelimit import RateLimiter, default_limiter
+
+
+def test_burst_then_rate() -> None:
+
+    limiter = RateLimiter(rate=10, burst=2)
+
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.01)
+    assert limiter.reserve() == pytest.approx(0.2, abs=0.01)
+    assert limiter.last_wait == pytest.approx(0.2, abs=0.01)
+    assert limiter.calls == 4
+    assert limiter.throttled == 2
+    assert limiter.total_wait == pytest.approx(0.3, abs=0.02)
+
+
+def test_threads_share_limiter() -> None:
+
+    limiter = RateLimiter(rate=100, burst=1)
+    waits = []
+
+    def worker() -> None:
+        limiter.acquire()
+        waits.append(limiter.last_wait)
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert limiter.calls == 5
+    assert max(waits) == pytest.approx(0.04, abs=0.01)
+
+
+def test_configure() -> None:
+
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+    with pytest.raises(ValueError):
+        RateLimiter(burst=0)
+
+
+@responses.activate
+def test_client_uses_limiter() -> None:
+
+    responses.add(
+        responses.GET, "https://api.shadowserver.org/net/asn?prefix=2818", json=[]
+    )
+
+    assert shadowserver.Client().rate_limiter is default_limiter
+    assert shadowserver.Client(rate_limiter=None).rate_limiter is None
+
+    limiter = RateLimiter(rate=20, burst=1)
+    client = shadowserver.Client(rate_limiter=limiter)
+    client.prefix(2818)
+    client.prefix(2818)
+
+    assert limiter.calls == 2
+    assert limiter.throttled == 1
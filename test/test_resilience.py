@@ -0,0 +1,216 @@
+import json
+import re
+import time
+from typing import Any, Dict, List
+
+import pytest
+import requests
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+from RashlyOutlaid.ratelimit import RateLimiter
+from RashlyOutlaid.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    Deadline,
+    DeadlineExceeded,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+ORIGIN_URL = "https://api.shadowserver.org/net/asn?origin=8.8.8.8"
+
+FAST = RetryPolicy(retries=3, backoff=0.001, jitter=False)
+
+
+def test_retry_policy_delay() -> None:
+
+    policy = RetryPolicy(backoff=1, max_backoff=5, jitter=False)
+
+    assert [policy.delay(n) for n in range(4)] == [1, 2, 4, 5]
+    assert policy.delay(0, retry_after=3) == 3
+    assert policy.delay(0, retry_after=60) == 5
+    assert 0 <= RetryPolicy(backoff=1).delay(2) <= 4
+
+
+def test_parse_retry_after() -> None:
+
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+
+
+def test_circuit_breaker() -> None:
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.failure()
+    breaker.allow()
+    breaker.failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.allow()
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    breaker.success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@responses.activate
+def test_retry_transient_errors(google_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=503)
+    responses.add(responses.GET, ORIGIN_URL, status=429, headers={"Retry-After": "0"})
+    responses.add(responses.GET, ORIGIN_URL, body=requests.exceptions.ConnectionError())
+    responses.add(responses.GET, ORIGIN_URL, json=google_origin)
+
+    client = shadowserver.Client(rate_limiter=None, retry=FAST)
+
+    assert client.origin(["8.8.8.8"])[0].asn == "15169"
+    assert len(responses.calls) == 4
+
+
+@responses.activate
+def test_no_retry_on_client_error() -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=404)
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    client = shadowserver.Client(rate_limiter=None, retry=FAST, circuit_breaker=breaker)
+    with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+        client.origin(["8.8.8.8"])
+
+    assert len(responses.calls) == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@responses.activate
+def test_circuit_breaker_fails_fast() -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=500)
+
+    client = shadowserver.Client(
+        rate_limiter=None,
+        retry=FAST,
+        circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60),
+    )
+    with pytest.raises(CircuitOpenError):
+        client.origin(["8.8.8.8"])
+    with pytest.raises(CircuitOpenError):
+        client.origin(["8.8.8.8"])
+
+    assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_circuit_breaker_recovers(google_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=500)
+    responses.add(responses.GET, ORIGIN_URL, body="not json")
+    responses.add(responses.GET, ORIGIN_URL, json=google_origin)
+
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    client = shadowserver.Client(rate_limiter=None, retry=None, circuit_breaker=breaker)
+    with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+        client.origin(["8.8.8.8"])
+    assert breaker.state == "open"
+
+    # an expired deadline does not consume the half open trial
+    time.sleep(0.02)
+    with pytest.raises(DeadlineExceeded):
+        client.origin(["8.8.8.8"], deadline=Deadline(0))
+
+    # neither does an unexpected error during the trial
+    with pytest.raises(ValueError):
+        client.origin(["8.8.8.8"])
+    time.sleep(0.02)
+
+    assert client.origin(["8.8.8.8"])[0].asn == "15169"
+    assert breaker.state == "closed"
+
+
+@responses.activate
+def test_deadline() -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, status=503)
+
+    client = shadowserver.Client(
+        rate_limiter=None, retry=RetryPolicy(retries=5, backoff=10, jitter=False)
+    )
+    began = time.monotonic()
+    with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+        client.origin(["8.8.8.8"], deadline=1)
+
+    assert time.monotonic() - began < 1
+    assert len(responses.calls) == 1
+
+    expired = Deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        client.origin(["8.8.8.8"], deadline=expired)
+
+
+@responses.activate
+def test_bulk_partial_results_after_retries(google_origin: List[Dict]) -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=8.8.8.8",
+        json=google_origin,
+    )
+    responses.add(
+        responses.GET, "https://api.shadowserver.org/net/asn?origin=1.1.1.1", status=502
+    )
+
+    client = shadowserver.Client(rate_limiter=None, retry=FAST)
+    result = client.bulk_origin(["8.8.8.8", "1.1.1.1"], workers=2, batch_size=1)
+
+    assert [r.asn for r in result.records] == ["15169"]
+    assert result.failed == ["1.1.1.1"]
+    assert len(responses.calls) == 5
+
+
+@responses.activate
+def test_stream_deadline_per_batch(google_origin: List[Dict]) -> None:
+
+    def slow(request: Any) -> tuple:
+        time.sleep(0.02)
+        ip = request.url.split("origin=")[1]
+        return 200, {}, json.dumps([dict(google_origin[0], ip=ip)])
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r"https://api\.shadowserver\.org/net/asn\?origin=.*"),
+        slow,
+    )
+    ips = [f"8.8.8.{i}" for i in range(1, 6)]
+
+    client = shadowserver.Client(rate_limiter=None, retry=None, deadline=0.05)
+    streamed = list(client.origin_stream(ips, workers=1, batch_size=1))
+    assert [record.asn for _, record in streamed] == ["15169"] * 5
+
+    with pytest.raises(DeadlineExceeded):
+        list(
+            client.origin_stream(
+                ips, workers=1, batch_size=1, deadline=Deadline(0.05)
+            )
+        )
+
+
+@responses.activate
+def test_deadline_after_rate_limit_wait(google_origin: List[Dict]) -> None:
+
+    responses.add(responses.GET, ORIGIN_URL, json=google_origin)
+
+    client = shadowserver.Client(rate_limiter=RateLimiter(rate=10, burst=1), retry=None)
+    client.origin(["8.8.8.8"])
+    with pytest.raises(DeadlineExceeded):
+        client.origin(["8.8.8.8"], deadline=0.05)
+
+    assert len(responses.calls) == 1
@@ -0,0 +1,146 @@
+import multiprocessing
+import pickle
+from typing import Dict, List
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+from RashlyOutlaid.cache import MalwareCache, SharedCache
+
+ORIGIN_URL = "https://api.shadowserver.org/net/asn?origin="
+ASN_RESPONSE = {
+    "asn": "15169",
+    "asname_short": "GOOGLE",
+    "asname_long": "GOOGLE - Google LLC",
+    "geo": "US",
+}
+MD5 = "dfe1832e02888422f48d6896dc8e8f73"
+SAMPLE = {
+    "md5": MD5,
+    "sha1": "c56ba498d41caa7be3c1eb5588cec27c413eb208",
+    "sha256": "d8d395f8744335fba53b0a4308e7b380a0aca86bfc8939ded9f4c8c5cb1e838a",
+    "first_seen": "2016-08-25 02:44:39",
+    "anti_virus": [{"signature": "Troj/Agent-APCU", "vendor": "Sophos"}],
+}
+
+
+def client(path) -> shadowserver.Client:
+    return shadowserver.Client(
+        rate_limiter=None, retry=None, shared_cache=SharedCache(str(path))
+    )
+
+
+@responses.activate
+def test_shared_cache_between_clients(tmp_path, google_origin: List[Dict]) -> None:
+
+    path = tmp_path / "shared.sqlite"
+    responses.add(responses.GET, f"{ORIGIN_URL}8.8.8.8", json=google_origin)
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?query=15169",
+        json=ASN_RESPONSE,
+    )
+    responses.add(
+        responses.GET,
+        f"https://api.shadowserver.org/malware/info?sample={MD5}",
+        json=[SAMPLE],
+    )
+
+    first = client(path)
+    origin = first.origin(["8.8.8.8"])
+    asn = first.asn(15169)
+    malware = first.malware([MD5])
+
+    second = client(path)
+    assert second.origin(["8.8.8.8"]) == origin
+    assert second.asn(15169) == asn
+    assert second.malware([SAMPLE["sha1"]]) == malware
+    assert second.bulk_origin(["8.8.8.8"]).records == origin
+
+    assert len(responses.calls) == 3
+    assert second.shared_cache.hits == 4
+    assert second.shared_cache.misses == 0
+
+
+@responses.activate
+def test_shared_cache_only_fetches_misses(tmp_path, google_origin: List[Dict]) -> None:
+
+    path = tmp_path / "shared.sqlite"
+    responses.add(responses.GET, f"{ORIGIN_URL}8.8.8.8", json=google_origin)
+    responses.add(
+        responses.GET,
+        f"{ORIGIN_URL}8.8.4.4",
+        json=[dict(google_origin[0], ip="8.8.4.4", prefix="8.8.4.0/24")],
+    )
+
+    client(path).origin(["8.8.8.8"])
+    records = client(path).origin(["8.8.8.8", "8.8.4.4"])
+
+    assert [r.prefix for r in records] == ["8.8.8.0/24", "8.8.4.0/24"]
+    assert [call.request.url for call in responses.calls] == [
+        f"{ORIGIN_URL}8.8.8.8",
+        f"{ORIGIN_URL}8.8.4.4",
+    ]
+
+
+def test_shared_cache_eviction_and_ttl(tmp_path) -> None:
+
+    cache = SharedCache(str(tmp_path / "shared.sqlite"), maxsize=10)
+    for i in range(25):
+        cache.put_many("origin", [(f"10.0.0.{i}", {"ip": f"10.0.0.{i}"})])
+
+    assert len(cache) <= 10
+    assert cache.evictions >= 15
+    assert cache.get_many("origin", ["10.0.0.24"]) == {
+        "10.0.0.24": {"ip": "10.0.0.24"}
+    }
+    assert cache.get_many("origin", ["10.0.0.0"]) == {}
+
+    large = SharedCache(str(tmp_path / "large.sqlite"), maxsize=1000)
+    for i in range(1500):
+        large.put_many("peer", [(str(i), i)])
+    assert 900 <= len(large) <= 1000 + 10
+
+    expired = SharedCache(str(tmp_path / "shared.sqlite"), ttl=-1)
+    assert expired.get_many("origin", ["10.0.0.24"]) == {}
+
+    with pytest.raises(ValueError):
+        SharedCache(str(tmp_path / "other.sqlite"), maxsize=0)
+
+
+def _fill(cache: SharedCache, worker: int) -> None:
+    cache.put_many("peer", [(f"{worker}.{i}", [worker, i]) for i in range(50)])
+
+
+def test_shared_cache_across_processes(tmp_path) -> None:
+
+    cache = SharedCache(str(tmp_path / "shared.sqlite"))
+    assert pickle.loads(pickle.dumps(cache)).path == cache.path
+
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_fill, args=(cache, w)) for w in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert [worker.exitcode for worker in workers] == [0, 0, 0, 0]
+    assert len(cache) == 200
+    assert cache.get_many("peer", ["3.49"]) == {"3.49": [3, 49]}
+
+
+@responses.activate
+def test_shared_hits_not_stored_in_malware_cache(tmp_path) -> None:
+
+    shared = SharedCache(str(tmp_path / "shared.sqlite"))
+    shared.put_many("malware", [(MD5, SAMPLE)])
+
+    malware_cache = MalwareCache()
+    client = shadowserver.Client(
+        rate_limiter=None, shared_cache=shared, malware_cache=malware_cache
+    )
+    assert client.malware([MD5])[0].md5 == MD5
+
+    assert len(responses.calls) == 0
+    assert len(malware_cache) == 0
@@ -0,0 +1,102 @@
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Dict, List
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+from RashlyOutlaid.singleflight import SingleFlight
+
+
+
+def test_do_many_shares_keys_in_flight() -> None:
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    looked_up: List[List[str]] = []
+
+    def slow(keys: List[str]) -> Dict[str, str]:
+        looked_up.append(keys)
+        started.set()
+        release.wait(5)
+        return {key: key.upper() for key in keys if key != "missing"}
+
+    with concurrent.futures.ThreadPoolExecutor(2) as pool:
+        first = pool.submit(flight.do_many, "ns", ["a", "b", "missing"], slow)
+        started.wait(5)
+        second = pool.submit(flight.do_many, "ns", ["b", "c", "missing"], slow)
+        while len(looked_up) < 2:
+            time.sleep(0.01)
+        release.set()
+
+        assert first.result() == {"a": "A", "b": "B"}
+        assert second.result() == {"b": "B", "c": "C"}
+
+    assert looked_up == [["a", "b", "missing"], ["c"]]
+    assert len(flight) == 0
+
+
+def test_errors_reach_every_waiter() -> None:
+
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing() -> None:
+        started.set()
+        release.wait(5)
+        raise RashlyOutlaid.libwhois.QueryError("down")
+
+    with concurrent.futures.ThreadPoolExecutor(3) as pool:
+        owner = pool.submit(flight.do, "key", failing)
+        started.wait(5)
+        waiters = [pool.submit(flight.do, "key", failing) for _ in range(2)]
+        time.sleep(0.05)
+        release.set()
+
+        for future in [owner] + waiters:
+            with pytest.raises(RashlyOutlaid.libwhois.QueryError):
+                future.result()
+
+    assert len(flight) == 0
+
+
+@responses.activate
+def test_concurrent_origin_is_coalesced(google_origin: List[Dict]) -> None:
+
+    def callback(request: object) -> tuple:
+        time.sleep(0.3)
+        return 200, {}, json.dumps(google_origin)
+
+    responses.add_callback(
+        responses.GET, "https://api.shadowserver.org/net/asn?origin=8.8.8.8", callback
+    )
+
+    client = shadowserver.Client(rate_limiter=None)
+    with concurrent.futures.ThreadPoolExecutor(5) as pool:
+        results = list(pool.map(lambda _: client.origin(["8.8.8.8"]), range(5)))
+
+    assert [r[0].asn for r in results] == ["15169"] * 5
+    assert len(responses.calls) == 1
+
+
+@responses.activate
+def test_coalesce_disabled(google_origin: List[Dict]) -> None:
+
+    responses.add(
+        responses.GET,
+        "https://api.shadowserver.org/net/asn?origin=8.8.8.8",
+        json=google_origin,
+    )
+
+    client = shadowserver.Client(rate_limiter=None, coalesce=False)
+    client.origin(["8.8.8.8"])
+    client.origin(["8.8.8.8"])
+
+    assert client._flight is None
+    assert len(responses.calls) == 2
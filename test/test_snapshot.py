@@ -0,0 +1,123 @@
+import os
+
+import pytest
+import responses
+
+import RashlyOutlaid.api as shadowserver
+import RashlyOutlaid.libwhois
+from RashlyOutlaid.snapshot import Snapshot, SnapshotError, build_snapshot
+
+API = "https://api.shadowserver.org/net/asn"
+
+ASNS = {
+    15169: ("GOOGLE", "US", "Google LLC", ["8.8.8.0/24", "8.8.0.0/16", "2001:4860::/32"]),
+    2818: ("AS2818", "GB", "BBC", ["212.58.224.0/19", "8.8.8.128/25"]),
+}
+
+
+def _add(asn: int, status: int = 200) -> None:
+    asname, cn, isp, prefixes = ASNS[asn]
+    responses.add(
+        responses.GET,
+        f"{API}?query={asn}",
+        json={"asn": str(asn), "asname_short": asname, "geo": cn, "asname_long": isp},
+        status=status,
+    )
+    responses.add(responses.GET, f"{API}?prefix={asn}", json=prefixes, status=status)
+
+
+@pytest.fixture
+def client() -> shadowserver.Client:
+    return shadowserver.Client(rate_limiter=None, retry=None)
+
+
+@responses.activate
+def test_build_and_lookup(tmp_path: str, client: shadowserver.Client) -> None:
+
+    _add(15169)
+    _add(2818)
+    path = os.path.join(tmp_path, "asn.snapshot")
+
+    report = build_snapshot(path, [2818, 15169], client)
+    assert report.fetched == [2818, 15169]
+
+    with Snapshot(path) as snap:
+        assert snap.asns == [2818, 15169]
+        assert snap.prefixes(2818) == ["212.58.224.0/19", "8.8.8.128/25"]
+
+        assert snap.lookup("8.8.8.8") == shadowserver.ASNRecord(
+            "15169", "8.8.8.0/24", "GOOGLE", "US", "Google LLC", []
+        )
+        assert snap.lookup("8.8.8.200").asn == "2818"
+        assert snap.lookup("8.8.8.200").prefix == "8.8.8.128/25"
+        assert snap.lookup("8.8.9.1").prefix == "8.8.0.0/16"
+        assert snap.lookup("2001:4860:4860::8888").prefix == "2001:4860::/32"
+        assert snap.lookup("2001:4861::1") is None
+        assert snap.lookup("9.9.9.9") is None
+        assert snap.lookup("not an ip") is None
+
+        assert [r.asn for r in snap.origin(["212.58.245.94", "9.9.9.9", "8.8.4.4"])] == [
+            "2818",
+            "15169",
+        ]
+        assert list(snap.origin(["8.8.4.4"], as_dict=True)) == ["8.8.4.4"]
+
+
+@responses.activate
+def test_incremental_rebuild(tmp_path: str, client: shadowserver.Client) -> None:
+
+    _add(15169)
+    path = os.path.join(tmp_path, "asn.snapshot")
+    build_snapshot(path, [15169], client)
+    assert len(responses.calls) == 2
+
+    _add(2818)
+    report = build_snapshot(path, [15169, 2818], client)
+    assert report.reused == [15169]
+    assert report.fetched == [2818]
+    assert len(responses.calls) == 4
+
+    report = build_snapshot(path, [15169, 2818], client, refresh=[15169])
+    assert report.fetched == [15169]
+
+    with Snapshot(path) as snap:
+        assert snap.asns == [2818, 15169]
+
+
+@responses.activate
+def test_failed_asn_keeps_old_entry(tmp_path: str, client: shadowserver.Client) -> None:
+
+    _add(15169)
+    path = os.path.join(tmp_path, "asn.snapshot")
+    build_snapshot(path, [15169], client)
+
+    responses.reset()
+    _add(15169, status=500)
+    report = build_snapshot(path, [15169], client, max_age=0)
+
+    assert isinstance(report.failed[15169], RashlyOutlaid.libwhois.QueryError)
+    with Snapshot(path) as snap:
+        assert snap.lookup("8.8.8.8").asn == "15169"
+
+
+def test_not_a_snapshot(tmp_path: str) -> None:
+
+    path = os.path.join(tmp_path, "garbage")
+    with open(path, "wb") as fh:
+        fh.write(b"x" * 100)
+
+    with pytest.raises(SnapshotError):
+        Snapshot(path)
+
+
+@responses.activate
+def test_truncated_snapshot(tmp_path: str, client: shadowserver.Client) -> None:
+
+    _add(15169)
+    path = os.path.join(tmp_path, "asn.snapshot")
+    build_snapshot(path, [15169], client)
+    with open(path, "rb+") as fh:
+        fh.truncate(200)
+
+    with pytest.raises(SnapshotError, match="truncated"):
+        Snapshot(path)